@@ -49,6 +49,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise for static files
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.SlidingSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -135,4 +136,34 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Session Logic - Ensure history is not lost
 SESSION_COOKIE_AGE = 1209600  # 2 weeks in seconds
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
-SESSION_SAVE_EVERY_REQUEST = True 
+# Sessions are saved only when they change, so read endpoints (history, job
+# polling) never write session storage; core.middleware.SlidingSessionMiddleware
+# extends active sessions once they are within SESSION_REFRESH_WINDOW seconds of expiring
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_WINDOW = int(os.environ.get('SESSION_REFRESH_WINDOW', str(SESSION_COOKIE_AGE // 2)))
+
+# Session storage: "cache" (file-based cache shared by every worker on this host),
+# "signed_cookies" (no server-side storage; requires a private SECRET_KEY) or "db" (SQLite)
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cache')
+SESSION_ENGINES = {
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'db': 'django.contrib.sessions.backends.db',
+}
+if SESSION_BACKEND not in SESSION_ENGINES:
+    raise ValueError(f"SESSION_BACKEND must be one of {', '.join(SESSION_ENGINES)}, not '{SESSION_BACKEND}'")
+SESSION_ENGINE = SESSION_ENGINES[SESSION_BACKEND]
+SESSION_CACHE_ALIAS = 'sessions'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('SESSION_CACHE_DIR', str(BASE_DIR / '.sessions')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,  # Culling would log users out
+        },
+    },
+}
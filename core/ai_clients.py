@@ -0,0 +1,168 @@
+"""
+AI Client Registry for Opuluxe AI
+Keeps process-wide Gemini and OpenAI clients so HTTP connection pools
+(and their TLS sessions) are reused across requests
+"""
+
+import asyncio
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from google import genai
+
+_lock = threading.Lock()
+
+# provider -> (api_key, client); replaced only when the configured key changes
+_clients = {}
+
+# event loop -> (api_key, client) for the async Gemini surface. httpx async
+# connection pools are bound to the loop that opened them, so an ASGI worker
+# shares one client while per-request loops (async views under WSGI) get their own.
+_async_gemini_clients = weakref.WeakKeyDictionary()
+
+# (provider, model) -> call counters
+_stats = {}
+_clients_created = {}
+
+
+def _reset_after_fork():
+    """Drop inherited clients in a forked child; their sockets belong to the parent."""
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+    _async_gemini_clients.clear()
+    _stats.clear()
+    _clients_created.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_or_create(provider, api_key, factory):
+    cached = _clients.get(provider)
+    if cached is not None and cached[0] == api_key:
+        return cached[1]
+    with _lock:
+        cached = _clients.get(provider)
+        if cached is not None and cached[0] == api_key:
+            return cached[1]
+        if cached is not None:
+            print(f"[AI Clients] {provider} API key changed, creating a new client")
+        client = factory()
+        _clients[provider] = (api_key, client)
+        _clients_created[provider] = _clients_created.get(provider, 0) + 1
+        return client
+
+
+def get_gemini_client(api_key=None):
+    """
+    Get the shared Gemini client for synchronous calls.
+
+    Args:
+        api_key (str, optional): Defaults to the GEMINI_API_KEY env variable
+
+    Returns:
+        genai.Client: Shared client, or None if no key is configured
+    """
+    api_key = api_key or os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return None
+    return _get_or_create("gemini", api_key, lambda: genai.Client(api_key=api_key))
+
+
+def get_gemini_async_client(api_key=None):
+    """
+    Get the async Gemini surface (client.aio) for the running event loop.
+
+    Args:
+        api_key (str, optional): Defaults to the GEMINI_API_KEY env variable
+
+    Returns:
+        AsyncClient: client.aio of a client bound to this loop, or None if no key is configured
+    """
+    api_key = api_key or os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return None
+    loop = asyncio.get_running_loop()
+    cached = _async_gemini_clients.get(loop)
+    if cached is None or cached[0] != api_key:
+        cached = (api_key, genai.Client(api_key=api_key))
+        _async_gemini_clients[loop] = cached
+        with _lock:
+            _clients_created["gemini-async"] = _clients_created.get("gemini-async", 0) + 1
+    return cached[1].aio
+
+
+def get_openai_client(api_key=None):
+    """
+    Get the shared OpenAI client.
+
+    Args:
+        api_key (str, optional): Defaults to the OPENAI_API_KEY env variable
+
+    Returns:
+        OpenAI: Shared client, or None if no key is configured
+    """
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return None
+
+    def factory():
+        from openai import OpenAI  # Optional dependency, only needed for the OpenAI backend
+        return OpenAI(api_key=api_key)
+
+    return _get_or_create("openai", api_key, factory)
+
+
+@contextmanager
+def track_call(provider, model):
+    """
+    Record latency, errors and concurrency for one model call.
+
+    Usage:
+        with track_call("gemini", "gemini-2.5-flash"):
+            response = client.models.generate_content(...)
+    """
+    with _lock:
+        stats = _stats.setdefault((provider, model), {
+            "calls": 0, "errors": 0, "in_flight": 0, "peak_in_flight": 0,
+            "total_ms": 0.0, "max_ms": 0.0,
+        })
+        stats["in_flight"] += 1
+        stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        with _lock:
+            stats["errors"] += 1
+        raise
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with _lock:
+            stats["in_flight"] -= 1
+            stats["calls"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+
+def get_client_stats():
+    """
+    Snapshot of client and per-model call counters for this worker process.
+
+    Returns:
+        dict: {"clients_created": {...}, "models": {"provider/model": {...}}}
+    """
+    with _lock:
+        models = {}
+        for (provider, model), stats in _stats.items():
+            entry = dict(stats)
+            entry["avg_ms"] = round(stats["total_ms"] / stats["calls"], 1) if stats["calls"] else 0.0
+            entry["total_ms"] = round(stats["total_ms"], 1)
+            entry["max_ms"] = round(stats["max_ms"], 1)
+            models[f"{provider}/{model}"] = entry
+        return {"clients_created": dict(_clients_created), "models": models}
@@ -1,6 +1,26 @@
+import os
+import sys
+import threading
+
 from django.apps import AppConfig
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Bootstrap MongoDB indexes when serving; the ensure_indexes command covers everything else
+        if os.getenv('MONGODB_ENSURE_INDEXES', 'True') != 'True':
+            return
+        if 'manage.py' in sys.argv[0] and 'runserver' not in sys.argv:
+            return
+
+        def bootstrap():
+            from .mongodb import ensure_indexes
+            for collection, name, error in ensure_indexes():
+                if error:
+                    print(f"WARNING: Could not create index {collection}.{name}: {error}")
+
+        # create_index is idempotent; run it off the startup path so a slow Atlas connection doesn't delay boot
+        threading.Thread(target=bootstrap, name='opuluxe-ensure-indexes', daemon=True).start()
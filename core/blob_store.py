@@ -0,0 +1,122 @@
+"""
+Content-addressed image store for Opuluxe AI
+Keeps chat images in GridFS, deduplicated by SHA-256, so chat_sessions
+documents only carry a small reference instead of a base64 data URL
+"""
+
+import base64
+import binascii
+import hashlib
+import re
+
+import gridfs
+from django.urls import reverse
+from gridfs.errors import FileExists
+
+from .mongodb import get_db
+
+IMAGE_BUCKET = "chat_images"
+
+_DATA_URL_RE = re.compile(r"^data:(?P<mime>[\w.+-]+/[\w.+-]+)?(?:;[^,]*)?,", re.IGNORECASE)
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _get_fs(db):
+    return gridfs.GridFS(db, collection=IMAGE_BUCKET)
+
+
+def decode_data_url(data_url):
+    """
+    Split a base64 data URL (or bare base64 string) into bytes and MIME type.
+
+    Returns:
+        tuple: (bytes, content_type), or (None, None) if it cannot be decoded
+    """
+    content_type = "image/png"
+    payload = data_url
+    match = _DATA_URL_RE.match(data_url)
+    if match:
+        content_type = match.group("mime") or content_type
+        payload = data_url[match.end():]
+    try:
+        return base64.b64decode(payload), content_type
+    except (binascii.Error, ValueError):
+        return None, None
+
+
+def is_valid_image_id(image_id):
+    return bool(image_id and _DIGEST_RE.match(image_id))
+
+
+def save_image(data, content_type, owner_email, db=None):
+    """
+    Store image bytes under their SHA-256 digest and record the owner.
+
+    Identical uploads are stored once; later uploads only add the owner.
+
+    Returns:
+        str: Hex digest used as the image id, or None if the database is unavailable
+    """
+    db = db if db is not None else get_db()
+    if db is None:
+        return None
+
+    image_id = hashlib.sha256(data).hexdigest()
+    fs = _get_fs(db)
+    if not fs.exists(image_id):
+        try:
+            fs.put(data, _id=image_id, content_type=content_type,
+                   metadata={"owners": [owner_email]})
+            return image_id
+        except FileExists:
+            pass  # Stored concurrently by another request
+
+    db[f"{IMAGE_BUCKET}.files"].update_one(
+        {"_id": image_id}, {"$addToSet": {"metadata.owners": owner_email}}
+    )
+    return image_id
+
+
+def save_image_data_url(data_url, owner_email, db=None):
+    """
+    Store a base64 data URL and return its image id (or None if invalid).
+    """
+    data, content_type = decode_data_url(data_url)
+    if not data:
+        return None
+    return save_image(data, content_type, owner_email, db=db)
+
+
+def add_owner(image_id, owner_email, db=None):
+    """
+    Let another user read an existing image.
+
+    Returns:
+        bool: False if the image does not exist
+    """
+    db = db if db is not None else get_db()
+    if db is None or not is_valid_image_id(image_id):
+        return False
+    result = db[f"{IMAGE_BUCKET}.files"].update_one(
+        {"_id": image_id}, {"$addToSet": {"metadata.owners": owner_email}}
+    )
+    return result.matched_count > 0
+
+
+def open_image(image_id, owner_email, db=None):
+    """
+    Open a stored image for reading if it belongs to owner_email.
+
+    Returns:
+        GridOut: Seekable file with .length and .content_type, or None
+    """
+    if not is_valid_image_id(image_id):
+        return None
+    db = db if db is not None else get_db()
+    if db is None:
+        return None
+    return _get_fs(db).find_one({"_id": image_id, "metadata.owners": owner_email})
+
+
+def image_url(image_id):
+    return reverse("api_chat_image", args=[image_id])
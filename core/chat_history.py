@@ -0,0 +1,125 @@
+"""
+Server-side conversation history for Opuluxe AI
+Builds chat context from the stored chat_sessions document instead of a
+client-uploaded transcript, fronted by a per-process LRU of recent turns
+"""
+
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from .mongodb import get_db
+
+# Number of most recent messages loaded as candidate history (the context builder trims to budget)
+HISTORY_MESSAGES = int(os.getenv("CHAT_HISTORY_MESSAGES", "20"))
+# Number of sessions whose recent messages are kept in memory per worker
+HISTORY_CACHE_SESSIONS = int(os.getenv("CHAT_HISTORY_CACHE_SESSIONS", "1024"))
+
+
+class RecentMessagesCache:
+    """
+    Thread-safe LRU of the last few messages per chat session.
+
+    Each entry is tagged with the session's total message count when it was
+    cached, which is compared against MongoDB to detect turns appended by
+    other worker processes.
+    """
+
+    def __init__(self, max_sessions=HISTORY_CACHE_SESSIONS, max_messages=HISTORY_MESSAGES):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (total, messages) for a session, or None if not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], list(entry[1])
+
+    def put(self, key, total, messages):
+        with self._lock:
+            self._put(key, total, messages)
+
+    def append(self, key, messages, create=False):
+        """Add newly saved messages to a cached session (or start one if create)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and not create:
+                return
+            total, cached = entry if entry is not None else (0, [])
+            self._put(key, total + len(messages), cached + messages)
+
+    def _put(self, key, total, messages):
+        self._entries[key] = (total, list(messages[-self.max_messages:]))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+_cache = RecentMessagesCache()
+
+# messages: recent messages oldest first; total: messages in the whole session;
+# summary: cached {'text', 'covers'} summary of older turns, or None
+HistoryWindow = namedtuple('HistoryWindow', ['messages', 'total', 'summary'])
+
+
+def _to_history(message):
+    return {'role': message.get('role'), 'text': message.get('text') or ''}
+
+
+def get_recent_messages(user_email, session_id, db=None):
+    """
+    Get the most recent messages of a stored chat session.
+
+    Costs one $size lookup when the cached copy is current, and an extra
+    $slice read of the last HISTORY_MESSAGES messages otherwise.
+
+    Args:
+        user_email (str): Session owner
+        session_id (str): Chat session id
+
+    Returns:
+        HistoryWindow: messages as [{'role': ..., 'text': ...}] oldest first
+    """
+    key = (user_email, session_id)
+    cached = _cache.get(key)
+    db = db if db is not None else get_db()
+    if db is None:
+        return HistoryWindow(cached[1], cached[0], None) if cached else HistoryWindow([], 0, None)
+
+    match = {'user_email': user_email, 'session_id': session_id}
+    counts = next(db['chat_sessions'].aggregate([
+        {'$match': match},
+        {'$project': {'_id': 0, 'total': {'$size': {'$ifNull': ['$messages', []]}},
+                      'summary': '$context_summary'}},
+    ]), None)
+    if counts is None:
+        # Brand-new session whose first write may still be queued
+        return HistoryWindow(cached[1], cached[0], None) if cached else HistoryWindow([], 0, None)
+
+    summary = counts.get('summary')
+    # A cached total ahead of MongoDB means this worker's own write is still pending
+    if cached and cached[0] >= counts['total']:
+        return HistoryWindow(cached[1], cached[0], summary)
+
+    page = db['chat_sessions'].find_one(match, {'_id': 0, 'messages': {'$slice': -HISTORY_MESSAGES}})
+    messages = [_to_history(m) for m in (page or {}).get('messages', [])]
+    _cache.put(key, counts['total'], messages)
+    return HistoryWindow(messages, counts['total'], summary)
+
+
+def record_turn(user_email, session_id, messages, is_new_session=False):
+    """Add a just-completed exchange to the cache before its MongoDB write lands."""
+    _cache.append((user_email, session_id), [_to_history(m) for m in messages], create=is_new_session)
+
+
+def forget_session(user_email, session_id):
+    _cache.discard((user_email, session_id))
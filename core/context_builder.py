@@ -0,0 +1,205 @@
+"""
+Token-budgeted context builder for Opuluxe AI chat requests
+Fits the system prompt, MCP context, a summary of older turns and as much
+recent history as possible into a fixed prompt-token budget
+"""
+
+import math
+import os
+import threading
+from collections import namedtuple
+
+from .ai_clients import get_gemini_client, track_call
+from .mongodb import get_db
+
+# Total prompt budget per chat request (system prompt + summary + history + MCP + message)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKENS", "8000"))
+# Upper bound for the MCP block within that budget
+MCP_CONTEXT_TOKENS = int(os.getenv("CHAT_MCP_CONTEXT_TOKENS", "1500"))
+# Output length of a conversation summary
+SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "400"))
+# A refresh summarizes up to this many messages past the oldest one in the
+# window (at most half the window), so refreshes run about this often
+SUMMARY_MIN_NEW_MESSAGES = int(os.getenv("CHAT_SUMMARY_MIN_NEW_MESSAGES", "6"))
+
+SUMMARY_MODEL = 'gemini-2.5-flash'
+
+# Approximate Gemini cost of one inline image
+IMAGE_TOKENS = 258
+# Role/formatting overhead per message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+BuiltContext = namedtuple('BuiltContext', [
+    'history',        # messages to send, oldest first
+    'summary',        # summary text to prepend, or None
+    'mcp_context',    # MCP block, trimmed to its share
+    'first_index',    # session index of the oldest message sent
+    'tokens',         # estimated prompt tokens
+])
+
+
+def estimate_tokens(text):
+    """
+    Cheap local token estimate (~4 characters per token for Gemini models).
+
+    Used for budgeting only; it avoids a count_tokens round-trip per request.
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / 4)
+
+
+def _truncate_to_tokens(text, max_tokens):
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    return text[:max_tokens * 4].rstrip() + " …"
+
+
+def build_context(system_prompt, history, total_messages, user_text, mcp_context="",
+                  summary=None, has_image=False, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Pack chat context into the token budget.
+
+    The system prompt and the new message always go in. The MCP block is
+    trimmed to MCP_CONTEXT_TOKENS, then the cached summary of older turns and
+    as many recent messages as fit, newest first, keeping them contiguous.
+    Messages the summary already covers are never repeated verbatim.
+
+    Args:
+        system_prompt (str): System instruction sent with the request
+        history (list): Recent stored messages, oldest first
+        total_messages (int): Number of messages in the whole session
+        user_text (str): The new user message
+        mcp_context (str): MCP data block for this turn
+        summary (dict, optional): Cached {'text', 'covers'} summary of the session
+        has_image (bool): Whether the new message carries an image
+        budget (int): Prompt-token budget
+
+    Returns:
+        BuiltContext
+    """
+    used = estimate_tokens(system_prompt) + estimate_tokens(user_text) + MESSAGE_OVERHEAD_TOKENS
+    if has_image:
+        used += IMAGE_TOKENS
+
+    mcp_context = _truncate_to_tokens(mcp_context, min(MCP_CONTEXT_TOKENS, budget - used))
+    used += estimate_tokens(mcp_context)
+
+    summary_text = summary.get('text') if summary else None
+    if summary_text:
+        summary_cost = estimate_tokens(summary_text) + MESSAGE_OVERHEAD_TOKENS
+        if used + summary_cost <= budget:
+            used += summary_cost
+        else:
+            summary_text = None
+
+    if summary_text:
+        # The window starts where the summary ends
+        first_stored = total_messages - len(history)
+        history = history[max(0, summary.get('covers', 0) - first_stored):]
+
+    kept = []
+    for message in reversed(history):
+        cost = estimate_tokens(message.get('text')) + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+
+    first_index = total_messages - len(kept)
+    return BuiltContext(kept, summary_text, mcp_context, first_index, used)
+
+
+def needs_summary(built, summary):
+    """True when messages have fallen out of the window that the summary does not cover yet."""
+    covered = summary.get('covers', 0) if summary else 0
+    return built.first_index > covered
+
+
+def summary_target(built):
+    """
+    Session index a summary refresh should cover up to.
+
+    Runs past the oldest message in the window, so the window can move on
+    for a few turns before the next refresh, but never takes more than half
+    of the messages being sent.
+    """
+    return built.first_index + min(SUMMARY_MIN_NEW_MESSAGES, len(built.history) // 2)
+
+
+_summarizing = set()
+_summarizing_lock = threading.Lock()
+
+
+def refresh_summary(user_email, session_id, upto):
+    """
+    Summarize messages [0, upto) of a session and cache it on the session document.
+
+    Builds on the previously cached summary, so each message is only
+    summarized once. Runs off the request path; concurrent refreshes of the
+    same session are collapsed.
+    """
+    key = (user_email, session_id)
+    with _summarizing_lock:
+        if key in _summarizing:
+            return
+        _summarizing.add(key)
+    try:
+        db = get_db()
+        client = get_gemini_client()
+        if db is None or client is None:
+            return
+
+        match = {'user_email': user_email, 'session_id': session_id}
+        session = db['chat_sessions'].find_one(match, {'_id': 0, 'context_summary': 1})
+        if session is None:
+            return
+        previous = session.get('context_summary') or {}
+        covered = previous.get('covers', 0)
+        if upto <= covered:
+            return
+
+        page = db['chat_sessions'].find_one(match, {'_id': 0, 'messages': {'$slice': [covered, upto - covered]}})
+        new_messages = (page or {}).get('messages', [])
+        if not new_messages:
+            return
+        # The slice is short if the latest turns have not been saved yet
+        upto = covered + len(new_messages)
+
+        transcript = "\n".join(
+            f"{'User' if m.get('role') == 'user' else 'Consultant'}: {m.get('text') or ''}"
+            for m in new_messages
+        )
+        prompt = (
+            "Summarize this fashion consultation for use as context in later turns. "
+            "Keep the user's measurements, body type, preferences, budget, brands, platforms, "
+            "occasions and any products already recommended. Be concise and factual.\n\n"
+        )
+        if previous.get('text'):
+            prompt += f"EARLIER SUMMARY:\n{previous['text']}\n\n"
+        prompt += f"NEW TURNS:\n{transcript}"
+
+        with track_call("gemini", SUMMARY_MODEL):
+            response = client.models.generate_content(
+                model=SUMMARY_MODEL,
+                contents=prompt,
+                config={'temperature': 0.2, 'max_output_tokens': SUMMARY_TOKENS}
+            )
+        text = (response.text or "").strip()
+        if not text:
+            return
+
+        # Never overwrite a summary that already covers more of the session
+        db['chat_sessions'].update_one(
+            {**match, '$or': [{'context_summary.covers': {'$lt': upto}}, {'context_summary': {'$exists': False}}]},
+            {'$set': {'context_summary': {'text': text, 'covers': upto}}}
+        )
+        print(f"[Context] Summarized {len(new_messages)} older messages of session {session_id}")
+    except Exception as e:
+        print(f"[Context] Summary refresh failed: {e}")
+    finally:
+        with _summarizing_lock:
+            _summarizing.discard(key)
@@ -0,0 +1,177 @@
+"""
+Intent router for Opuluxe AI chat
+Classifies a message against a keyword table in a single pass over its
+words and plans every MCP tool call it needs
+"""
+
+import json
+import os
+import re
+from collections import namedtuple
+
+# Optional JSON file with the same shape as DEFAULT_KEYWORDS; its groups
+# replace the matching default groups
+INTENT_KEYWORDS_PATH = os.getenv("INTENT_KEYWORDS_PATH", "")
+
+# group -> label -> keywords. "intents" select tools; the other groups fill
+# in tool arguments, and occasions/seasons also imply their intent.
+# Everyday words that only mean fashion in context ("will this work?",
+# "I fall for it", "hot coffee") are listed as phrases, never on their own.
+DEFAULT_KEYWORDS = {
+    "intents": {
+        "trends": ["trend", "trends", "trending", "trendy", "popular", "latest", "what's hot",
+                   "hot right now", "in style", "in fashion", "what's in", "fashionable"],
+        "style_tips": ["occasion", "occasions", "an event", "the event", "formal event", "what to wear",
+                       "dress code", "style tip", "style tips", "styling tips"],
+        "seasonal": ["season", "seasons", "seasonal", "this season", "next season"],
+    },
+    "categories": {
+        "men": ["men", "men's", "mens", "man", "male", "guy", "guys", "gents", "menswear"],
+        "women": ["women", "women's", "womens", "woman", "female", "ladies", "lady", "girls", "womenswear"],
+        "accessories": ["accessories", "accessory", "bag", "bags", "jewelry", "jewellery", "watch",
+                        "watches", "sunglasses", "belt", "belts", "scarf", "scarves"],
+    },
+    "occasions": {
+        "office": ["office", "for work", "to work", "at work", "work wear", "workwear", "work outfit",
+                   "work outfits", "workplace", "meeting", "interview"],
+        "formal": ["formal", "business casual", "business formal", "business attire", "black tie", "gala"],
+        "party": ["party", "parties", "club", "clubbing", "night out", "cocktail"],
+        "wedding": ["wedding", "weddings", "reception", "sangeet", "engagement"],
+        "casual": ["casual", "weekend", "everyday", "brunch"],
+    },
+    "seasons": {
+        "spring": ["spring"],
+        "summer": ["summer", "summery"],
+        "autumn": ["autumn", "this fall", "for fall", "in fall", "fall season", "fall fashion",
+                   "fall outfit", "fall outfits", "fall wardrobe"],
+        "winter": ["winter", "wintry", "cold weather"],
+    },
+    "regions": {
+        "india": ["india", "indian", "desi"],
+        "europe": ["europe", "european", "paris", "milan", "london"],
+        "east_asia": ["korean", "k-fashion", "japanese", "east asian", "tokyo", "seoul"],
+    },
+}
+
+# Groups whose matches imply an intent even without an intent keyword
+_IMPLIED_INTENTS = {"occasions": "style_tips", "seasons": "seasonal"}
+
+Classification = namedtuple('Classification', [
+    'intents',     # set of intent labels
+    'categories',  # labels in order of first mention
+    'occasions',
+    'seasons',
+    'regions',
+])
+
+ToolCall = namedtuple('ToolCall', ['tool', 'arguments'])
+
+# Words, keeping inner apostrophes and hyphens ("men's", "k-fashion")
+_TOKEN_RE = re.compile(r"\w+(?:['’-]\w+)*")
+
+
+def _load_keywords(path):
+    table = {group: dict(labels) for group, labels in DEFAULT_KEYWORDS.items()}
+    if path:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                table.update(json.load(f))
+            print(f"[Intent Router] Loaded keyword table from {path}")
+        except (OSError, ValueError) as e:
+            print(f"[Intent Router] Could not load {path}, using defaults: {e}")
+    return table
+
+
+class IntentRouter:
+    """
+    Multi-intent classifier over a keyword table.
+
+    Keywords are matched on whole words only ("women" never matches "men").
+    The message is tokenized with one precompiled regex. Each word that
+    starts a keyword is then looked up in a phrase dictionary, longest phrase
+    first. One pass finds every intent, category, occasion, season and
+    region, and most words cost a single dict probe.
+
+    Args:
+        keywords (dict): group -> label -> list of keywords (DEFAULT_KEYWORDS shape)
+    """
+
+    def __init__(self, keywords=None):
+        self.keywords = keywords if keywords is not None else _load_keywords(INTENT_KEYWORDS_PATH)
+        # phrase (tuple of words) -> [(group, label)]
+        self._labels = {}
+        for group, labels in self.keywords.items():
+            for label, words in labels.items():
+                for word in words:
+                    phrase = tuple(_TOKEN_RE.findall(word.lower()))
+                    if phrase:
+                        self._labels.setdefault(phrase, []).append((group, label))
+        # first word -> longest phrase starting with it
+        self._starts = {}
+        for phrase in self._labels:
+            self._starts[phrase[0]] = max(self._starts.get(phrase[0], 0), len(phrase))
+
+    def classify(self, text):
+        """
+        Find every intent and argument mentioned in text.
+
+        Returns:
+            Classification
+        """
+        found = {group: [] for group in ("intents", "categories", "occasions", "seasons", "regions")}
+        words = _TOKEN_RE.findall((text or "").lower().replace("’", "'"))
+        starts, lookup = self._starts, self._labels.get
+        end = 0
+        for i in [i for i, word in enumerate(words) if word in starts]:
+            if i < end:
+                continue  # Inside a phrase that already matched
+            for n in range(min(starts[words[i]], len(words) - i), 0, -1):
+                matches = lookup(tuple(words[i:i + n]))
+                if matches:
+                    for group, label in matches:
+                        labels = found.setdefault(group, [])
+                        if label not in labels:
+                            labels.append(label)
+                    end = i + n
+                    break
+
+        intents = set(found["intents"])
+        for group, intent in _IMPLIED_INTENTS.items():
+            if found[group]:
+                intents.add(intent)
+        return Classification(intents, found["categories"], found["occasions"], found["seasons"], found["regions"])
+
+    def plan(self, text):
+        """
+        MCP tool calls that answer text, in a stable order.
+
+        Returns:
+            list: ToolCall(tool, arguments)
+        """
+        c = self.classify(text)
+        calls = []
+        region = c.regions[0] if c.regions else None
+
+        if "trends" in c.intents:
+            for category in c.categories or ["all"]:
+                arguments = {"category": category}
+                if region:
+                    arguments["region"] = region
+                calls.append(ToolCall("get_fashion_trends", arguments))
+
+        if "style_tips" in c.intents:
+            for occasion in c.occasions or ["casual"]:
+                calls.append(ToolCall("get_style_tips", {"occasion": occasion}))
+
+        if "seasonal" in c.intents:
+            for category in c.categories or list(self.keywords.get("categories", {})):
+                for season in c.seasons or [None]:
+                    arguments = {"category": category}
+                    if season:
+                        arguments["season"] = season
+                    calls.append(ToolCall("get_seasonal_recommendations", arguments))
+
+        return calls
+
+
+intent_router = IntentRouter()
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.intent_router import IntentRouter
+
+SAMPLE_MESSAGES = [
+    "What's trending in women's fashion right now?",
+    "Show me the latest men's streetwear",
+    "What should I wear to an office party this winter?",
+    "Any style tips for a wedding reception?",
+    "Popular accessories for summer in India",
+    "Is a linen shirt a good idea for a beach brunch?",
+    "What are the hot trends for guys and ladies this fall?",
+    "Help me pick an outfit for a job interview",
+    "Suggest a formal look for a black tie gala in Milan",
+    "I need casual weekend outfits under 3000",
+    "What shoes go with a navy suit?",
+    "Korean fashion trends for women this spring",
+]
+
+
+def _legacy_scan(text):
+    """The substring scan chat MCP lookups used before the intent router, for comparison"""
+    lower = text.lower()
+    if any(keyword in lower for keyword in ['trend', 'trending', 'popular', 'latest', 'current', 'hot']):
+        if "men" in lower or "male" in lower:
+            return "men"
+        if "women" in lower or "female" in lower or "ladies" in lower:
+            return "women"
+        return "all"
+    if any(keyword in lower for keyword in ['occasion', 'event', 'party', 'wedding', 'office', 'casual', 'formal']):
+        return "casual"
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark intent classification throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000,
+                            help='Messages classified per measurement (default 20000)')
+        parser.add_argument('--show', action='store_true',
+                            help='Print the plan for each sample message')
+
+    def _measure(self, label, func, iterations):
+        messages = SAMPLE_MESSAGES
+        count = len(messages)
+        started = time.perf_counter()
+        for i in range(iterations):
+            func(messages[i % count])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'  {label:<24} {iterations / elapsed:>12,.0f} msg/s  {elapsed / iterations * 1e6:>8.2f} us/msg'
+        )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+
+        started = time.perf_counter()
+        router = IntentRouter()
+        compile_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(f'Compiled {len(router._labels)} keywords in {compile_ms:.2f} ms')
+
+        if options['show']:
+            for message in SAMPLE_MESSAGES:
+                calls = ', '.join(f'{c.tool}({c.arguments})' for c in router.plan(message)) or '-'
+                self.stdout.write(f'  {message}\n    -> {calls}')
+
+        self.stdout.write(f'Classifying {iterations} messages ({len(SAMPLE_MESSAGES)} samples)...')
+        self._measure('IntentRouter.classify', router.classify, iterations)
+        self._measure('IntentRouter.plan', router.plan, iterations)
+        self._measure('legacy substring scan', _legacy_scan, iterations)
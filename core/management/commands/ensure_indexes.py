@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.mongodb import get_db, ensure_indexes, explain_query_shapes
+
+class Command(BaseCommand):
+    help = 'Create MongoDB indexes for all collections and verify no view query falls back to a COLLSCAN'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check-plans',
+            action='store_true',
+            help='Run explain() on every query shape in core.mongodb.QUERY_SHAPES and fail on COLLSCAN',
+        )
+
+    def handle(self, *args, **options):
+        db = get_db()
+        if db is None:
+            raise CommandError('Database connection failed')
+
+        self.stdout.write('Ensuring MongoDB indexes...')
+        failed = False
+        for collection, name, error in ensure_indexes(db):
+            if error:
+                failed = True
+                self.stdout.write(self.style.ERROR(f'  {collection}.{name}: {error}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'  {collection}.{name}'))
+
+        if options['check_plans']:
+            self.stdout.write('Checking query plans...')
+            for name, collection, stages in explain_query_shapes(db):
+                plan = ' <- '.join(stages)
+                if 'COLLSCAN' in stages:
+                    failed = True
+                    self.stdout.write(self.style.ERROR(f'  {name} ({collection}): {plan}'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'  {name} ({collection}): {plan}'))
+
+        if failed:
+            raise CommandError('Index bootstrap or query plan check failed')
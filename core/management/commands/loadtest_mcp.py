@@ -0,0 +1,159 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.mcp_integration import MCP_SERVER_URL
+
+# Tool mix each simulated worker cycles through
+CALL_MIX = [
+    ("get_fashion_trends", {"category": "women"}),
+    ("get_fashion_trends", {"category": "men", "region": "india"}),
+    ("get_style_tips", {"occasion": "office"}),
+    ("get_seasonal_recommendations", {"category": "men", "season": "winter"}),
+    ("get_fashion_trends", {"category": "all"}),
+    ("get_style_tips", {"occasion": "wedding"}),
+]
+
+
+async def _drive(transport, url, clients, duration, first_client, revalidate):
+    from core.mcp_integration import OpuluxeMCPClient
+
+    # One client per simulated Django worker, with the result cache off so
+    # every call reaches the server. Without revalidation every call returns
+    # the full payload; with it, most return an empty not_modified reply.
+    workers = [OpuluxeMCPClient(transport, url, cache=False, revalidate=revalidate) for _ in range(clients)]
+    await asyncio.gather(*(client._call_tool(*CALL_MIX[0]) for client in workers))
+
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+
+    async def run(index, client):
+        n = first_client + index
+        while time.perf_counter() < deadline:
+            tool, arguments = CALL_MIX[n % len(CALL_MIX)]
+            n += 1
+            started = time.perf_counter()
+            try:
+                result = await client._call_tool(tool, arguments)
+                if result.isError:
+                    raise RuntimeError(result.content[0].text if result.content else "error result")
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(i, client) for i, client in enumerate(workers)))
+    elapsed = time.perf_counter() - started
+    not_modified = sum(client.stats["not_modified"] for client in workers)
+    await asyncio.gather(*(client.aclose() for client in workers), return_exceptions=True)
+    return latencies, errors, elapsed, not_modified
+
+
+def _run_clients(transport, url, clients, duration, first_client, revalidate):
+    return asyncio.run(_drive(transport, url, clients, duration, first_client, revalidate))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+class Command(BaseCommand):
+    help = 'Load test the fashion trends MCP server: tool calls per second across N concurrent clients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transport', choices=['http', 'inprocess', 'stdio'], default='http')
+        parser.add_argument('--url', default=MCP_SERVER_URL, help='Streamable HTTP endpoint')
+        parser.add_argument('--clients', type=int, default=8,
+                            help='Concurrent clients, each with its own session pool (default 8)')
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Client processes to spread the clients over, like Django workers (default 1)')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run (default 10)')
+        parser.add_argument('--revalidate', choices=['off', 'on', 'both'], default='off',
+                            help='ETag revalidation: off measures full payloads (default), on measures '
+                                 'mostly not_modified replies, both runs and reports each in turn')
+        parser.add_argument('--spawn-server', action='store_true',
+                            help='Start a local HTTP trends server for the test and stop it afterwards')
+        parser.add_argument('--server-workers', type=int, default=1,
+                            help='uvicorn workers for --spawn-server (default 1)')
+
+    def handle(self, *args, **options):
+        transport, url = options['transport'], options['url']
+        clients, processes = max(1, options['clients']), max(1, options['processes'])
+        processes = min(processes, clients)
+
+        server = None
+        if options['spawn_server']:
+            if transport != 'http':
+                raise CommandError('--spawn-server requires --transport http')
+            server, url = self._spawn_server(options['server_workers'])
+
+        modes = {'off': [False], 'on': [True], 'both': [False, True]}[options['revalidate']]
+        try:
+            for revalidate in modes:
+                self._run(transport, url, clients, processes, options['duration'], revalidate)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+    def _run(self, transport, url, clients, processes, duration, revalidate):
+        self.stdout.write(
+            f'{clients} client(s) in {processes} process(es) over {transport}'
+            + (f' ({url})' if transport == 'http' else '')
+            + f', revalidation {"on" if revalidate else "off"}, for {duration:.0f}s...'
+        )
+        shares = [clients // processes + (1 if i < clients % processes else 0) for i in range(processes)]
+        firsts = [sum(shares[:i]) for i in range(processes)]
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(_run_clients, transport, url, share, duration, first, revalidate)
+                       for share, first in zip(shares, firsts)]
+            results = [future.result() for future in futures]
+
+        latencies = sorted(latency for result in results for latency in result[0])
+        errors = [error for result in results for error in result[1]]
+        elapsed = max(result[2] for result in results)
+        not_modified = sum(result[3] for result in results)
+
+        self.stdout.write(f'  calls          {len(latencies)} ok, {len(errors)} failed '
+                          f'({not_modified} answered not_modified)')
+        self.stdout.write(self.style.SUCCESS(f'  throughput     {len(latencies) / elapsed:,.0f} calls/s'))
+        self.stdout.write(
+            f'  latency        p50 {_percentile(latencies, 0.5) * 1000:.2f} ms  '
+            f'p95 {_percentile(latencies, 0.95) * 1000:.2f} ms  p99 {_percentile(latencies, 0.99) * 1000:.2f} ms'
+        )
+        for error in sorted(set(errors))[:5]:
+            self.stdout.write(self.style.ERROR(f'  error: {error}'))
+
+    def _spawn_server(self, workers):
+        port = _free_port()
+        script = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))), 'mcp_servers', 'fashion_trends_server.py')
+        server = subprocess.Popen(
+            [sys.executable, script, '--transport', 'http', '--port', str(port), '--workers', str(workers)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('Trends server exited during start-up')
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                    self.stdout.write(f'Started trends server on port {port} ({workers} worker(s))')
+                    return server, f'http://127.0.0.1:{port}/mcp/'
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('Trends server did not start within 20s')
@@ -0,0 +1,133 @@
+"""
+MCP context gathering for Opuluxe AI chat
+Runs every MCP tool call a message needs concurrently, under a per-call
+deadline and a total budget, and merges whatever returns in time
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+
+from .intent_router import intent_router
+
+# Seconds one tool call may take before it is dropped from the turn
+MCP_CONTEXT_CALL_TIMEOUT = float(os.getenv("MCP_CONTEXT_CALL_TIMEOUT", "1.5"))
+# Seconds the whole context stage may add to a chat turn
+MCP_CONTEXT_BUDGET = float(os.getenv("MCP_CONTEXT_BUDGET", "2.5"))
+
+_stats_lock = threading.Lock()
+stats = {"turns": 0, "calls": 0, "succeeded": 0, "failed": 0, "timed_out": 0, "over_budget": 0,
+         "total_ms": 0.0}
+
+
+def _count(**increments):
+    with _stats_lock:
+        for stat, value in increments.items():
+            stats[stat] += value
+
+
+def format_result(call, result):
+    """Prompt block for one MCP tool result, or "" if the call failed"""
+    if call.tool == "get_fashion_trends":
+        if "error" in result:
+            return ""
+        return f"\\n\\n[REAL-TIME TREND DATA via MCP]: {json.dumps(result, separators=(',', ':'))}\\n"
+    if result.startswith("Error:"):
+        return ""
+    if call.tool == "get_style_tips":
+        return f"\\n\\n[STYLE TIP via MCP]: {result}\\n"
+    return f"\\n\\n[SEASONAL RECOMMENDATIONS via MCP]: {result}\\n"
+
+
+async def _fan_out(client, calls, call_timeout, budget):
+    """
+    Run calls concurrently on the current loop.
+
+    Returns:
+        list: Prompt block per call, "" for calls that failed or missed a deadline
+    """
+    async def run(call):
+        return await asyncio.wait_for(client.call(call.tool, call.arguments), call_timeout)
+
+    tasks = [asyncio.ensure_future(run(call)) for call in calls]
+    done, pending = await asyncio.wait(tasks, timeout=budget)
+    for task in pending:
+        task.cancel()
+    if pending:
+        _count(over_budget=1)
+
+    blocks = []
+    for call, task in zip(calls, tasks):
+        if task not in done:
+            print(f"[MCP] {call.tool}({call.arguments}) missed the {budget}s context budget")
+            _count(timed_out=1)
+            blocks.append("")
+            continue
+        try:
+            block = format_result(call, task.result())
+        except asyncio.TimeoutError:
+            print(f"[MCP] {call.tool}({call.arguments}) timed out after {call_timeout}s")
+            _count(timed_out=1)
+            blocks.append("")
+            continue
+        except Exception as e:
+            print(f"[MCP] {call.tool}({call.arguments}) failed: {e}")
+            block = ""
+        if block:
+            _count(succeeded=1)
+        else:
+            _count(failed=1)
+        blocks.append(block)
+    return blocks
+
+
+async def gather_mcp_context(user_text, call_timeout=MCP_CONTEXT_CALL_TIMEOUT, budget=MCP_CONTEXT_BUDGET):
+    """
+    MCP data for a chat message, within the context budget.
+
+    Every tool call the intent router plans for the message is started at
+    once on the MCP background loop. Calls that fail or miss their deadline
+    are dropped; the rest are merged in plan order.
+
+    Args:
+        user_text (str): The user's message
+        call_timeout (float): Deadline per tool call, in seconds
+        budget (float): Deadline for the whole stage, in seconds
+
+    Returns:
+        str: MCP context block to append to the prompt ("" if none)
+    """
+    from .mcp_integration import background_loop, mcp_client
+
+    calls = intent_router.plan(user_text)
+    if not calls:
+        return ""
+
+    started = time.perf_counter()
+    print(f"[MCP] Fetching {', '.join(f'{c.tool}({c.arguments})' for c in calls)}...")
+    try:
+        # The budget is enforced on the background loop, so results that made
+        # it in time survive; the outer timeout only guards a stalled loop
+        blocks = await background_loop.run_async(
+            _fan_out(mcp_client, calls, min(call_timeout, budget), budget), timeout=budget + 1
+        )
+    except TimeoutError as e:
+        print(f"[MCP] Context stage abandoned: {e}")
+        blocks = []
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _count(turns=1, calls=len(calls), total_ms=elapsed_ms)
+
+    merged = "".join(blocks)
+    print(f"[MCP] ✓ {sum(1 for b in blocks if b)}/{len(calls)} MCP results in {elapsed_ms:.0f} ms")
+    return merged
+
+
+def get_stats():
+    with _stats_lock:
+        result = dict(stats)
+    total_ms = result.pop("total_ms")
+    result["avg_ms"] = round(total_ms / result["turns"], 1) if result["turns"] else 0.0
+    result.update(call_timeout_s=MCP_CONTEXT_CALL_TIMEOUT, budget_s=MCP_CONTEXT_BUDGET)
+    return result
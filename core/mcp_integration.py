@@ -4,55 +4,589 @@ Connects Django backend with Model Context Protocol servers
 """
 
 import asyncio
+import concurrent.futures
 import json
+from contextlib import asynccontextmanager
+import anyio
+import httpx
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamable_http_client
+from mcp.shared.memory import create_client_server_memory_streams
 import os
 import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+# Session pool tuning (per worker process, overridable via environment)
+MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+MCP_POOL_IDLE_TIMEOUT = float(os.getenv("MCP_POOL_IDLE_TIMEOUT", "300"))
+MCP_HEALTH_CHECK_INTERVAL = float(os.getenv("MCP_HEALTH_CHECK_INTERVAL", "30"))
+MCP_HEALTH_CHECK_TIMEOUT = float(os.getenv("MCP_HEALTH_CHECK_TIMEOUT", "2"))
+MCP_TOOL_TIMEOUT = float(os.getenv("MCP_TOOL_TIMEOUT", "10"))
+# End-to-end budget for a sync wrapper call, including session start-up
+MCP_CALL_TIMEOUT = float(os.getenv("MCP_CALL_TIMEOUT", "15"))
+# How to reach the trends server: "inprocess" mounts it in this worker,
+# "stdio" runs it as a subprocess, "http" uses a shared server at MCP_SERVER_URL
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "inprocess").lower()
+# Streamable HTTP endpoint (fashion_trends_server.py --transport http)
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://127.0.0.1:8765/mcp/")
+# Keep-alive connections held open to the HTTP server per event loop
+MCP_HTTP_MAX_CONNECTIONS = int(os.getenv("MCP_HTTP_MAX_CONNECTIONS", "20"))
+MCP_HTTP_KEEPALIVE = float(os.getenv("MCP_HTTP_KEEPALIVE", "60"))
+# Tool result cache: fresh for MCP_CACHE_TTL seconds, then served stale while
+# a background refresh runs, until MCP_CACHE_STALE_TTL
+MCP_CACHE_ENABLED = os.getenv("MCP_CACHE", "true").lower() in ("1", "true", "yes")
+MCP_CACHE_TTL = float(os.getenv("MCP_CACHE_TTL", "300"))
+MCP_CACHE_STALE_TTL = float(os.getenv("MCP_CACHE_STALE_TTL", "3600"))
+MCP_CACHE_SIZE = int(os.getenv("MCP_CACHE_SIZE", "256"))
+
+
+@asynccontextmanager
+async def inprocess_transport(server):
+    """
+    Connect to an MCP Server object over in-memory streams.
+
+    The server runs as a task on the caller's event loop, so a tool call is a
+    pair of JSON-RPC messages passed between memory streams instead of a
+    subprocess pipe round trip.
+
+    Yields:
+        tuple: (read_stream, write_stream) for a ClientSession
+    """
+    async with create_client_server_memory_streams() as (client_streams, server_streams):
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(lambda: server.run(
+                *server_streams, server.create_initialization_options(), raise_exceptions=False
+            ))
+            try:
+                yield client_streams
+            finally:
+                tg.cancel_scope.cancel()
+
+
+@asynccontextmanager
+async def http_transport(url, http_client):
+    """
+    Connect to a streamable HTTP MCP server through a shared httpx client, so
+    every session reuses its keep-alive connections.
+
+    Yields:
+        tuple: (read_stream, write_stream) for a ClientSession
+    """
+    async with streamable_http_client(url, http_client=http_client) as (read, write, _get_session_id):
+        yield read, write
+
+
+class _PooledSession:
+    """
+    A long-lived MCP ClientSession owned by a dedicated runner task.
+
+    Transports and ClientSession are anyio context managers that must be
+    entered and exited by the same task, so the runner keeps them open until
+    close() is called or the server goes away.
+
+    Args:
+        connect (callable): Returns a transport context manager yielding
+            (read_stream, write_stream), e.g. stdio_client(params)
+    """
+
+    def __init__(self, connect):
+        self.connect = connect
+        self.session = None
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task = None
+        self._error = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+        await self._ready.wait()
+        if self.session is None:
+            raise self._error or RuntimeError("MCP session failed to start")
+
+    async def _run(self):
+        try:
+            async with self.connect() as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.session = session
+                    self._ready.set()
+                    await self._closing.wait()
+        except Exception as e:
+            self._error = e
+            print(f"[MCP] Session runner exited: {e}")
+        finally:
+            self.session = None
+            self._ready.set()
+
+    @property
+    def alive(self):
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def ping(self, timeout):
+        """Return True if the server answers an MCP ping within timeout seconds."""
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout=timeout)
+        except Exception:
+            return False
+        self.last_checked = time.monotonic()
+        return True
+
+    async def call_tool(self, name, arguments, timeout=MCP_TOOL_TIMEOUT):
+        """
+        Call a tool, failing fast if the server process dies mid-call.
+
+        ClientSession does not fail pending requests when its transport
+        closes, so the call is raced against the runner task.
+        """
+        call = asyncio.ensure_future(self.session.call_tool(name, arguments=arguments))
+        try:
+            done, _ = await asyncio.wait(
+                {call, self._task}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if call in done:
+                return call.result()
+            if self._task.done():
+                raise ConnectionError("MCP server process exited")
+            raise asyncio.TimeoutError(f"MCP tool '{name}' timed out after {timeout}s")
+        finally:
+            if not call.done():
+                call.cancel()
+
+    async def close(self, timeout=5):
+        self._closing.set()
+        if self._task is None or self._task.done():
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        except Exception:
+            pass
+
+
+class MCPSessionPool:
+    """
+    Bounded pool of long-lived MCP sessions for one server on one event loop.
+
+    Sessions are health-checked with an MCP ping before reuse when they have
+    not been verified recently, restarted transparently if the server process
+    crashed, and closed after sitting idle for idle_timeout seconds.
+    """
+
+    def __init__(self, connect, max_size=MCP_POOL_SIZE,
+                 idle_timeout=MCP_POOL_IDLE_TIMEOUT,
+                 health_check_interval=MCP_HEALTH_CHECK_INTERVAL):
+        self.connect = connect
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.stats = {"created": 0, "reused": 0, "restarted": 0, "expired": 0}
+        self._slots = asyncio.Semaphore(self.max_size)
+        self._idle = []
+        self._closing = set()
+        self._reaper = None
+
+    async def acquire(self):
+        """Check out a healthy session, starting a new server process if needed."""
+        await self._slots.acquire()
+        try:
+            self._expire_idle()
+            while self._idle:
+                pooled = self._idle.pop()
+                try:
+                    healthy = await self._is_healthy(pooled)
+                except asyncio.CancelledError:
+                    # Caller hit its deadline mid-check; keep the session for the next one
+                    self._idle.append(pooled)
+                    raise
+                if healthy:
+                    self.stats["reused"] += 1
+                    return pooled
+                print("[MCP] Pooled session is unhealthy, restarting...")
+                self.stats["restarted"] += 1
+                self._discard(pooled)
+
+            pooled = _PooledSession(self.connect)
+            start = asyncio.ensure_future(pooled.start())
+            try:
+                await asyncio.shield(start)
+            except asyncio.CancelledError:
+                # Caller hit its deadline; finish starting in the background and pool the session
+                start.add_done_callback(lambda f: self._adopt(pooled, f))
+                raise
+            self.stats["created"] += 1
+            return pooled
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, pooled, broken=False):
+        """Return a session to the pool, or drop it if it is broken."""
+        if broken or not pooled.alive:
+            self._discard(pooled)
+        else:
+            pooled.last_used = time.monotonic()
+            self._idle.append(pooled)
+            self._schedule_reaper()
+        self._slots.release()
+
+    async def call_tool(self, name, arguments):
+        """Call an MCP tool on a pooled session, retrying once on a fresh session if it fails."""
+        for attempt in range(2):
+            pooled = await self.acquire()
+            try:
+                result = await pooled.call_tool(name, arguments)
+            except Exception as e:
+                self.release(pooled, broken=True)
+                if attempt:
+                    raise
+                print(f"[MCP] Session call failed ({e}), retrying on a fresh session...")
+                self.stats["restarted"] += 1
+                continue
+            except BaseException:
+                self.release(pooled)
+                raise
+            self.release(pooled)
+            return result
+
+    async def aclose(self):
+        """Close every idle session and wait for pending shutdowns."""
+        while self._idle:
+            self._discard(self._idle.pop())
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+    def _adopt(self, pooled, start):
+        """Pool a session whose start-up outlived the caller that asked for it."""
+        if start.cancelled() or start.exception() is not None:
+            return
+        self.stats["created"] += 1
+        if len(self._idle) >= self.max_size:
+            self._discard(pooled)
+            return
+        pooled.last_used = time.monotonic()
+        self._idle.append(pooled)
+        self._schedule_reaper()
+
+    async def _is_healthy(self, pooled):
+        if not pooled.alive:
+            return False
+        if time.monotonic() - pooled.last_checked < self.health_check_interval:
+            return True
+        return await pooled.ping(MCP_HEALTH_CHECK_TIMEOUT)
+
+    def _discard(self, pooled):
+        task = asyncio.ensure_future(pooled.close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def _expire_idle(self):
+        now = time.monotonic()
+        keep = []
+        for pooled in self._idle:
+            if now - pooled.last_used >= self.idle_timeout:
+                self.stats["expired"] += 1
+                self._discard(pooled)
+            else:
+                keep.append(pooled)
+        self._idle = keep
+
+    def _schedule_reaper(self):
+        if self._reaper is not None or not self._idle:
+            return
+        oldest = min(pooled.last_used for pooled in self._idle)
+        delay = max(0.0, oldest + self.idle_timeout - time.monotonic())
+        self._reaper = asyncio.get_running_loop().call_later(delay, self._run_reaper)
+
+    def _run_reaper(self):
+        self._reaper = None
+        self._expire_idle()
+        self._schedule_reaper()
+
+
+class ToolResultCache:
+    """
+    LRU cache of MCP tool results with stale-while-revalidate.
+
+    Results younger than ttl are served directly. Older ones, up to
+    stale_ttl, are served as-is while one background task refreshes them.
+    Concurrent misses for the same key share one fetch. Fetches run as
+    their own tasks, so a caller that gives up (deadline) still leaves the
+    result cached for the next one.
+    """
+
+    def __init__(self, ttl=MCP_CACHE_TTL, stale_ttl=MCP_CACHE_STALE_TTL, max_size=MCP_CACHE_SIZE):
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (result, fetched_at)
+        self._inflight = {}            # key -> Task
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0,
+                      "refreshes": 0, "refresh_errors": 0, "evictions": 0}
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    async def get_or_fetch(self, key, fetch):
+        """
+        Return the cached result for key, calling fetch() on a miss.
+
+        Args:
+            key (hashable): (tool, canonical arguments)
+            fetch (callable): Coroutine function returning a CallToolResult
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            result, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self._count("hits")
+                return result
+            if age < self.stale_ttl:
+                self._count("stale_hits")
+                if self._start(key, fetch, refresh=True) is not None:
+                    self._count("refreshes")
+                return result
+
+        task = self._inflight.get(key)
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            self._count("coalesced")
+        else:
+            self._count("misses")
+            task = self._start(key, fetch)
+        return await asyncio.shield(task)
+
+    def _start(self, key, fetch, refresh=False):
+        """Start fetching key unless a fetch is already running on this loop."""
+        task = self._inflight.get(key)
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            return None if refresh else task
+        task = asyncio.ensure_future(self._fetch(key, fetch, refresh))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._finished(key, t))
+        return task
+
+    def _finished(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Retrieved here in case every caller gave up waiting
+
+    async def _fetch(self, key, fetch, refresh):
+        try:
+            result = await fetch()
+        except Exception as e:
+            if refresh:
+                # The stale entry keeps being served until stale_ttl
+                self._count("refresh_errors")
+                print(f"[MCP] Background refresh of {key[0]} failed: {e}")
+                return None
+            raise
+        if result.content and not result.isError:
+            self._store(key, result)
+        return result
+
+    def _store(self, key, result):
+        with self._lock:
+            self._entries[key] = (result, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats, size=len(self._entries))
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
 
 class OpuluxeMCPClient:
-    """MCP Client for Opuluxe AI fashion intelligence"""
+    """
+    MCP Client for Opuluxe AI fashion intelligence
+
+    Args:
+        transport (str): "inprocess" to mount the bundled server's app in this
+            process, "stdio" to run it as a subprocess, or "http" to call the
+            streamable HTTP server at server_url
+        server_url (str): Endpoint for the "http" transport
+        cache (bool): Cache tool results (see ToolResultCache)
+        revalidate (bool): Send the last seen ETag so unchanged payloads come
+            back as not_modified
+    """
     
-    def __init__(self):
+    def __init__(self, transport=MCP_TRANSPORT, server_url=MCP_SERVER_URL, cache=MCP_CACHE_ENABLED,
+                 revalidate=True):
         self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.mcp_servers_dir = os.path.join(self.base_dir, 'mcp_servers')
+        self.server_script = os.path.join(self.mcp_servers_dir, 'fashion_trends_server.py')
+        self.transport = transport
+        self.server_url = server_url
+        self._connect = None
+        # One keep-alive httpx client per event loop for the "http" transport
+        self._http_clients = weakref.WeakKeyDictionary()
+        # One session pool per event loop: sessions and their runner tasks are loop-bound
+        self._pools = weakref.WeakKeyDictionary()
+        # Last payload per (tool, arguments), revalidated against the server's ETag
+        self._validated = {}
+        self.revalidate = revalidate
+        self.cache = ToolResultCache() if cache else None
+        self.stats = {"calls": 0, "not_modified": 0}
+
+    def _get_pool(self):
+        loop = asyncio.get_running_loop()
+        pool = self._pools.get(loop)
+        if pool is None:
+            pool = MCPSessionPool(self._get_connect())
+            self._pools[loop] = pool
+        return pool
+
+    def _get_connect(self):
+        """Transport factory for the configured mode; stdio if the server cannot be mounted."""
+        if self._connect is not None:
+            return self._connect
+        if self.transport == "http":
+            self._connect = lambda: http_transport(self.server_url, self._get_http_client())
+            return self._connect
+        if self.transport == "inprocess":
+            try:
+                from mcp_servers.fashion_trends_server import app
+            except ImportError as e:
+                print(f"[MCP] Cannot mount trends server in-process ({e}), using stdio")
+                self.transport = "stdio"
+            else:
+                self._connect = lambda: inprocess_transport(app)
+                return self._connect
+
+        server_params = StdioServerParameters(
+            command=sys.executable,  # Use current Python interpreter
+            args=[self.server_script],
+            env=dict(os.environ)  # Bundled server; passes TREND_* settings through
+        )
+        self._connect = lambda: stdio_client(server_params)
+        return self._connect
+
+    def _get_http_client(self):
+        loop = asyncio.get_running_loop()
+        http_client = self._http_clients.get(loop)
+        if http_client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=MCP_HTTP_MAX_CONNECTIONS,
+                                    max_keepalive_connections=MCP_HTTP_MAX_CONNECTIONS,
+                                    keepalive_expiry=MCP_HTTP_KEEPALIVE),
+                timeout=httpx.Timeout(MCP_TOOL_TIMEOUT, read=300),
+            )
+            self._http_clients[loop] = http_client
+        return http_client
+
+    async def _call_tool(self, name, arguments):
+        """Call a tool through the result cache (if enabled)."""
+        if self.cache is None:
+            return await self._fetch_tool(name, arguments)
+        key = (name, json.dumps(arguments, sort_keys=True))
+        return await self.cache.get_or_fetch(key, lambda: self._fetch_tool(name, arguments))
+
+    async def _fetch_tool(self, name, arguments):
+        """
+        Call a tool on the server, sending the ETag of the last payload seen for
+        the same arguments so the server can answer not_modified instead of
+        resending it.
+        """
+        key = (name, json.dumps(arguments, sort_keys=True))
+        known = self._validated.get(key) if self.revalidate else None
+        if known is not None:
+            arguments = dict(arguments, if_none_match=known[0])
+
+        result = await self._get_pool().call_tool(name, arguments)
+        self.stats["calls"] += 1
+        meta = result.meta or {}
+        if meta.get("not_modified") and known is not None:
+            self.stats["not_modified"] += 1
+            return known[1]
+        if self.revalidate and meta.get("etag") and result.content:
+            self._validated[key] = (meta["etag"], result)
+        return result
+
+    async def aclose(self):
+        """Close this loop's pooled sessions and HTTP connections."""
+        loop = asyncio.get_running_loop()
+        pool = self._pools.pop(loop, None)
+        if pool is not None:
+            await pool.aclose()
+        http_client = self._http_clients.pop(loop, None)
+        if http_client is not None:
+            await http_client.aclose()
+
+    def get_stats(self):
+        stats = dict(self.stats, transport=self.transport,
+                     pools=[dict(pool.stats) for pool in list(self._pools.values())])
+        if self.cache is not None:
+            stats["cache"] = self.cache.get_stats()
+        if self.transport == "inprocess" and self._connect is not None:
+            from mcp_servers.fashion_trends_server import trend_store
+            stats["trend_store"] = trend_store.get_stats()
+        return stats
     
-    async def get_fashion_trends(self, category="all"):
+    async def call(self, name, arguments):
+        """
+        Call a trend tool by name.
+
+        Returns:
+            Whatever the matching get_* method returns for these arguments
+        """
+        methods = {
+            "get_fashion_trends": self.get_fashion_trends,
+            "get_style_tips": self.get_style_tips,
+            "get_seasonal_recommendations": self.get_seasonal_recommendations,
+        }
+        return await methods[name](**arguments)
+
+    async def get_fashion_trends(self, category="all", region=None):
         """
         Get current fashion trends using MCP
         
         Args:
             category (str): Fashion category (men/women/accessories/all)
+            region (str, optional): Region with local trends (india/europe/...)
             
         Returns:
             dict: Fashion trends data
         """
         try:
-            server_script = os.path.join(self.mcp_servers_dir, 'fashion_trends_server.py')
-            
-            server_params = StdioServerParameters(
-                command=sys.executable,  # Use current Python interpreter
-                args=[server_script],
-                env=None
+            arguments = {"category": category}
+            if region:
+                arguments["region"] = region
+            # Call the MCP tool
+            result = await self._call_tool(
+                "get_fashion_trends",
+                arguments
             )
             
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    
-                    # Call the MCP tool
-                    result = await session.call_tool(
-                        "get_fashion_trends",
-                        arguments={"category": category}
-                    )
-                    
-                    # Parse the response
-                    if result.content and len(result.content) > 0:
-                        trends_text = result.content[0].text
-                        return json.loads(trends_text)
-                    
-                    return {"error": "No trends data received"}
-                    
+            # Parse the response
+            if result.content and len(result.content) > 0:
+                trends_text = result.content[0].text
+                return json.loads(trends_text)
+            
+            return {"error": "No trends data received"}
+            
         except Exception as e:
             print(f"[MCP] Error fetching fashion trends: {e}")
             return {"error": str(e)}
@@ -68,65 +602,45 @@ class OpuluxeMCPClient:
             str: Style tip
         """
         try:
-            server_script = os.path.join(self.mcp_servers_dir, 'fashion_trends_server.py')
-            
-            server_params = StdioServerParameters(
-                command=sys.executable,
-                args=[server_script],
-                env=None
+            result = await self._call_tool(
+                "get_style_tips",
+                {"occasion": occasion}
             )
             
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    
-                    result = await session.call_tool(
-                        "get_style_tips",
-                        arguments={"occasion": occasion}
-                    )
-                    
-                    if result.content and len(result.content) > 0:
-                        return result.content[0].text
-                    
-                    return "No style tips available"
-                    
+            if result.content and len(result.content) > 0:
+                return result.content[0].text
+            
+            return "No style tips available"
+            
         except Exception as e:
             print(f"[MCP] Error fetching style tips: {e}")
             return f"Error: {str(e)}"
     
-    async def get_seasonal_recommendations(self, category="men"):
+    async def get_seasonal_recommendations(self, category="men", season=None):
         """
         Get seasonal fashion recommendations using MCP
         
         Args:
             category (str): Fashion category (men/women/accessories)
+            season (str, optional): spring/summer/autumn/winter; the dataset's default season if omitted
             
         Returns:
             str: Seasonal recommendations
         """
         try:
-            server_script = os.path.join(self.mcp_servers_dir, 'fashion_trends_server.py')
-            
-            server_params = StdioServerParameters(
-                command=sys.executable,
-                args=[server_script],
-                env=None
+            arguments = {"category": category}
+            if season:
+                arguments["season"] = season
+            result = await self._call_tool(
+                "get_seasonal_recommendations",
+                arguments
             )
             
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    
-                    result = await session.call_tool(
-                        "get_seasonal_recommendations",
-                        arguments={"category": category}
-                    )
-                    
-                    if result.content and len(result.content) > 0:
-                        return result.content[0].text
-                    
-                    return "No seasonal recommendations available"
-                    
+            if result.content and len(result.content) > 0:
+                return result.content[0].text
+            
+            return "No seasonal recommendations available"
+            
         except Exception as e:
             print(f"[MCP] Error fetching seasonal recommendations: {e}")
             return f"Error: {str(e)}"
@@ -134,39 +648,135 @@ class OpuluxeMCPClient:
 # Singleton instance
 mcp_client = OpuluxeMCPClient()
 
+
+class BackgroundLoop:
+    """
+    A per-process asyncio event loop running in a daemon thread.
+
+    Sync callers (Django views, management commands) submit coroutines to it
+    from any thread, so pooled MCP sessions live on a single long-running loop
+    instead of one loop per request or per thread. The loop is recreated
+    lazily in a forked child, since the parent's loop thread does not survive
+    the fork.
+    """
+
+    def __init__(self, name="opuluxe-mcp-loop"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._pid = None
+
+    def _is_running(self):
+        return (
+            self._loop is not None
+            and self._pid == os.getpid()
+            and self._thread.is_alive()
+        )
+
+    def get_loop(self):
+        if self._is_running():
+            return self._loop
+        with self._lock:
+            if not self._is_running():
+                self._start()
+            return self._loop
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+
+        thread = threading.Thread(target=run, name=self.name, daemon=True)
+        thread.start()
+        ready.wait()
+        self._loop, self._thread, self._pid = loop, thread, os.getpid()
+
+    def submit(self, coro):
+        """
+        Schedule a coroutine on the background loop from any thread.
+
+        Returns:
+            concurrent.futures.Future: Future resolving to the coroutine result
+        """
+        loop = self.get_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError("BackgroundLoop.submit() called from its own loop; await the coroutine instead")
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def run(self, coro, timeout=MCP_CALL_TIMEOUT):
+        """
+        Run a coroutine on the background loop and block for its result.
+
+        Args:
+            coro: Coroutine to run
+            timeout (float): Seconds to wait before cancelling the coroutine
+
+        Returns:
+            The coroutine's result
+        """
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"MCP call timed out after {timeout}s")
+
+    async def run_async(self, coro, timeout=MCP_CALL_TIMEOUT):
+        """
+        Await a coroutine on the background loop from another event loop.
+
+        Used by async views so MCP calls neither block the request loop nor
+        bind pooled sessions to a loop that may only live for one request.
+
+        Args:
+            coro: Coroutine to run
+            timeout (float): Seconds to wait before cancelling the coroutine
+
+        Returns:
+            The coroutine's result
+        """
+        if asyncio.get_running_loop() is self._loop and self._is_running():
+            return await asyncio.wait_for(coro, timeout)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(self.submit(coro)), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"MCP call timed out after {timeout}s")
+
+
+# Shared loop for all sync MCP calls in this process
+background_loop = BackgroundLoop()
+
 # Synchronous wrappers for Django views
-def get_fashion_trends_sync(category="all"):
+def get_fashion_trends_sync(category="all", timeout=MCP_CALL_TIMEOUT):
     """Synchronous wrapper for get_fashion_trends"""
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(mcp_client.get_fashion_trends(category))
-        loop.close()
-        return result
+        return background_loop.run(mcp_client.get_fashion_trends(category), timeout)
     except Exception as e:
         print(f"[MCP] Sync wrapper error: {e}")
         return {"error": str(e)}
 
-def get_style_tips_sync(occasion="casual"):
+def get_style_tips_sync(occasion="casual", timeout=MCP_CALL_TIMEOUT):
     """Synchronous wrapper for get_style_tips"""
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(mcp_client.get_style_tips(occasion))
-        loop.close()
-        return result
+        return background_loop.run(mcp_client.get_style_tips(occasion), timeout)
     except Exception as e:
         print(f"[MCP] Sync wrapper error: {e}")
         return f"Error: {str(e)}"
 
-def get_seasonal_recommendations_sync(category="men"):
+def get_seasonal_recommendations_sync(category="men", timeout=MCP_CALL_TIMEOUT):
     """Synchronous wrapper for get_seasonal_recommendations"""
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(mcp_client.get_seasonal_recommendations(category))
-        loop.close()
-        return result
+        return background_loop.run(mcp_client.get_seasonal_recommendations(category), timeout)
     except Exception as e:
         print(f"[MCP] Sync wrapper error: {e}")
         return f"Error: {str(e)}"
@@ -0,0 +1,76 @@
+"""
+Session middleware for Opuluxe AI
+Sliding session expiry without a session write on every request
+"""
+
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Session key holding when the session expiry was last pushed forward (epoch seconds)
+REFRESHED_AT_KEY = '_refreshed_at'
+
+
+class SlidingSessionMiddleware:
+    """
+    Keeps logged-in users signed in while they stay active.
+
+    With SESSION_SAVE_EVERY_REQUEST off, SessionMiddleware only saves a
+    session that changed, so read-only requests never touch session
+    storage. This middleware makes the one change that extends a session,
+    and only when it is within SESSION_REFRESH_WINDOW seconds of expiring:
+    an active user costs one session write per window, not one per request.
+
+    Must come after SessionMiddleware. Sessions the view did not load are
+    left alone, so requests that never use the session stay free.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        session = getattr(request, 'session', None)
+        if session is not None and session.accessed and self._needs_refresh(
+            session.get('user_email'), session.get(REFRESHED_AT_KEY)
+        ):
+            session[REFRESHED_AT_KEY] = int(time.time())
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        session = getattr(request, 'session', None)
+        if session is not None and session.accessed and self._needs_refresh(
+            await session.aget('user_email'), await session.aget(REFRESHED_AT_KEY)
+        ):
+            await session.aset(REFRESHED_AT_KEY, int(time.time()))
+        return response
+
+    @staticmethod
+    def _needs_refresh(user_email, refreshed_at):
+        """
+        Whether a session should be saved to push its expiry forward.
+
+        Args:
+            user_email (str): Logged-in user, or None for anonymous sessions
+            refreshed_at (int): Epoch seconds of the last refresh, or None
+
+        Returns:
+            bool: True if the session is logged in and close to expiring
+        """
+        if not user_email:
+            return False
+        if refreshed_at is None:
+            return True
+        window = getattr(settings, 'SESSION_REFRESH_WINDOW', settings.SESSION_COOKIE_AGE // 2)
+        expires_at = refreshed_at + settings.SESSION_COOKIE_AGE
+        return expires_at - time.time() < window
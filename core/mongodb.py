@@ -1,4 +1,5 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
 import certifi
 import sys
 
@@ -54,3 +55,130 @@ def get_db():
         db.status = "Connected (Atlas)"
         return db
     return None
+
+
+# Indexes backing the queries in QUERY_SHAPES: collection -> [(keys, options)]
+# (tryon_user_slots is only read by _id and needs none)
+INDEXES = {
+    'users': [
+        ([('email', ASCENDING)], {'unique': True, 'name': 'email_unique'}),
+    ],
+    'chat_sessions': [
+        # update/find/delete by session, session detail paging
+        ([('user_email', ASCENDING), ('session_id', ASCENDING)], {'unique': True, 'name': 'user_session_unique'}),
+        # chat history sidebar: find({'user_email'}).sort('_id', -1)
+        ([('user_email', ASCENDING), ('_id', DESCENDING)], {'name': 'user_recent_sessions'}),
+    ],
+    'user_profiles': [
+        # find({'user_email'}) and find_one({'user_email', 'id'})
+        ([('user_email', ASCENDING), ('id', ASCENDING)], {'unique': True, 'name': 'user_profile_unique'}),
+    ],
+    'tryon_jobs': [
+        # finished jobs are purged after a day; results stay in the blob store
+        ([('created_at', ASCENDING)], {'expireAfterSeconds': 86400, 'name': 'job_expiry'}),
+    ],
+    'tryon_renders': [
+        # cached renders are looked up by _id; LRU eviction scans by last_used
+        ([('last_used', ASCENDING)], {'name': 'render_lru'}),
+    ],
+    'photo_analyses': [
+        # cached try-on photo descriptions are looked up by _id; re-analyzed after 30 days
+        ([('created_at', ASCENDING)], {'expireAfterSeconds': 30 * 86400, 'name': 'analysis_expiry'}),
+    ],
+}
+
+# Representative query shapes: (name, collection, filter, sort). A list in place
+# of the filter is an aggregation pipeline and is explained as an aggregate.
+_PROBE_SESSION = {'user_email': 'probe@example.com', 'session_id': 'probe'}
+QUERY_SHAPES = [
+    ('login/signup user lookup', 'users', {'email': 'probe@example.com'}, None),
+    ('chat history list', 'chat_sessions', {'user_email': 'probe@example.com'}, [('_id', DESCENDING)]),
+    ('chat session by id', 'chat_sessions', _PROBE_SESSION, None),
+    # session detail paging and chat history: length first, then a $slice of messages
+    ('chat session message count', 'chat_sessions', [
+        {'$match': _PROBE_SESSION},
+        {'$project': {'_id': 0, 'total': {'$size': {'$ifNull': ['$messages', []]}}}},
+    ], None),
+    ('profile list', 'user_profiles', {'user_email': 'probe@example.com'}, None),
+    ('profile by id', 'user_profiles', {'user_email': 'probe@example.com', 'id': 'probe'}, None),
+    ('profile by id (str or int)', 'user_profiles',
+     {'user_email': 'probe@example.com', '$or': [{'id': '1'}, {'id': 1}]}, None),
+    ('try-on slot claim', 'tryon_user_slots', {'_id': 'probe@example.com', 'active.1': {'$exists': False}}, None),
+    ('try-on job status', 'tryon_jobs', {'_id': 'probe', 'user_email': 'probe@example.com'}, None),
+    ('try-on job heartbeat', 'tryon_jobs', {'_id': {'$in': ['probe']}}, None),
+    ('try-on render lookup', 'tryon_renders', {'_id': 'probe'}, None),
+    ('try-on render LRU eviction', 'tryon_renders', {}, [('last_used', ASCENDING)]),
+    ('photo analysis lookup', 'photo_analyses', {'_id': 'probe'}, None),
+]
+
+
+def ensure_indexes(db=None):
+    """
+    Create the indexes listed in INDEXES (idempotent).
+
+    Returns:
+        list: (collection, index name, error or None) for each index
+    """
+    db = db if db is not None else get_db()
+    if db is None:
+        return []
+    results = []
+    for collection, indexes in INDEXES.items():
+        for keys, options in indexes:
+            try:
+                db[collection].create_index(keys, **options)
+                results.append((collection, options['name'], None))
+            except PyMongoError as e:
+                # e.g. existing duplicates blocking a unique index
+                results.append((collection, options['name'], str(e)))
+    return results
+
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree"""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def _query_planners(explain):
+    """Yield every queryPlanner section of an explain() result (aggregates nest them per stage or shard)"""
+    if isinstance(explain, dict):
+        if 'queryPlanner' in explain:
+            yield explain['queryPlanner']
+        for key, value in explain.items():
+            if key != 'queryPlanner':
+                yield from _query_planners(value)
+    elif isinstance(explain, list):
+        for item in explain:
+            yield from _query_planners(item)
+
+
+def explain_query_shapes(db=None):
+    """
+    Run explain() for each entry in QUERY_SHAPES.
+
+    Returns:
+        list: (name, collection, stages) where stages are the winning plan's stage names
+    """
+    db = db if db is not None else get_db()
+    if db is None:
+        return []
+    report = []
+    for name, collection, query, sort in QUERY_SHAPES:
+        if isinstance(query, list):
+            explain = db.command('aggregate', collection, pipeline=query, explain=True)
+        else:
+            cursor = db[collection].find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            explain = cursor.explain()
+        stages = [stage for planner in _query_planners(explain)
+                  for stage in _plan_stages(planner.get('winningPlan', {}))]
+        report.append((name, collection, stages))
+    return report
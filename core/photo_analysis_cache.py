@@ -0,0 +1,147 @@
+"""
+Photo analysis cache for the Magic Try-On pipeline
+Stores "describe this person" results keyed by a hash of the photo bytes,
+in a per-process LRU backed by MongoDB, so repeat photos skip the vision call
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from pymongo.errors import PyMongoError
+
+from .mongodb import get_db
+
+PHOTO_ANALYSIS_CACHE_SIZE = int(os.getenv("PHOTO_ANALYSIS_CACHE_SIZE", "256"))
+# How long a request waits for another thread already analyzing the same photo
+PHOTO_ANALYSIS_WAIT = float(os.getenv("PHOTO_ANALYSIS_WAIT", "60"))
+
+ANALYSES_COLLECTION = 'photo_analyses'
+
+
+def analysis_key(image_bytes, model, prompt):
+    """
+    Cache key for one photo under one analyzer.
+
+    The model and prompt are part of the key, so changing either one
+    naturally invalidates earlier descriptions.
+    """
+    analyzer = hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()[:16]
+    return f"{analyzer}:{hashlib.sha256(image_bytes).hexdigest()}"
+
+
+class PhotoAnalysisCache:
+    """
+    Two-tier cache of photo descriptions: in-memory LRU, then MongoDB.
+
+    Concurrent misses for the same photo are collapsed so a multi-item
+    try-on session runs the vision call once.
+    """
+
+    def __init__(self, max_entries=PHOTO_ANALYSIS_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+    def get_or_analyze(self, image_bytes, model, prompt, analyze):
+        """
+        Return the cached description of a photo, or compute and store it.
+
+        Args:
+            image_bytes (bytes): Decoded photo
+            model (str): Vision model used by analyze
+            prompt (str): Analysis prompt used by analyze
+            analyze (callable): Runs the vision call and returns the description;
+                exceptions propagate and nothing is cached
+
+        Returns:
+            str: Photo description
+        """
+        key = analysis_key(image_bytes, model, prompt)
+
+        owner = False
+        while True:
+            with self._lock:
+                description = self._entries.get(key)
+                if description is not None:
+                    self._entries.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return description
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    self._inflight[key] = threading.Event()
+                    owner = True
+                    break
+                self.stats["coalesced"] += 1
+            # Another thread is analyzing this photo; reuse its result
+            if not waiter.wait(PHOTO_ANALYSIS_WAIT):
+                break
+
+        try:
+            description = self._load(key)
+            if description is not None:
+                with self._lock:
+                    self.stats["db_hits"] += 1
+            else:
+                with self._lock:
+                    self.stats["misses"] += 1
+                description = analyze()
+                if description:
+                    self._save(key, model, description)
+            if description:
+                self._remember(key, description)
+            return description
+        finally:
+            if owner:
+                with self._lock:
+                    event = self._inflight.pop(key)
+                event.set()
+
+    def _remember(self, key, description):
+        with self._lock:
+            self._entries[key] = description
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, key):
+        db = get_db()
+        if db is None:
+            return None
+        try:
+            doc = db[ANALYSES_COLLECTION].find_one({'_id': key}, {'description': 1})
+        except PyMongoError as e:
+            self._count_error(e)
+            return None
+        return doc['description'] if doc else None
+
+    def _save(self, key, model, description):
+        db = get_db()
+        if db is None:
+            return
+        try:
+            db[ANALYSES_COLLECTION].update_one(
+                {'_id': key},
+                {'$set': {'description': description, 'model': model, 'created_at': datetime.now(timezone.utc)}},
+                upsert=True
+            )
+        except PyMongoError as e:
+            self._count_error(e)
+
+    def _count_error(self, error):
+        print(f"[Photo Analysis Cache] Database error: {error}")
+        with self._lock:
+            self.stats["errors"] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+            return stats
+
+
+photo_analysis_cache = PhotoAnalysisCache()
@@ -0,0 +1,166 @@
+"""
+Gemini context caching for Opuluxe AI
+Uploads large static prompts once as provider-side cached content, keyed by
+a hash of model and prompt, and refreshes the handle before it expires
+
+Inert for now: the chat system prompt (~700 tokens) is below Gemini's
+PROMPT_CACHE_MIN_TOKENS caching minimum, so it is always sent inline. The
+create/refresh/fallback paths engage once the prompt grows past it, and are
+covered by tests that lower the threshold.
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+from google.genai import types
+
+from .context_builder import estimate_tokens
+
+PROMPT_CACHE_ENABLED = os.getenv("GEMINI_PROMPT_CACHE", "true").lower() in ("1", "true", "yes")
+# Lifetime of a cached prompt on the Gemini side
+PROMPT_CACHE_TTL = int(os.getenv("GEMINI_PROMPT_CACHE_TTL", "3600"))
+# Extend the TTL once less than this many seconds remain
+PROMPT_CACHE_REFRESH_MARGIN = int(os.getenv("GEMINI_PROMPT_CACHE_REFRESH_MARGIN", "300"))
+# Gemini rejects cached content below a model-specific minimum size; prompts
+# under it are always sent inline
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_PROMPT_CACHE_MIN_TOKENS", "1024"))
+# After a failed create/update, send prompts inline for this long before retrying
+PROMPT_CACHE_RETRY_AFTER = int(os.getenv("GEMINI_PROMPT_CACHE_RETRY_AFTER", "600"))
+
+
+def prompt_key(model, system_prompt):
+    return hashlib.sha256(f"{model}\n{system_prompt}".encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    """
+    Process-wide registry of Gemini cached-content handles.
+
+    Entries map prompt_key -> {'name', 'expires_at'}. Only one request per
+    prompt creates or refreshes a handle at a time; the others keep sending
+    the prompt inline (or reuse the still-valid handle) meanwhile.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._busy = set()
+        self._retry_at = {}
+        self._too_small = set()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "created": 0, "refreshed": 0, "fallbacks": 0, "errors": 0, "too_small": 0}
+
+    def _claim(self, key):
+        with self._lock:
+            if key in self._busy:
+                return False
+            self._busy.add(key)
+            return True
+
+    def _release(self, key):
+        with self._lock:
+            self._busy.discard(key)
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _fail(self, key, action, error):
+        print(f"[Prompt Cache] Could not {action} cached prompt, sending inline: {error}")
+        with self._lock:
+            self.stats["errors"] += 1
+            self._retry_at[key] = time.monotonic() + PROMPT_CACHE_RETRY_AFTER
+
+    async def get(self, client, model, system_prompt):
+        """
+        Get the cached-content name for a system prompt, creating it if needed.
+
+        Args:
+            client: Async Gemini client (client.aio)
+            model (str): Model the cache is created for
+            system_prompt (str): Static system instruction
+
+        Returns:
+            str: Cached content name, or None to send the prompt inline
+        """
+        if not PROMPT_CACHE_ENABLED or client is None:
+            return None
+
+        key = prompt_key(model, system_prompt)
+        tokens = estimate_tokens(system_prompt)
+        if tokens < PROMPT_CACHE_MIN_TOKENS:
+            with self._lock:
+                self.stats["too_small"] += 1
+                first = key not in self._too_small
+                self._too_small.add(key)
+            if first:
+                print(f"[Prompt Cache] System prompt for {model} is ~{tokens} tokens, below the "
+                      f"{PROMPT_CACHE_MIN_TOKENS}-token caching minimum; sending it inline")
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            retry_at = self._retry_at.get(key, 0)
+
+        if entry and entry["expires_at"] - now > PROMPT_CACHE_REFRESH_MARGIN:
+            self._count("hits")
+            return entry["name"]
+
+        if now < retry_at or not self._claim(key):
+            # Refresh in progress elsewhere or backing off: use the handle while it is valid
+            if entry and entry["expires_at"] > now:
+                self._count("hits")
+                return entry["name"]
+            self._count("fallbacks")
+            return None
+
+        try:
+            if entry and entry["expires_at"] > now:
+                try:
+                    await client.caches.update(
+                        name=entry["name"],
+                        config=types.UpdateCachedContentConfig(ttl=f"{PROMPT_CACHE_TTL}s")
+                    )
+                    self._store(key, entry["name"], "refreshed")
+                    return entry["name"]
+                except Exception as e:
+                    print(f"[Prompt Cache] Refresh failed, creating a new cache: {e}")
+
+            try:
+                cached = await client.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        display_name=f"opuluxe-{key[:16]}",
+                        system_instruction=system_prompt,
+                        ttl=f"{PROMPT_CACHE_TTL}s",
+                    )
+                )
+            except Exception as e:
+                self.invalidate(entry["name"] if entry else None)
+                self._fail(key, "create", e)
+                return None
+            self._store(key, cached.name, "created")
+            print(f"[Prompt Cache] Cached system prompt for {model} as {cached.name}")
+            return cached.name
+        finally:
+            self._release(key)
+
+    def _store(self, key, name, stat):
+        with self._lock:
+            self._entries[key] = {"name": name, "expires_at": time.monotonic() + PROMPT_CACHE_TTL}
+            self._retry_at.pop(key, None)
+            self.stats[stat] += 1
+
+    def invalidate(self, name):
+        """Forget a handle the API no longer accepts (expired or deleted)."""
+        if not name:
+            return
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry["name"] == name:
+                    del self._entries[key]
+
+
+prompt_cache = PromptCache()
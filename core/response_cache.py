@@ -0,0 +1,206 @@
+"""
+Semantic response cache for Opuluxe AI chat
+Reuses Gemini replies for repeated, non-personalized fashion questions, by
+exact normalized match first and embedding similarity second
+"""
+
+import asyncio
+import hashlib
+import math
+import operator
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from .ai_clients import track_call
+
+RESPONSE_CACHE_ENABLED = os.getenv("CHAT_RESPONSE_CACHE", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SIZE = int(os.getenv("CHAT_RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL = int(os.getenv("CHAT_RESPONSE_CACHE_TTL", "1800"))
+# Minimum cosine similarity for a semantic hit; 0 disables embedding lookup
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("CHAT_RESPONSE_CACHE_SIMILARITY", "0.93"))
+# Print a stats line every N lookups
+RESPONSE_CACHE_LOG_EVERY = int(os.getenv("CHAT_RESPONSE_CACHE_LOG_EVERY", "100"))
+
+EMBEDDING_MODEL = 'text-embedding-004'
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+# Questions about the user themselves depend on their profile, not just the wording
+_PERSONAL_RE = re.compile(
+    r"\b(i|i'm|im|i've|my|me|mine|myself|profile|size|height|weight|waist|chest|budget)\b|\d",
+    re.IGNORECASE,
+)
+
+
+def normalize_question(text):
+    """Lowercase, strip punctuation and collapse whitespace."""
+    return " ".join(_WORD_RE.findall((text or "").lower()))
+
+
+def is_personalized(user_text, has_image=False, history_messages=0):
+    """
+    Whether a reply depends on more than the question itself.
+
+    Image uploads, ongoing conversations and questions about the user's own
+    body, size or budget bypass the cache.
+    """
+    return bool(has_image or history_messages or _PERSONAL_RE.search(user_text or ""))
+
+
+def _unit(vector):
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else None
+
+
+class CacheProbe:
+    """Lookup state carried from get() to put() so the question is embedded once."""
+
+    def __init__(self, question, context_hash):
+        self.question = question
+        self.context_hash = context_hash
+        self.key = hashlib.sha256(f"{question}\n{context_hash}".encode("utf-8")).hexdigest()
+        self.embedding = None
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache of chat replies.
+
+    Entries map key -> {'reply', 'embedding', 'context_hash', 'expires_at'}.
+    Semantic lookups only compare entries with the same MCP context, so a
+    similar question never gets an answer built on different trend data.
+    Only non-personalized questions (see is_personalized) are cached.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, similarity=RESPONSE_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "lookups": 0, "exact_hits": 0, "semantic_hits": 0, "misses": 0,
+            "bypassed": 0, "stores": 0, "evictions": 0, "expired": 0, "embedding_errors": 0,
+        }
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def bypass(self):
+        self._count("bypassed")
+
+    async def get(self, client, user_text, mcp_context=""):
+        """
+        Look up a cached reply.
+
+        Args:
+            client: Async Gemini client (client.aio), used for embeddings
+            user_text (str): The user's question
+            mcp_context (str): MCP data the reply would be built on
+
+        Returns:
+            tuple: (reply or None, CacheProbe to pass to put() on a miss)
+        """
+        context_hash = hashlib.sha256((mcp_context or "").encode("utf-8")).hexdigest()
+        probe = CacheProbe(normalize_question(user_text), context_hash)
+        now = time.monotonic()
+
+        with self._lock:
+            self.stats["lookups"] += 1
+            self._expire(now)
+            entry = self._entries.get(probe.key)
+            if entry is not None:
+                self._entries.move_to_end(probe.key)
+                self.stats["exact_hits"] += 1
+                self._maybe_log()
+                return entry["reply"], probe
+
+        if self.similarity > 0 and client is not None:
+            probe.embedding = await self._embed(client, probe.question)
+        if probe.embedding is not None:
+            with self._lock:
+                candidates = [(key, entry["embedding"]) for key, entry in self._entries.items()
+                              if entry["embedding"] is not None and entry["context_hash"] == context_hash]
+            # Scoring hundreds of embeddings takes milliseconds; keep it off the event loop
+            best_key, best_score = await asyncio.to_thread(self._best_match, probe.embedding, candidates)
+            if best_key is not None:
+                with self._lock:
+                    entry = self._entries.get(best_key)
+                    if entry is not None:
+                        self._entries.move_to_end(best_key)
+                        self.stats["semantic_hits"] += 1
+                        self._maybe_log()
+                        print(f"[Response Cache] Semantic hit ({best_score:.3f}) for '{probe.question[:60]}'")
+                        return entry["reply"], probe
+
+        with self._lock:
+            self.stats["misses"] += 1
+            self._maybe_log()
+        return None, probe
+
+    def put(self, probe, reply):
+        """Store a reply for the probed question."""
+        if not reply:
+            return
+        with self._lock:
+            self._entries[probe.key] = {
+                "reply": reply,
+                "embedding": probe.embedding,
+                "context_hash": probe.context_hash,
+                "expires_at": time.monotonic() + self.ttl,
+            }
+            self._entries.move_to_end(probe.key)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def _best_match(self, embedding, candidates):
+        """Most similar (key, embedding) candidate at or above the threshold, as (key, score)."""
+        best_key, best_score = None, self.similarity
+        for key, other in candidates:
+            # Unit vectors, so the dot product is the cosine similarity
+            score = sum(map(operator.mul, embedding, other))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key, best_score
+
+    async def _embed(self, client, text):
+        try:
+            with track_call("gemini", EMBEDDING_MODEL):
+                result = await client.models.embed_content(model=EMBEDDING_MODEL, contents=text)
+            return _unit(result.embeddings[0].values)
+        except Exception as e:
+            self._count("embedding_errors")
+            print(f"[Response Cache] Embedding failed, exact match only: {e}")
+            return None
+
+    def _expire(self, now):
+        for key in [k for k, e in self._entries.items() if e["expires_at"] <= now]:
+            del self._entries[key]
+            self.stats["expired"] += 1
+
+    def _maybe_log(self):
+        if RESPONSE_CACHE_LOG_EVERY and self.stats["lookups"] % RESPONSE_CACHE_LOG_EVERY == 0:
+            print(f"[Response Cache] {self._snapshot()}")
+
+    def _snapshot(self):
+        stats = dict(self.stats)
+        hits = stats["exact_hits"] + stats["semantic_hits"]
+        stats["hit_rate"] = round(hits / stats["lookups"], 3) if stats["lookups"] else 0.0
+        stats["entries"] = len(self._entries)
+        return stats
+
+    def get_stats(self):
+        with self._lock:
+            return self._snapshot()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
@@ -11,8 +11,9 @@ const sidebar = document.getElementById('sidebar');
 let attachedFile = null;
 let attachedFileSrc = null;
 let isGenerating = false;
-let chatHistory = [];
 let currentSessionId = null;
+let sessionCursor = null;      // ?before= cursor for the next older page of the open session
+let loadingOlderMessages = false;
 let selectedPlatforms = JSON.parse(localStorage.getItem('selectedPlatforms') || '[]');
 
 // --- THEME ENGINE ---
@@ -41,8 +42,8 @@ function switchTheme() {
 
 // --- RESET ---
 function startNewChat() {
-    chatHistory = []; attachedFile = null; attachedFileSrc = null; isGenerating = false;
-    currentSessionId = null;
+    attachedFile = null; attachedFileSrc = null; isGenerating = false;
+    currentSessionId = null; sessionCursor = null;
     localStorage.removeItem('lastChatSessionId');
     filePreview.style.display = 'none'; fileInput.value = ''; input.value = ''; input.style.height = 'auto'; sendBtn.disabled = true;
     chatRoot.innerHTML = `
@@ -88,7 +89,6 @@ function sendMessage() {
     if (welcome) welcome.style.display = 'none';
 
     input.value = ''; input.style.height = 'auto';
-    chatHistory.push({ role: 'user', text: text, file: fileSrc });
     attachedFile = null; attachedFileSrc = null; filePreview.style.display = 'none'; fileInput.value = '';
     sendBtn.disabled = true; isGenerating = true;
 
@@ -104,49 +104,111 @@ function sendMessage() {
         historyList.insertBefore(item, historyList.firstChild);
     }
 
-    // API Call to Groq via Django Backend
+    // API Call to Gemini via Django Backend (streamed as server-sent events)
     const loaderId = showLoader();
 
-    fetch('/api/chat/', {
+    fetch('/api/chat/stream/', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
             message: text,
-            history: chatHistory,
             session_id: currentSessionId,
             image: hasFile ? fileSrc : null
         })
     })
-        .then(res => res.json())
-        .then(data => {
-            const loader = document.getElementById(loaderId);
-            if (loader) loader.remove();
-
-            if (data.success && data.reply && data.reply.trim()) {
-                if (data.session_id) currentSessionId = data.session_id;
-                chatHistory.push({ role: 'assistant', text: data.reply });
-                streamReply(data.reply);
-                loadChatHistory(false); // Silent refresh
-            } else if (!data.success) {
-                if (data.error === "Not logged in") {
-                    window.location.href = '/';
-                } else {
-                    addMessage('ai', "Error: " + data.error);
-                }
+        .then(res => {
+            const contentType = res.headers.get('Content-Type') || '';
+            if (!contentType.includes('text/event-stream') || !res.body) {
+                // Validation errors come back as a plain JSON response
+                return res.json().then(data => handleChatError(loaderId, data.error));
             }
+            return readChatStream(res.body, loaderId);
         })
         .catch(err => {
             const loader = document.getElementById(loaderId);
             if (loader) loader.remove();
             addMessage('ai', "Network error occurred.");
+            isGenerating = false;
         })
         .finally(() => {
             validateSend();
         });
 }
 
+function handleChatError(loaderId, error) {
+    const loader = document.getElementById(loaderId);
+    if (loader) loader.remove();
+    isGenerating = false;
+    if (error === "Not logged in") {
+        window.location.href = '/';
+    } else {
+        addMessage('ai', "Error: " + error);
+    }
+}
+
+function readChatStream(body, loaderId) {
+    const reader = body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let replyText = '';
+    let contentDiv = null;
+
+    const handleEvent = (event, data) => {
+        if (event === 'delta') {
+            if (!contentDiv) {
+                const loader = document.getElementById(loaderId);
+                if (loader) loader.remove();
+                contentDiv = createReplyRow();
+            }
+            replyText += data.text;
+            renderReplyText(contentDiv, parseReplyTags(replyText).cleanText);
+            scrollToBottom();
+        } else if (event === 'done') {
+            if (data.session_id) currentSessionId = data.session_id;
+            if (!contentDiv) {
+                const loader = document.getElementById(loaderId);
+                if (loader) loader.remove();
+            }
+            finishReply(contentDiv, replyText);
+            loadChatHistory(false); // Silent refresh
+        } else if (event === 'error') {
+            if (contentDiv) contentDiv.closest('.message-row').remove();
+            handleChatError(loaderId, data.error);
+        }
+    };
+
+    const pump = () => reader.read().then(({ done, value }) => {
+        if (done) {
+            if (isGenerating) handleChatError(loaderId, "Connection closed before the reply finished.");
+            return;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            let dataLine = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) dataLine += line.slice(6);
+            });
+            if (dataLine) handleEvent(event, JSON.parse(dataLine));
+        }
+        return pump();
+    });
+    return pump();
+}
+
 function addMessage(role, text, attachment) {
-    if (!text && !attachment) return;
+    const div = buildMessageRow(role, text, attachment);
+    if (!div) return;
+    chatRoot.appendChild(div); scrollToBottom();
+    return div.id;
+}
+
+function buildMessageRow(role, text, attachment) {
+    if (!text && !attachment) return null;
     const div = document.createElement('div'); div.className = 'message-row';
 
     let contentHtml = text;
@@ -174,9 +236,7 @@ function addMessage(role, text, attachment) {
             injectTryOnButtons(contentDiv);
         }
     }
-
-    chatRoot.appendChild(div); scrollToBottom();
-    return div.id;
+    return div;
 }
 
 function showLoader() {
@@ -186,54 +246,54 @@ function showLoader() {
     chatRoot.appendChild(div); scrollToBottom(); return id;
 }
 
-function streamReply(text) {
-    if (!text) { isGenerating = false; return; }
+function parseReplyTags(text) {
     let cleanText = text;
     let needsProfile = false;
     let needsShoppingDetails = false;
 
     if (text.includes('[NEED_PROFILE_SELECTION]')) {
-        cleanText = text.replace('[NEED_PROFILE_SELECTION]', '').trim();
+        cleanText = cleanText.replace('[NEED_PROFILE_SELECTION]', '').trim();
         needsProfile = true;
     }
     if (text.includes('[NEED_SHOPPING_DETAILS]')) {
-        cleanText = text.replace('[NEED_SHOPPING_DETAILS]', '').trim();
+        cleanText = cleanText.replace('[NEED_SHOPPING_DETAILS]', '').trim();
         needsShoppingDetails = true;
     }
+    return { cleanText, needsProfile, needsShoppingDetails };
+}
 
-    if (!cleanText) {
-        if (needsProfile) injectProfileSelector();
-        if (needsShoppingDetails) injectShoppingWidget();
-        isGenerating = false;
-        return;
-    }
-
+function createReplyRow() {
     const div = document.createElement('div');
     div.className = 'message-row';
     div.innerHTML = `<div class="avatar ai"><img src="/static/core/images/company_icon.png"></div><div class="msg-content"></div>`;
     chatRoot.appendChild(div);
-    const contentDiv = div.querySelector('.msg-content');
-    let i = 0;
-    const interval = setInterval(() => {
-        if (i < cleanText.length) {
-            const chunk = cleanText.slice(0, i += 2);
-            if (window.marked && typeof window.marked.parse === 'function') {
-                contentDiv.innerHTML = window.marked.parse(chunk);
-            } else {
-                contentDiv.textContent = chunk;
-            }
-            // renderCodeBlocks(contentDiv);
-            scrollToBottom();
-        } else {
-            clearInterval(interval);
+    return div.querySelector('.msg-content');
+}
+
+function renderReplyText(contentDiv, text) {
+    if (window.marked && typeof window.marked.parse === 'function') {
+        contentDiv.innerHTML = window.marked.parse(text);
+    } else {
+        contentDiv.textContent = text;
+    }
+}
+
+function finishReply(contentDiv, text) {
+    const { cleanText, needsProfile, needsShoppingDetails } = parseReplyTags(text || '');
+    if (contentDiv) {
+        if (cleanText) {
+            renderReplyText(contentDiv, cleanText);
             renderCodeBlocks(contentDiv);
             addSuggestions(["Tell me more"]);
             injectTryOnButtons(contentDiv);
-            if (needsProfile) injectProfileSelector();
-            if (needsShoppingDetails) injectShoppingWidget();
-            isGenerating = false;
+        } else {
+            contentDiv.closest('.message-row').remove();
         }
-    }, 20);
+    }
+    if (needsProfile) injectProfileSelector();
+    if (needsShoppingDetails) injectShoppingWidget();
+    isGenerating = false;
+    scrollToBottom();
 }
 
 function injectTryOnButtons(container) {
@@ -241,6 +301,7 @@ function injectTryOnButtons(container) {
 
     const items = container.querySelectorAll('li, p');
     let lastProductFound = null;
+    const foundProducts = [];
 
     items.forEach((el, index) => {
         const strongs = el.querySelectorAll('strong');
@@ -303,6 +364,7 @@ function injectTryOnButtons(container) {
             actionGroup.className = 'product-action-bar';
 
             const prodName = lastProductFound;
+            foundProducts.push(prodName);
 
             // Magic Try-On Button
             const tryOnBtn = document.createElement('button');
@@ -335,6 +397,15 @@ function injectTryOnButtons(container) {
             lastProductFound = null; // Handled
         }
     });
+
+    // One batch request for all recommended looks (photo analyzed once server-side)
+    if (foundProducts.length > 1 && !container.querySelector('.tryon-all-pill')) {
+        const tryAllBtn = document.createElement('button');
+        tryAllBtn.className = 'magic-tryon-pill tryon-all-pill';
+        tryAllBtn.innerHTML = `<i class="ri-magic-line"></i> TRY ON ALL (${Math.min(foundProducts.length, 6)})`;
+        tryAllBtn.onclick = () => tryOnAllOutfits(foundProducts.slice(0, 6));
+        container.appendChild(tryAllBtn);
+    }
 }
 
 function generateProductPlatformUrl(itemName, platform) {
@@ -353,7 +424,8 @@ function generateProductPlatformUrl(itemName, platform) {
     return `https://www.google.com/search?tbm=shop&q=${queryEncoded}`;
 }
 
-function tryOnOutfit(itemName) {
+// Profile to try outfits on, or null after prompting the user to create/complete one
+function getTryOnProfile() {
     const profiles = JSON.parse(localStorage.getItem('user_profiles') || '[]');
     // Try to find the person based on current context or last edited, default to first
     const currentProfile = profiles.find(p => p.id === editingProfileId) || profiles[0];
@@ -362,7 +434,7 @@ function tryOnOutfit(itemName) {
         showToast("Please create a profile first to use Magic Try-On", "ri-user-add-line");
         openMeasurementModal();
         startNewProfile(); // Auto-start creation
-        return;
+        return null;
     }
 
     if (!currentProfile.photo) {
@@ -370,8 +442,14 @@ function tryOnOutfit(itemName) {
         openMeasurementModal();
         // Immediately open the edit view for this profile so user can add photo
         editProfile(currentProfile.id);
-        return;
+        return null;
     }
+    return currentProfile;
+}
+
+function tryOnOutfit(itemName) {
+    const currentProfile = getTryOnProfile();
+    if (!currentProfile) return;
 
     const overlay = document.createElement('div');
     overlay.className = 'tryon-overlay';
@@ -411,7 +489,7 @@ function tryOnOutfit(itemName) {
     `;
     document.body.appendChild(overlay);
 
-    // Call API for real image generation
+    // Submit a try-on job, then poll until the render is ready
     fetch('/api/tryon/', {
         method: 'POST',
         headers: {
@@ -424,20 +502,26 @@ function tryOnOutfit(itemName) {
         })
     })
         .then(res => res.json())
+        .then(job => {
+            // Cached renders come back finished, without a job to poll
+            if (!job.success || job.status === 'done') return job;
+            return pollTryOnJob(job.poll_url);
+        })
         .then(data => {
             const loading = document.getElementById('tryon-loading');
             const result = document.getElementById('tryon-result');
             const img = document.getElementById('result-img');
+            if (!img) return; // Overlay closed while waiting
 
             if (data.success && data.image) {
-                img.src = data.image; // Display generated base64 image
+                img.src = data.image; // Stored render served from the blob store
                 img.onload = () => {
                     loading.style.display = 'none';
                     result.style.display = 'block';
                     showToast("AI Render Complete!", "ri-magic-line");
                 };
             } else {
-                showToast("Try-on generation failed. Using reference.", "ri-error-warning-line");
+                showToast(data.reason ? data.error : "Try-on generation failed. Using reference.", "ri-error-warning-line");
                 // Fallback to placeholder if generation fails
                 loading.style.display = 'none';
                 result.style.display = 'block';
@@ -447,10 +531,103 @@ function tryOnOutfit(itemName) {
         .catch(err => {
             console.error("Try-on error:", err);
             showToast("Network error during generation", "ri-wifi-off-line");
-            document.querySelector('.tryon-overlay').remove();
+            const overlay = document.querySelector('.tryon-overlay');
+            if (overlay) overlay.remove();
+        });
+}
+
+// Try several recommended items on the profile photo in one batch; renders appear as they finish
+function tryOnAllOutfits(itemNames) {
+    const currentProfile = getTryOnProfile();
+    if (!currentProfile) return;
+
+    const overlay = document.createElement('div');
+    overlay.className = 'tryon-overlay';
+    overlay.innerHTML = `
+        <div class="tryon-content">
+            <button onclick="this.parentElement.parentElement.remove()" style="position:absolute; top:20px; right:20px; background:none; border:none; color:white; font-size:24px; cursor:pointer;"><i class="ri-close-line"></i></button>
+            <h2 style="color:var(--accent); margin:0 0 5px;">Magic AI Virtual Fit</h2>
+            <p style="color:var(--text-muted); font-size:12px; margin-bottom:20px;">Applying <strong>${itemNames.length} looks</strong> to <strong>${currentProfile.name}</strong></p>
+            <div class="tryon-view-container" style="flex-wrap:wrap;">
+                ${itemNames.map((name, i) => `
+                    <div class="tryon-item">
+                        <div class="tryon-frame" id="tryon-batch-${i}" style="display:flex; align-items:center; justify-content:center;">
+                            <div class="typing-dots"><div class="dot"></div><div class="dot"></div><div class="dot"></div></div>
+                        </div>
+                        <span class="tryon-label">${name}</span>
+                    </div>`).join('')}
+            </div>
+        </div>
+    `;
+    document.body.appendChild(overlay);
+
+    const showResult = (entry) => {
+        const frame = document.getElementById(`tryon-batch-${entry.index}`);
+        if (!frame) return;
+        frame.innerHTML = entry.image
+            ? `<img src="${entry.image}">`
+            : `<i class="ri-error-warning-line" style="font-size:28px; color:var(--text-muted);"></i>`;
+    };
+
+    fetch('/api/tryon/batch/', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            items: itemNames,
+            gender: currentProfile.category || 'men',
+            user_photo: currentProfile.photo
+        })
+    })
+        .then(res => res.json())
+        .then(job => {
+            if (!job.success) {
+                showToast(job.error || "Try-on generation failed", "ri-error-warning-line");
+                overlay.remove();
+                return;
+            }
+            const events = new EventSource(job.events_url);
+            events.addEventListener('item', (ev) => showResult(JSON.parse(ev.data)));
+            events.addEventListener('done', () => {
+                events.close();
+                showToast("AI Renders Complete!", "ri-magic-line");
+            });
+            events.addEventListener('error', () => events.close());
+        })
+        .catch(err => {
+            console.error("Try-on error:", err);
+            showToast("Network error during generation", "ri-wifi-off-line");
+            overlay.remove();
         });
 }
 
+const TRYON_POLL_INTERVAL_MS = 1500;
+const TRYON_POLL_TIMEOUT_MS = 180000;
+
+// Resolve with the job state once it is 'done' or 'failed'
+function pollTryOnJob(pollUrl) {
+    const deadline = Date.now() + TRYON_POLL_TIMEOUT_MS;
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            if (!document.querySelector('.tryon-overlay')) {
+                resolve({ success: false, cancelled: true });
+                return;
+            }
+            fetch(pollUrl)
+                .then(res => res.json())
+                .then(job => {
+                    if (!job.success || job.status === 'done' || job.status === 'failed') {
+                        resolve(job.status === 'failed' ? { ...job, success: false } : job);
+                    } else if (Date.now() > deadline) {
+                        resolve({ success: false, error: 'Try-on timed out' });
+                    } else {
+                        setTimeout(poll, TRYON_POLL_INTERVAL_MS);
+                    }
+                })
+                .catch(reject);
+        };
+        setTimeout(poll, TRYON_POLL_INTERVAL_MS);
+    });
+}
 
 function injectProfileSelector() {
     const profiles = JSON.parse(localStorage.getItem('user_profiles') || '[]');
@@ -539,18 +716,52 @@ function toggleSidebar() {
 }
 
 // --- UTILS ---
+// Match the server's normalization (IMAGE_MAX_EDGE) so full-size photos never leave the browser
+const UPLOAD_MAX_EDGE = 1536;
+const UPLOAD_JPEG_QUALITY = 0.85;
+
+function readFileAsDataURL(file) {
+    return new Promise((resolve, reject) => {
+        const r = new FileReader();
+        r.onload = (ev) => resolve(ev.target.result);
+        r.onerror = () => reject(r.error);
+        r.readAsDataURL(file);
+    });
+}
+
+// Downscale an image file to UPLOAD_MAX_EDGE and re-encode as JPEG (drops EXIF).
+// Falls back to the original file contents if the browser cannot decode it.
+async function downscaleImageFile(file) {
+    try {
+        const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+        const scale = Math.min(1, UPLOAD_MAX_EDGE / Math.max(bitmap.width, bitmap.height));
+        const canvas = document.createElement('canvas');
+        canvas.width = Math.round(bitmap.width * scale);
+        canvas.height = Math.round(bitmap.height * scale);
+        const ctx = canvas.getContext('2d');
+        ctx.fillStyle = '#fff'; // JPEG has no alpha
+        ctx.fillRect(0, 0, canvas.width, canvas.height);
+        ctx.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+        bitmap.close();
+        const resized = canvas.toDataURL('image/jpeg', UPLOAD_JPEG_QUALITY);
+        // Keep small originals that compress better than the re-encode
+        return resized.length < file.size * 1.37 ? resized : await readFileAsDataURL(file);
+    } catch (err) {
+        console.warn("Image downscale failed, sending original:", err);
+        return readFileAsDataURL(file);
+    }
+}
+
 function handleFileSelect(inputElement) {
     const file = inputElement.files[0];
     if (file) {
         attachedFile = file;
-        const r = new FileReader();
-        r.onload = (ev) => {
-            attachedFileSrc = ev.target.result;
+        downscaleImageFile(file).then(src => {
+            attachedFileSrc = src;
             filePreview.style.display = 'block';
-            filePreview.innerHTML = `<img src="${ev.target.result}" style="height:50px; border-radius:8px;">`;
+            filePreview.innerHTML = `<img src="${src}" style="height:50px; border-radius:8px;">`;
             validateSend();
-        };
-        r.readAsDataURL(file);
+        });
     }
 }
 
@@ -658,12 +869,11 @@ function startNewProfile() {
 let currentProfilePhoto = null;
 function handleProfilePhoto(input) {
     if (input.files && input.files[0]) {
-        const reader = new FileReader();
-        reader.onload = function (e) {
-            currentProfilePhoto = e.target.result;
+        // Profile photos are kept in localStorage and sent with every try-on, so store them downscaled
+        downscaleImageFile(input.files[0]).then(src => {
+            currentProfilePhoto = src;
             document.getElementById('photo-preview').innerHTML = `<img src="${currentProfilePhoto}" style="width:100%; height:100%; object-fit:cover;">`;
-        }
-        reader.readAsDataURL(input.files[0]);
+        });
     }
 }
 
@@ -1141,6 +1351,7 @@ function toggleHistoryMenu(btn, id) {
 
 function openSession(sessionId) {
     currentSessionId = sessionId;
+    sessionCursor = null;
     localStorage.setItem('lastChatSessionId', sessionId);
     fetch(`/api/chat-session/?id=${sessionId}`)
         .then(res => res.json())
@@ -1150,11 +1361,8 @@ function openSession(sessionId) {
                 if (welcome) welcome.style.display = 'none';
 
                 chatRoot.innerHTML = '';
-                chatHistory = [];
-                data.messages.forEach(m => {
-                    chatHistory.push({ role: m.role, text: m.text });
-                    addMessage(m.role, m.text);
-                });
+                data.messages.forEach(m => addMessage(m.role, m.text, m.image_url));
+                sessionCursor = data.cursor;
 
                 // Highlight active in sidebar
                 document.querySelectorAll('.history-item').forEach(item => {
@@ -1165,6 +1373,37 @@ function openSession(sessionId) {
         });
 }
 
+// Lazily load older turns of the open session when scrolled to the top
+function loadOlderMessages() {
+    if (!currentSessionId || sessionCursor === null || loadingOlderMessages) return;
+    loadingOlderMessages = true;
+    const sessionId = currentSessionId;
+    fetch(`/api/chat-session/?id=${sessionId}&before=${sessionCursor}`)
+        .then(res => res.json())
+        .then(data => {
+            if (!data.success || sessionId !== currentSessionId) return;
+            const previousHeight = scrollContainer.scrollHeight;
+            const firstRow = chatRoot.firstChild;
+            data.messages.forEach(m => {
+                const row = buildMessageRow(m.role, m.text, m.image_url);
+                if (row) chatRoot.insertBefore(row, firstRow);
+            });
+            sessionCursor = data.cursor;
+            // Keep the current view anchored while content is added above it
+            scrollContainer.scrollTop += scrollContainer.scrollHeight - previousHeight;
+        })
+        .finally(() => { loadingOlderMessages = false; });
+}
+
+if (scrollContainer) {
+    let lastScrollTop = 0;
+    scrollContainer.addEventListener('scroll', () => {
+        const scrollingUp = scrollContainer.scrollTop < lastScrollTop;
+        lastScrollTop = scrollContainer.scrollTop;
+        if (scrollingUp && scrollContainer.scrollTop < 150) loadOlderMessages();
+    });
+}
+
 function deleteChat(id) {
     if (!confirm("Are you sure you want to delete this chat?")) return;
     fetch('/api/delete-chat/', {
@@ -1311,6 +1550,7 @@ window.injectShoppingWidget = injectShoppingWidget;
 window.toggleChoice = toggleChoice;
 window.confirmShoppingPreferences = confirmShoppingPreferences;
 window.tryOnOutfit = tryOnOutfit;
+window.tryOnAllOutfits = tryOnAllOutfits;
 window.injectTryOnButtons = injectTryOnButtons;
 window.toggleHistoryMenu = toggleHistoryMenu;
 window.openSession = openSession;
@@ -1,3 +1,282 @@
-from django.test import TestCase
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from . import context_builder, tryon_jobs, views
+from .context_builder import build_context, needs_summary, refresh_summary, summary_target
+from .intent_router import IntentRouter
+from .prompt_cache import PROMPT_CACHE_REFRESH_MARGIN, PromptCache
+
+try:
+    import mongomock
+except ImportError:  # Optional; only the MongoDB-backed tests need it
+    mongomock = None
+
+
+class IntentRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = IntentRouter()
+
+    def test_women_is_not_matched_as_men(self):
+        # The old substring scan found "men" inside "women" and routed to men's trends
+        result = self.router.classify("What's trending in women's fashion right now?")
+        self.assertEqual(result.categories, ["women"])
+        self.assertIn("trends", result.intents)
+
+    def test_women_trends_plan(self):
+        calls = self.router.plan("Latest trends for women")
+        self.assertEqual([(c.tool, c.arguments) for c in calls],
+                         [("get_fashion_trends", {"category": "women"})])
+
+    def test_both_categories_in_order_of_mention(self):
+        result = self.router.classify("Hot trends for ladies and guys this fall")
+        self.assertEqual(result.categories, ["women", "men"])
+        self.assertEqual(result.seasons, ["autumn"])
+
+    def test_everyday_words_do_not_trigger_tools(self):
+        for message in [
+            "Will this work?",
+            "I fall for this dress every time",
+            "It is too hot to think",
+            "Sorry I missed the events last week",
+            "That's none of your business",
+            "My current jacket is blue",
+        ]:
+            with self.subTest(message=message):
+                self.assertEqual(self.router.plan(message), [])
+
+    def test_everyday_words_match_in_context(self):
+        self.assertEqual(self.router.classify("Outfits for work").occasions, ["office"])
+        self.assertEqual(self.router.classify("Fall outfits for men").seasons, ["autumn"])
+        self.assertIn("trends", self.router.classify("What's hot for women?").intents)
+        self.assertEqual(self.router.classify("Business casual ideas").occasions, ["formal"])
+
+
+class _FakeCaches:
+    def __init__(self):
+        self.created, self.updated = [], []
+        self.fail_create = self.fail_update = False
+
+    async def create(self, model, config):
+        if self.fail_create:
+            raise RuntimeError("create failed")
+        self.created.append(model)
+        return SimpleNamespace(name=f"cachedContents/{len(self.created)}")
+
+    async def update(self, name, config):
+        if self.fail_update:
+            raise RuntimeError("404 not found")
+        self.updated.append(name)
+
+
+@mock.patch('core.prompt_cache.PROMPT_CACHE_ENABLED', True)
+@mock.patch('core.prompt_cache.PROMPT_CACHE_MIN_TOKENS', 1)
+class PromptCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = PromptCache()
+        self.caches = _FakeCaches()
+        self.client = SimpleNamespace(caches=self.caches)
+
+    async def test_below_minimum_is_sent_inline(self):
+        with mock.patch('core.prompt_cache.PROMPT_CACHE_MIN_TOKENS', 10_000):
+            self.assertIsNone(await self.cache.get(self.client, 'model', 'prompt'))
+        self.assertEqual(self.caches.created, [])
+        self.assertEqual(self.cache.stats['too_small'], 1)
+
+    async def test_creates_once_then_hits(self):
+        name = await self.cache.get(self.client, 'model', 'prompt')
+        self.assertEqual(name, 'cachedContents/1')
+        self.assertEqual(await self.cache.get(self.client, 'model', 'prompt'), name)
+        self.assertEqual(self.caches.created, ['model'])
+        self.assertEqual(self.cache.stats['hits'], 1)
+
+    async def test_refreshes_near_expiry(self):
+        name = await self.cache.get(self.client, 'model', 'prompt')
+        self._expire_in(PROMPT_CACHE_REFRESH_MARGIN / 2)
+        self.assertEqual(await self.cache.get(self.client, 'model', 'prompt'), name)
+        self.assertEqual(self.caches.updated, [name])
+
+    async def test_failed_refresh_creates_a_new_cache(self):
+        await self.cache.get(self.client, 'model', 'prompt')
+        self._expire_in(PROMPT_CACHE_REFRESH_MARGIN / 2)
+        self.caches.fail_update = True
+        self.assertEqual(await self.cache.get(self.client, 'model', 'prompt'), 'cachedContents/2')
+
+    async def test_failed_create_backs_off(self):
+        self.caches.fail_create = True
+        self.assertIsNone(await self.cache.get(self.client, 'model', 'prompt'))
+        self.caches.fail_create = False
+        self.assertIsNone(await self.cache.get(self.client, 'model', 'prompt'))
+        self.assertEqual(self.caches.created, [])
+        self.assertEqual(self.cache.stats['fallbacks'], 1)
+
+    async def test_invalidated_handle_is_recreated(self):
+        name = await self.cache.get(self.client, 'model', 'prompt')
+        self.cache.invalidate(name)
+        self.assertEqual(await self.cache.get(self.client, 'model', 'prompt'), 'cachedContents/2')
+
+    def _expire_in(self, seconds):
+        for entry in self.cache._entries.values():
+            entry['expires_at'] = time.monotonic() + seconds
+
+
+class ChatGenerationFallbackTests(SimpleTestCase):
+    """A rejected cached prompt is dropped and the request retried inline."""
+
+    def setUp(self):
+        self.invalidated = []
+        patches = [
+            mock.patch.object(views.prompt_cache, 'get', mock.AsyncMock(return_value='cachedContents/stale')),
+            mock.patch.object(views.prompt_cache, 'invalidate', self.invalidated.append),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_stream_retries_when_first_chunk_fails(self):
+        async def generate_content_stream(model, contents, config):
+            async def chunks():
+                if config.cached_content:
+                    raise RuntimeError("403 cached content not found")
+                for text in ("a", "b"):
+                    yield SimpleNamespace(text=text)
+            return chunks()
+
+        client = SimpleNamespace(models=SimpleNamespace(generate_content_stream=generate_content_stream))
+        stream = await views._generate_chat(client, [], stream=True)
+        self.assertEqual([chunk.text async for chunk in stream], ["a", "b"])
+        self.assertEqual(self.invalidated, ['cachedContents/stale'])
+
+    async def test_non_stream_retries(self):
+        async def generate_content(model, contents, config):
+            if config.cached_content:
+                raise RuntimeError("403 cached content not found")
+            return SimpleNamespace(text="ok")
+
+        client = SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))
+        self.assertEqual((await views._generate_chat(client, [])).text, "ok")
+        self.assertEqual(self.invalidated, ['cachedContents/stale'])
+
+
+def _messages(start, end):
+    return [{'role': 'user' if i % 2 == 0 else 'model', 'text': f"message {i}"} for i in range(start, end)]
+
+
+class ContextWindowTests(SimpleTestCase):
+    def test_window_starts_where_summary_ends(self):
+        # Stored history holds messages 4..9; the summary covers 0..6
+        built = build_context("system", _messages(4, 10), 10, "hi",
+                              summary={'text': "earlier", 'covers': 7}, budget=10_000)
+        self.assertEqual(built.summary, "earlier")
+        self.assertEqual(built.first_index, 7)
+        self.assertEqual([m['text'] for m in built.history], ["message 7", "message 8", "message 9"])
+        self.assertFalse(needs_summary(built, {'covers': 7}))
+
+    def test_summary_over_budget_keeps_covered_messages(self):
+        built = build_context("system", _messages(4, 10), 10, "hi",
+                              summary={'text': "x" * 400, 'covers': 7}, budget=60)
+        self.assertIsNone(built.summary)
+        # Without the summary, messages it covered are sent verbatim again
+        self.assertLess(built.first_index, 7)
+        self.assertEqual(built.history[0]['text'], f"message {built.first_index}")
+
+    def test_gap_after_summary_needs_refresh(self):
+        # A tight budget drops message 7 onwards from the window, which the summary does not cover
+        built = build_context("system", _messages(4, 10), 10, "hi",
+                              summary={'text': "earlier", 'covers': 7}, budget=20)
+        self.assertGreater(built.first_index, 7)
+        self.assertTrue(needs_summary(built, {'covers': 7}))
+        self.assertTrue(needs_summary(built, None))
+
+    def test_summary_target_takes_at_most_half_the_window(self):
+        built = build_context("system", _messages(0, 4), 4, "hi", budget=10_000)
+        self.assertEqual(summary_target(built), 2)
+
+
+@unittest.skipUnless(mongomock, "mongomock is not installed")
+class RefreshSummaryTests(SimpleTestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient().db
+        self.db['chat_sessions'].insert_one({
+            'user_email': 'a@example.com', 'session_id': 's1',
+            'messages': _messages(0, 10), 'context_summary': {'text': "earlier", 'covers': 4},
+        })
+        self.prompts = []
+
+        def generate_content(model, contents, config):
+            self.prompts.append(contents)
+            return SimpleNamespace(text="summary")
+
+        client = SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))
+        patches = [
+            mock.patch.object(context_builder, 'get_db', return_value=self.db),
+            mock.patch.object(context_builder, 'get_gemini_client', return_value=client),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def summary(self):
+        return self.db['chat_sessions'].find_one({'session_id': 's1'})['context_summary']
+
+    def test_covers_only_the_messages_summarized(self):
+        # Asks past the end of the stored session: the turns not saved yet are not covered
+        refresh_summary('a@example.com', 's1', 14)
+        self.assertEqual(self.summary(), {'text': "summary", 'covers': 10})
+        self.assertNotIn("message 3", self.prompts[0])
+        self.assertIn("message 4", self.prompts[0])
+
+    def test_already_covered_is_skipped(self):
+        refresh_summary('a@example.com', 's1', 4)
+        self.assertEqual(self.prompts, [])
+        self.assertEqual(self.summary()['covers'], 4)
+
+
+@unittest.skipUnless(mongomock, "mongomock is not installed")
+class TryOnSlotTests(SimpleTestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient().db
+        self.now = datetime.now(timezone.utc)
+
+    def claim(self, job_id, user_email='a@example.com', now=None):
+        return tryon_jobs._claim_slot(self.db, user_email, job_id, now or self.now)
+
+    def test_concurrent_claims_stop_at_the_limit(self):
+        results = []
+        start = threading.Barrier(8)
+
+        def claim(job_id):
+            start.wait()
+            results.append(self.claim(job_id))
+
+        threads = [threading.Thread(target=claim, args=(f"job-{i}",)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), tryon_jobs.TRYON_MAX_JOBS_PER_USER)
+        slots = self.db[tryon_jobs.SLOTS_COLLECTION].find_one({'_id': 'a@example.com'})
+        self.assertEqual(len(slots['active']), tryon_jobs.TRYON_MAX_JOBS_PER_USER)
+
+    def test_release_frees_a_slot(self):
+        for i in range(tryon_jobs.TRYON_MAX_JOBS_PER_USER):
+            self.assertTrue(self.claim(f"job-{i}"))
+        self.assertFalse(self.claim("job-extra"))
+        tryon_jobs._release_slot(self.db, 'a@example.com', "job-0")
+        self.assertTrue(self.claim("job-extra"))
+
+    def test_stale_slots_are_reclaimed(self):
+        stale = self.now - timedelta(seconds=tryon_jobs.TRYON_JOB_TIMEOUT + 1)
+        for i in range(tryon_jobs.TRYON_MAX_JOBS_PER_USER):
+            self.assertTrue(self.claim(f"job-{i}", now=stale))
+        self.assertTrue(self.claim("job-new"))
+
+    def test_users_have_separate_slots(self):
+        for i in range(tryon_jobs.TRYON_MAX_JOBS_PER_USER):
+            self.assertTrue(self.claim(f"job-{i}"))
+        self.assertTrue(self.claim("job-b", user_email='b@example.com'))
@@ -0,0 +1,333 @@
+"""
+Try-on backend registry for Opuluxe AI
+Routes Magic Try-On calls across image backends (Gemini/Imagen, OpenAI/DALL-E)
+in a configurable order, with per-backend timeouts, circuit breakers and
+optional hedged requests
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from .photo_analysis_cache import photo_analysis_cache
+from .utils_images import normalize_data_url
+
+# Backend names in preference order; unknown or unconfigured ones are skipped
+TRYON_BACKENDS = [name.strip() for name in os.getenv("TRYON_BACKENDS", "gemini,openai").split(",") if name.strip()]
+# Seconds before a backend call is abandoned (TRYON_TIMEOUT_<NAME> overrides per backend)
+TRYON_BACKEND_TIMEOUT = float(os.getenv("TRYON_BACKEND_TIMEOUT", "60"))
+# Consecutive failures that open a backend's circuit, and how long it stays open
+TRYON_BREAKER_THRESHOLD = int(os.getenv("TRYON_BREAKER_THRESHOLD", "5"))
+TRYON_BREAKER_COOLDOWN = float(os.getenv("TRYON_BREAKER_COOLDOWN", "60"))
+# Start the next backend when the current one is slower than its p95
+TRYON_HEDGE = os.getenv("TRYON_HEDGE", "false").lower() in ("1", "true", "yes")
+# Successful calls needed before a backend's p95 is trusted for hedging
+TRYON_HEDGE_MIN_SAMPLES = int(os.getenv("TRYON_HEDGE_MIN_SAMPLES", "10"))
+TRYON_BACKEND_WORKERS = int(os.getenv("TRYON_BACKEND_WORKERS", "16"))
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed: calls flow. open: calls are refused until the cooldown passes.
+    half-open: one trial call is let through; its outcome closes or reopens.
+    """
+
+    def __init__(self, threshold=TRYON_BREAKER_THRESHOLD, cooldown=TRYON_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return "open"
+            return "half-open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class TryOnBackend:
+    """
+    One try-on provider.
+
+    Args:
+        name (str): Registry name, as used in TRYON_BACKENDS
+        analyze (callable): analyze(image_bytes, mime_type) -> photo description; raises on failure
+        analysis_model (str): Vision model analyze uses, part of the analysis cache key
+        analysis_prompt (str): Prompt analyze uses, part of the analysis cache key
+        render (callable): render(item_name, gender, photo_description) -> data URL or None
+        is_configured (callable): Returns True when credentials are present
+        timeout (float): Seconds before a call is abandoned
+    """
+
+    def __init__(self, name, analyze, analysis_model, analysis_prompt, render, is_configured, timeout=None):
+        self.name = name
+        self.analyze = analyze
+        self.analysis_model = analysis_model
+        self.analysis_prompt = analysis_prompt
+        self.render = render
+        self.is_configured = is_configured
+        self.timeout = timeout or float(os.getenv(f"TRYON_TIMEOUT_{name.upper()}", str(TRYON_BACKEND_TIMEOUT)))
+        self.breaker = CircuitBreaker()
+        self._latencies = deque(maxlen=100)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "successes": 0, "failures": 0, "timeouts": 0, "rejected": 0,
+                      "hedges_started": 0, "hedge_wins": 0}
+
+    def count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def record(self, ok, elapsed):
+        with self._lock:
+            self.stats["successes" if ok else "failures"] += 1
+            if ok:
+                self._latencies.append(elapsed)
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def p95(self):
+        """95th percentile latency of recent successful calls, or None with too few samples."""
+        with self._lock:
+            if len(self._latencies) < TRYON_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def get_stats(self):
+        p95 = self.p95()
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update(state=self.breaker.state, timeout_s=self.timeout,
+                     p95_ms=round(p95 * 1000) if p95 is not None else None)
+        return stats
+
+
+class _Attempt:
+    """A backend call in flight; abandoned once it times out or loses a race."""
+
+    def __init__(self, backend, future, hedge=False):
+        self.backend = backend
+        self.future = future
+        self.hedge = hedge
+        self.started = time.monotonic()
+        self.deadline = self.started + backend.timeout
+
+
+class TryOnBackendRegistry:
+    """
+    Ordered set of try-on backends.
+
+    render() tries backends in order, falling back on failure, timeout or an
+    open circuit. With hedging enabled, the next backend is also started
+    once the current one runs past its own p95, and the first image wins.
+    """
+
+    def __init__(self):
+        self._backends = {}
+        self._executor = ThreadPoolExecutor(max_workers=TRYON_BACKEND_WORKERS, thread_name_prefix="opuluxe-tryon-backend")
+
+    def register(self, backend):
+        self._backends[backend.name] = backend
+
+    def ordered(self):
+        """Configured backends in TRYON_BACKENDS order."""
+        return [self._backends[name] for name in TRYON_BACKENDS
+                if name in self._backends and self._backends[name].is_configured()]
+
+    def describe_photo(self, original_photo_data, gender):
+        """
+        Describe the user's photo with the first backend that answers in time.
+
+        The photo is normalized once for every backend. Failures count
+        against the backend's breaker and fall through to the next backend;
+        a generic description is used only once all have failed.
+
+        Raises:
+            ValueError: The photo is not a usable image
+        """
+        # Decode, downsize and strip EXIF; also gives the real MIME type
+        image_bytes, mime_type = normalize_data_url(original_photo_data)
+
+        for backend in self.ordered():
+            # Analysis never takes the breaker's half-open trial; render() does
+            if backend.breaker.state == "open":
+                continue
+            future = self._executor.submit(self._analyze, backend, image_bytes, mime_type)
+            try:
+                description = future.result(timeout=backend.timeout)
+                backend.breaker.record_success()
+                return description
+            except FutureTimeoutError:
+                print(f"[Try-On Backends] {backend.name} photo analysis timed out")
+                backend.count("timeouts")
+                backend.record(False, backend.timeout)
+            except Exception as e:
+                print(f"[Try-On Backends] {backend.name} photo analysis failed: {e}")
+                backend.record(False, 0)
+        print("[Try-On Backends] Photo analysis unavailable on every backend, using a generic description")
+        return f"A {gender} person in a neutral pose"
+
+    @staticmethod
+    def _analyze(backend, image_bytes, mime_type):
+        def analyze():
+            description = backend.analyze(image_bytes, mime_type)
+            if not description:
+                raise RuntimeError("Empty analysis")
+            return description
+
+        # Repeat photos (same person, different items) reuse the cached analysis
+        description = photo_analysis_cache.get_or_analyze(
+            image_bytes, backend.analysis_model, backend.analysis_prompt, analyze
+        )
+        print(f"[Try-On Backends] {backend.name} photo analysis: {description[:100]}...")
+        return description
+
+    def render_tryon_image(self, item_name, gender, photo_description=None):
+        """
+        Render one try-on image.
+
+        Returns:
+            str: Base64 data URL from the first backend to succeed, or None
+        """
+        remaining = iter(self.ordered())
+        attempts = []
+        hedged = False
+
+        def start_next(hedge=False):
+            for backend in remaining:
+                if not backend.breaker.allow():
+                    backend.count("rejected")
+                    continue
+                backend.count("calls")
+                if hedge:
+                    backend.count("hedges_started")
+                    print(f"[Try-On Backends] Hedging '{item_name}' on {backend.name}")
+                future = self._executor.submit(backend.render, item_name, gender, photo_description)
+                attempts.append(_Attempt(backend, future, hedge))
+                return True
+            return False
+
+        if not start_next():
+            print("[Try-On Backends] No try-on backend available")
+            return None
+
+        while attempts:
+            now = time.monotonic()
+            wake_at = min(a.deadline for a in attempts)
+            hedge_at = None
+            if TRYON_HEDGE and not hedged and len(attempts) == 1:
+                p95 = attempts[0].backend.p95()
+                if p95 is not None:
+                    hedge_at = attempts[0].started + p95
+                    wake_at = min(wake_at, hedge_at)
+
+            done, _ = wait([a.future for a in attempts], timeout=max(wake_at - now, 0), return_when=FIRST_COMPLETED)
+
+            for attempt in [a for a in attempts if a.future in done]:
+                attempts.remove(attempt)
+                backend = attempt.backend
+                try:
+                    image = attempt.future.result()
+                except Exception as e:
+                    print(f"[Try-On Backends] {backend.name} render failed: {e}")
+                    image = None
+                backend.record(bool(image), time.monotonic() - attempt.started)
+                if image:
+                    if attempt.hedge:
+                        backend.count("hedge_wins")
+                    for loser in attempts:
+                        # Still account for the losing call so its breaker and p95 stay accurate
+                        loser.future.add_done_callback(lambda f, loser=loser: loser.backend.record(
+                            not f.exception() and bool(f.result()), time.monotonic() - loser.started))
+                    return image
+                if not attempts:
+                    start_next()
+
+            now = time.monotonic()
+            for attempt in [a for a in attempts if now >= a.deadline]:
+                # The thread keeps running, but its result is ignored
+                attempts.remove(attempt)
+                print(f"[Try-On Backends] {attempt.backend.name} timed out after {attempt.backend.timeout:.0f}s")
+                attempt.backend.count("timeouts")
+                attempt.backend.record(False, attempt.backend.timeout)
+                if not attempts:
+                    start_next()
+
+            if hedge_at is not None and not hedged and attempts and now >= hedge_at:
+                hedged = True
+                start_next(hedge=True)
+
+        return None
+
+    def generate_tryon_image(self, item_name, gender, original_photo_data=None):
+        """Describe the user's photo (if there is one) and render the item on them."""
+        try:
+            photo_description = self.describe_photo(original_photo_data, gender) if original_photo_data else None
+        except ValueError as e:
+            print(f"[Try-On Backends] Invalid photo: {e}")
+            return None
+        return self.render_tryon_image(item_name, gender, photo_description)
+
+    def get_stats(self):
+        return {
+            "order": [backend.name for backend in self.ordered()],
+            "hedging": TRYON_HEDGE,
+            "backends": {name: backend.get_stats() for name, backend in self._backends.items()},
+        }
+
+
+def _gemini_backend():
+    from . import utils_gemini
+    return TryOnBackend("gemini", utils_gemini.analyze_photo, utils_gemini.ANALYSIS_MODEL,
+                        utils_gemini.ANALYSIS_PROMPT, utils_gemini.render_tryon_image,
+                        lambda: bool(os.getenv("GEMINI_API_KEY")) and not os.getenv("GEMINI_API_KEY").startswith("sk-"))
+
+
+def _openai_backend():
+    from . import utils_openai
+    return TryOnBackend("openai", utils_openai.analyze_photo, utils_openai.ANALYSIS_MODEL,
+                        utils_openai.ANALYSIS_PROMPT, utils_openai.render_tryon_image,
+                        lambda: bool(utils_openai.get_api_key()))
+
+
+tryon_backends = TryOnBackendRegistry()
+tryon_backends.register(_gemini_backend())
+tryon_backends.register(_openai_backend())
+
+describe_photo = tryon_backends.describe_photo
+render_tryon_image = tryon_backends.render_tryon_image
+generate_tryon_image = tryon_backends.generate_tryon_image
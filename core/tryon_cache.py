@@ -0,0 +1,196 @@
+"""
+Generated try-on image cache for Opuluxe AI
+Maps (item, gender, photo hash) to a rendered image in the blob store so
+repeat try-ons are served instantly, with size-bounded LRU eviction of
+cache entries
+"""
+
+import hashlib
+import os
+import threading
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+from . import blob_store
+from .mongodb import get_db
+
+TRYON_CACHE_ENABLED = os.getenv("TRYON_CACHE", "true").lower() in ("1", "true", "yes")
+# Total size of the renders the cache keeps entries for before the least
+# recently used entries are evicted
+TRYON_CACHE_MAX_BYTES = int(os.getenv("TRYON_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# How long a request waits for an identical render already in progress
+TRYON_CACHE_WAIT = float(os.getenv("TRYON_CACHE_WAIT", "120"))
+
+RENDERS_COLLECTION = 'tryon_renders'
+# {'_id': 'renders', 'bytes': total size of tryon_renders entries}, shared by all processes
+META_COLLECTION = 'tryon_cache_meta'
+
+
+def photo_hash(photo_data_url):
+    """SHA-256 of the decoded photo bytes, or 'none' without a photo."""
+    if not photo_data_url:
+        return "none"
+    data, _ = blob_store.decode_data_url(photo_data_url)
+    return hashlib.sha256(data or photo_data_url.encode("utf-8")).hexdigest()
+
+
+def render_key(item_name, gender, photo_digest):
+    item = " ".join((item_name or "").lower().split())
+    return hashlib.sha256(f"{item}\n{(gender or '').lower()}\n{photo_digest}".encode("utf-8")).hexdigest()
+
+
+class TryOnRenderCache:
+    """
+    Content-addressed cache of generated try-on images.
+
+    Entries in tryon_renders point at GridFS images, so identical renders
+    are stored once. Identical renders in flight in this process are
+    collapsed onto one backend call.
+
+    Eviction only removes cache entries. The images stay in the blob store,
+    where job results, chat messages and every user the render was served
+    to may still read them.
+    """
+
+    def __init__(self, max_bytes=TRYON_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get(self, key, owner_email, db=None):
+        """
+        Look up a cached render and grant owner_email access to it.
+
+        Returns:
+            str: Blob store image id, or None
+        """
+        if not TRYON_CACHE_ENABLED:
+            return None
+        db = db if db is not None else get_db()
+        if db is None:
+            return None
+        try:
+            entry = db[RENDERS_COLLECTION].find_one_and_update(
+                {'_id': key}, {'$set': {'last_used': datetime.now(timezone.utc)}}, projection={'image_id': 1}
+            )
+            if entry is None:
+                return None
+            if not blob_store.add_owner(entry['image_id'], owner_email, db=db):
+                # Blob was removed underneath the entry
+                db[RENDERS_COLLECTION].delete_one({'_id': key})
+                return None
+        except PyMongoError as e:
+            print(f"[Try-On Cache] Lookup failed: {e}")
+            self._count("errors")
+            return None
+        self._count("hits")
+        return entry['image_id']
+
+    def get_or_render(self, key, owner_email, render, db=None):
+        """
+        Return a cached render, or run render() once and cache its result.
+
+        Args:
+            key (str): render_key() of the request
+            owner_email (str): User the image is served to
+            render (callable): Returns a base64 image data URL or None
+
+        Returns:
+            str: Blob store image id, or None if rendering failed
+        """
+        db = db if db is not None else get_db()
+        image_id = self.get(key, owner_email, db=db)
+        if image_id:
+            return image_id
+
+        with self._lock:
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                self._inflight[key] = threading.Event()
+        if waiter is not None:
+            self._count("coalesced")
+            waiter.wait(TRYON_CACHE_WAIT)
+            image_id = self.get(key, owner_email, db=db)
+            if image_id:
+                return image_id
+            # The other render failed (or is too slow); render independently
+            return self._render_and_store(key, owner_email, render, db)
+
+        try:
+            return self._render_and_store(key, owner_email, render, db)
+        finally:
+            with self._lock:
+                event = self._inflight.pop(key)
+            event.set()
+
+    def _render_and_store(self, key, owner_email, render, db):
+        self._count("misses")
+        image_data = render()
+        if not image_data:
+            return None
+        data, content_type = blob_store.decode_data_url(image_data)
+        if not data:
+            return None
+        image_id = blob_store.save_image(data, content_type, owner_email, db=db)
+        if image_id and TRYON_CACHE_ENABLED and db is not None:
+            self._store(db, key, image_id, len(data))
+        return image_id
+
+    def _store(self, db, key, image_id, size):
+        now = datetime.now(timezone.utc)
+        try:
+            previous = db[RENDERS_COLLECTION].find_one_and_update(
+                {'_id': key},
+                {'$set': {'image_id': image_id, 'size': size, 'last_used': now}, '$setOnInsert': {'created_at': now}},
+                projection={'size': 1},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+            self._count("stores")
+            total = self._add_bytes(db, size - ((previous or {}).get('size') or 0))
+            if total > self.max_bytes:
+                self._evict(db, total)
+        except PyMongoError as e:
+            print(f"[Try-On Cache] Store failed: {e}")
+            self._count("errors")
+
+    def _add_bytes(self, db, delta):
+        """Apply delta to the shared total size of cached renders and return the new total."""
+        meta = db[META_COLLECTION]
+        doc = meta.find_one_and_update({'_id': 'renders'}, {'$inc': {'bytes': delta}},
+                                       return_document=ReturnDocument.AFTER)
+        if doc is not None:
+            return doc['bytes']
+        # No counter yet: seed it once from the entries (including the one just stored)
+        total = next(db[RENDERS_COLLECTION].aggregate([{'$group': {'_id': None, 'bytes': {'$sum': '$size'}}}]),
+                     {}).get('bytes', 0)
+        meta.update_one({'_id': 'renders'}, {'$setOnInsert': {'bytes': total}}, upsert=True)
+        return total
+
+    def _evict(self, db, total):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        renders = db[RENDERS_COLLECTION]
+        for entry in renders.find({}, {'size': 1}).sort('last_used', 1):
+            if total <= self.max_bytes:
+                break
+            # Another process may be evicting the same entry; only the one that deletes it counts it
+            if renders.delete_one({'_id': entry['_id']}).deleted_count:
+                total = self._add_bytes(db, -(entry.get('size') or 0))
+                self._count("evictions")
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+tryon_cache = TryOnRenderCache()
@@ -0,0 +1,358 @@
+"""
+Asynchronous Magic Try-On jobs for Opuluxe AI
+Runs the analysis + Imagen pipeline on a bounded worker pool instead of the
+request thread; job state lives in MongoDB and results in the blob store
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from .mongodb import get_db
+from .tryon_backends import describe_photo, generate_tryon_image, render_tryon_image
+from .tryon_cache import photo_hash, render_key, tryon_cache
+
+# Concurrent try-on pipelines per worker process
+TRYON_WORKERS = int(os.getenv("TRYON_WORKERS", "4"))
+# Jobs waiting for a free pipeline before submissions are rejected
+TRYON_MAX_QUEUE = int(os.getenv("TRYON_MAX_QUEUE", "32"))
+# Queued or running jobs allowed per user
+TRYON_MAX_JOBS_PER_USER = int(os.getenv("TRYON_MAX_JOBS_PER_USER", "2"))
+# Jobs whose worker has not reported in for this long are reported as failed,
+# and their per-user slot is freed (e.g. their worker process died). Workers
+# report every third of this while a job is queued or running, so it bounds
+# how long a dead job is noticed, not how long a job may take.
+TRYON_JOB_TIMEOUT = int(os.getenv("TRYON_JOB_TIMEOUT", "180"))
+# Items accepted in one batch request
+TRYON_BATCH_MAX_ITEMS = int(os.getenv("TRYON_BATCH_MAX_ITEMS", "6"))
+# Concurrent image generations per batch, and across all batches in the process
+TRYON_BATCH_CONCURRENCY = int(os.getenv("TRYON_BATCH_CONCURRENCY", "3"))
+TRYON_RENDER_CONCURRENCY = int(os.getenv("TRYON_RENDER_CONCURRENCY", "8"))
+
+JOBS_COLLECTION = 'tryon_jobs'
+# One document per user: {'_id': user_email, 'active': [{'job_id', 'at'}]}
+SLOTS_COLLECTION = 'tryon_user_slots'
+ACTIVE_STATUSES = ['queued', 'running']
+
+
+class TryOnQueueFull(Exception):
+    """Raised when a job cannot be accepted; .reason is 'queue_full' or 'user_limit'."""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+class TryOnJobQueue:
+    """
+    Bounded try-on worker pool with per-user limits.
+
+    Queue depth is tracked in-process; per-user limits are claimed
+    atomically in MongoDB so they hold across worker processes. A heartbeat
+    thread keeps the jobs and slots of this process fresh while they are
+    queued or running.
+    """
+
+    def __init__(self, workers=TRYON_WORKERS, max_queue=TRYON_MAX_QUEUE):
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="opuluxe-tryon")
+        # Shared by all batches, so it also caps concurrent Imagen calls per process
+        self._render_executor = ThreadPoolExecutor(max_workers=TRYON_RENDER_CONCURRENCY,
+                                                   thread_name_prefix="opuluxe-tryon-render")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        # job_id -> user_email for jobs queued or running in this process
+        self._active = {}
+        self._heartbeat = None
+        self.stats = {
+            "submitted": 0, "completed": 0, "failed": 0, "rejected_queue_full": 0,
+            "rejected_user_limit": 0, "total_wait_ms": 0.0, "total_run_ms": 0.0,
+        }
+
+    def submit(self, user_email, item_name, gender, user_photo=None, db=None):
+        """
+        Create a job and schedule it.
+
+        Returns:
+            str: Job id
+
+        Raises:
+            TryOnQueueFull: Too many queued jobs in this process, or for this user
+            RuntimeError: Database unavailable
+        """
+        return self._enqueue(user_email, {'item': item_name, 'gender': gender}, db,
+                             self._run, item_name, gender, user_photo)
+
+    def submit_batch(self, user_email, items, gender, user_photo=None, db=None):
+        """
+        Create one job that tries several items on the same photo.
+
+        The photo is analyzed once; the image generations then run
+        concurrently, TRYON_BATCH_CONCURRENCY at a time. The batch counts as
+        a single job towards the per-user limit.
+
+        Returns:
+            str: Job id
+
+        Raises:
+            TryOnQueueFull, RuntimeError: as for submit()
+        """
+        doc = {
+            'kind': 'batch',
+            'gender': gender,
+            'items': [{'item': item, 'status': 'queued'} for item in items],
+        }
+        return self._enqueue(user_email, doc, db, self._run_batch, list(items), gender, user_photo)
+
+    def _enqueue(self, user_email, doc, db, run, *args):
+        db = db if db is not None else get_db()
+        if db is None:
+            raise RuntimeError("Database not connected")
+
+        with self._lock:
+            # Reserve the queue place now, so concurrent submits cannot overfill it
+            if self._queued >= self.max_queue:
+                self.stats["rejected_queue_full"] += 1
+                raise TryOnQueueFull('queue_full', "Try-on queue is full, please retry shortly")
+            self._queued += 1
+
+        now = datetime.now(timezone.utc)
+        job_id = os.urandom(12).hex()
+        try:
+            if not _claim_slot(db, user_email, job_id, now):
+                with self._lock:
+                    self.stats["rejected_user_limit"] += 1
+                raise TryOnQueueFull('user_limit', "Please wait for your current try-on to finish")
+            try:
+                db[JOBS_COLLECTION].insert_one({
+                    '_id': job_id,
+                    'user_email': user_email,
+                    'status': 'queued',
+                    'created_at': now,
+                    'heartbeat_at': now,
+                    **doc,
+                })
+            except PyMongoError:
+                _release_slot(db, user_email, job_id)
+                raise
+        except Exception:
+            with self._lock:
+                self._queued -= 1
+            raise
+        with self._lock:
+            self.stats["submitted"] += 1
+            self._active[job_id] = user_email
+            self._start_heartbeat()
+        self._executor.submit(self._track, run, job_id, user_email, *args, queued_at=time.perf_counter())
+        print(f"[Try-On Jobs] Queued {job_id} (depth {self._queued})")
+        return job_id
+
+    def _track(self, run, job_id, user_email, *args, queued_at):
+        """Run a job body with queue accounting and record its final status."""
+        started = time.perf_counter()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self.stats["total_wait_ms"] += (started - queued_at) * 1000
+
+        db = get_db()
+        status, update = 'failed', {'error': 'Generation failed'}
+        try:
+            if db is not None:
+                db[JOBS_COLLECTION].update_one(
+                    {'_id': job_id}, {'$set': {'status': 'running', 'started_at': datetime.now(timezone.utc)}}
+                )
+            status, update = run(db, job_id, user_email, *args)
+        except Exception as e:
+            print(f"[Try-On Jobs] Job {job_id} failed: {e}")
+            update = {'error': str(e)}
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._running -= 1
+                self.stats["completed" if status == 'done' else "failed"] += 1
+                self.stats["total_run_ms"] += elapsed_ms
+            if db is not None:
+                try:
+                    db[JOBS_COLLECTION].update_one({'_id': job_id}, {'$set': {
+                        'status': status, 'finished_at': datetime.now(timezone.utc), **update
+                    }})
+                except PyMongoError as e:
+                    print(f"[Try-On Jobs] Could not record result of {job_id}: {e}")
+            with self._lock:
+                self._active.pop(job_id, None)
+            if db is not None:
+                _release_slot(db, user_email, job_id)
+            print(f"[Try-On Jobs] {job_id} {status} in {elapsed_ms:.0f} ms")
+
+    def _start_heartbeat(self):
+        # Called with self._lock held
+        if self._heartbeat is None or not self._heartbeat.is_alive():
+            self._heartbeat = threading.Thread(target=self._beat, name="opuluxe-tryon-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    def _beat(self):
+        """Refresh heartbeat_at and the slot of every job this process holds, every TRYON_JOB_TIMEOUT / 3."""
+        while True:
+            time.sleep(TRYON_JOB_TIMEOUT / 3)
+            with self._lock:
+                jobs = dict(self._active)
+            if not jobs:
+                continue
+            db = get_db()
+            if db is None:
+                continue
+            now = datetime.now(timezone.utc)
+            try:
+                db[JOBS_COLLECTION].update_many({'_id': {'$in': list(jobs)}}, {'$set': {'heartbeat_at': now}})
+                for job_id, user_email in jobs.items():
+                    db[SLOTS_COLLECTION].update_one({'_id': user_email, 'active.job_id': job_id},
+                                                    {'$set': {'active.$.at': now}})
+            except PyMongoError as e:
+                print(f"[Try-On Jobs] Heartbeat failed: {e}")
+
+    def _run(self, db, job_id, user_email, item_name, gender, user_photo):
+        key = render_key(item_name, gender, photo_hash(user_photo))
+        image_id = tryon_cache.get_or_render(
+            key, user_email, lambda: generate_tryon_image(item_name, gender, user_photo), db=db
+        )
+        if image_id:
+            return 'done', {'image_id': image_id}
+        return 'failed', {'error': 'Generation failed'}
+
+    def _run_batch(self, db, job_id, user_email, items, gender, user_photo):
+        digest = photo_hash(user_photo)
+        pending = iter(list(enumerate(items)))
+        pending_lock = threading.Lock()
+        description = []
+        description_lock = threading.Lock()
+
+        def describe_once():
+            # Analyze once, and only if some item is not cached; every prompt reuses it
+            with description_lock:
+                if not description:
+                    description.append(describe_photo(user_photo, gender) if user_photo else None)
+                return description[0]
+
+        def render(index, item_name):
+            try:
+                image_id = tryon_cache.get_or_render(
+                    render_key(item_name, gender, digest), user_email,
+                    lambda: render_tryon_image(item_name, gender, describe_once()), db=db
+                )
+            except Exception as e:
+                print(f"[Try-On Jobs] {job_id} item '{item_name}' failed: {e}")
+                image_id = None
+            result = {'item': item_name, 'status': 'done', 'image_id': image_id} if image_id else \
+                {'item': item_name, 'status': 'failed', 'error': 'Generation failed'}
+            if db is not None:
+                try:
+                    # Publish each item as soon as it finishes so clients can stream results
+                    db[JOBS_COLLECTION].update_one({'_id': job_id}, {'$set': {f'items.{index}': result}})
+                except PyMongoError as e:
+                    print(f"[Try-On Jobs] Could not record item {index} of {job_id}: {e}")
+            return result
+
+        def drain():
+            # Each drain task renders items one at a time, so a batch never holds
+            # more than TRYON_BATCH_CONCURRENCY render threads
+            results = []
+            while True:
+                with pending_lock:
+                    task = next(pending, None)
+                if task is None:
+                    return results
+                results.append(render(*task))
+
+        lanes = min(TRYON_BATCH_CONCURRENCY, len(items))
+        futures = [self._render_executor.submit(drain) for _ in range(lanes)]
+        results = [result for f in futures for result in f.result()]
+        if any(r['status'] == 'done' for r in results):
+            return 'done', {}
+        return 'failed', {'error': 'Generation failed'}
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["queue_depth"] = self._queued
+            stats["running"] = self._running
+            finished = stats["completed"] + stats["failed"]
+            stats["avg_wait_ms"] = round(stats.pop("total_wait_ms") / finished, 1) if finished else 0.0
+            stats["avg_run_ms"] = round(stats.pop("total_run_ms") / finished, 1) if finished else 0.0
+            return stats
+
+
+def _claim_slot(db, user_email, job_id, now):
+    """
+    Atomically take one of the user's TRYON_MAX_JOBS_PER_USER job slots.
+
+    The conditional push only matches while the user's slot list is short
+    of the limit, so concurrent submits cannot both take the last slot.
+    Slots whose heartbeat is older than TRYON_JOB_TIMEOUT are dropped
+    first, so a job whose worker died does not hold its slot forever.
+
+    Returns:
+        bool: True if a slot was claimed for job_id
+    """
+    slots = db[SLOTS_COLLECTION]
+    slots.update_one({'_id': user_email},
+                     {'$pull': {'active': {'at': {'$lt': now - timedelta(seconds=TRYON_JOB_TIMEOUT)}}}})
+    try:
+        claimed = slots.find_one_and_update(
+            {'_id': user_email, f'active.{TRYON_MAX_JOBS_PER_USER - 1}': {'$exists': False}},
+            {'$push': {'active': {'job_id': job_id, 'at': now}}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # The user's document exists but the filter did not match: all slots taken
+        return False
+    return claimed is not None
+
+
+def _release_slot(db, user_email, job_id):
+    try:
+        db[SLOTS_COLLECTION].update_one({'_id': user_email}, {'$pull': {'active': {'job_id': job_id}}})
+    except PyMongoError as e:
+        print(f"[Try-On Jobs] Could not release slot of {job_id}: {e}")
+
+
+def get_job(job_id, user_email, db=None):
+    """
+    Get a job's public state if it belongs to user_email.
+
+    Returns:
+        dict: {'job_id', 'status', 'item', 'image_id'?, 'error'?}, or None;
+            batch jobs also carry 'items': [{'index', 'item', 'status', 'image_id'?, 'error'?}]
+    """
+    db = db if db is not None else get_db()
+    if db is None:
+        return None
+    job = db[JOBS_COLLECTION].find_one({'_id': job_id, 'user_email': user_email})
+    if job is None:
+        return None
+
+    result = {'job_id': job['_id'], 'status': job['status']}
+    if job.get('kind') == 'batch':
+        result['items'] = [dict(entry, index=i) for i, entry in enumerate(job.get('items', []))]
+    else:
+        result['item'] = job.get('item')
+    seen_at = job.get('heartbeat_at') or job['created_at']
+    if seen_at.tzinfo is None:
+        seen_at = seen_at.replace(tzinfo=timezone.utc)  # PyMongo returns naive UTC by default
+    if job['status'] in ACTIVE_STATUSES and datetime.now(timezone.utc) - seen_at > timedelta(seconds=TRYON_JOB_TIMEOUT):
+        result.update(status='failed', error='Try-on timed out')
+    elif job.get('image_id'):
+        result['image_id'] = job['image_id']
+    elif job.get('error'):
+        result['error'] = job['error']
+    return result
+
+
+tryon_queue = TryOnJobQueue()
@@ -8,10 +8,16 @@ urlpatterns = [
     path('api/login/', views.api_login, name='api_login'),
     path('api/logout/', views.api_logout, name='api_logout'),
     path('api/chat/', views.api_chat, name='api_chat'),
+    path('api/chat/stream/', views.api_chat_stream, name='api_chat_stream'),
+    path('api/metrics/', views.api_metrics, name='api_metrics'),
     path('api/chat-history/', views.api_get_chat_history, name='api_get_chat_history'),
     path('api/chat-session/', views.api_get_session_detail, name='api_get_session_detail'),
+    path('api/chat-image/<str:image_id>/', views.api_chat_image, name='api_chat_image'),
     path('api/delete-chat/', views.api_delete_chat, name='api_delete_chat'),
     path('api/tryon/', views.api_tryon, name='api_tryon'),
+    path('api/tryon/batch/', views.api_tryon_batch, name='api_tryon_batch'),
+    path('api/tryon/jobs/<str:job_id>/', views.api_tryon_job, name='api_tryon_job'),
+    path('api/tryon/jobs/<str:job_id>/events/', views.api_tryon_job_events, name='api_tryon_job_events'),
     path('api/save-profile/', views.api_save_profile, name='api_save_profile'),
     path('api/get-profiles/', views.api_get_profiles, name='api_get_profiles'),
     path('api/get-profile/<str:profile_id>/', views.api_get_single_profile, name='api_get_single_profile'),
@@ -0,0 +1,96 @@
+"""
+Image normalization for Opuluxe AI uploads
+Sniffs the real format, applies and strips EXIF, downsizes to a maximum edge
+and re-encodes compactly before images reach a model or the blob store
+"""
+
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .blob_store import decode_data_url
+
+# Longest edge sent to models; Gemini tiles larger images anyway
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1536"))
+# Output encoding: JPEG or WEBP
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+# Uploads larger than this (decoded) are rejected outright
+IMAGE_MAX_UPLOAD_BYTES = int(os.getenv("IMAGE_MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+ACCEPTED_FORMATS = {"JPEG", "PNG", "WEBP", "GIF", "BMP", "MPO"}
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+# Refuse decompression bombs well before they exhaust memory
+Image.MAX_IMAGE_PIXELS = 50_000_000
+
+# Decoding and resizing are CPU-bound; keep them off the event loop
+_image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="opuluxe-images")
+
+
+def normalize_image(data, max_edge=IMAGE_MAX_EDGE):
+    """
+    Normalize uploaded image bytes for model calls and storage.
+
+    Args:
+        data (bytes): Raw upload in any format Pillow can identify
+        max_edge (int): Longest edge of the output
+
+    Returns:
+        tuple: (bytes, mime_type) of the re-encoded image
+
+    Raises:
+        ValueError: Not an accepted image, or too large
+    """
+    if len(data) > IMAGE_MAX_UPLOAD_BYTES:
+        raise ValueError("Image is too large")
+    try:
+        image = Image.open(io.BytesIO(data))
+        source_format = image.format
+        if source_format not in ACCEPTED_FORMATS:
+            raise ValueError(f"Unsupported image format: {source_format}")
+        # Bake the EXIF orientation into the pixels; metadata is not copied over
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        print(f"[Images] Rejected upload: {e}")
+        raise ValueError("Unsupported or corrupt image") from e
+
+    output_format = IMAGE_OUTPUT_FORMAT if IMAGE_OUTPUT_FORMAT in _MIME_TYPES else "JPEG"
+    if output_format == "JPEG" and image.mode != "RGB":
+        # JPEG has no alpha; flatten transparent uploads onto white
+        rgba = image.convert("RGBA")
+        image = Image.new("RGB", rgba.size, (255, 255, 255))
+        image.paste(rgba, mask=rgba.getchannel("A"))
+    elif image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=output_format, quality=IMAGE_QUALITY, optimize=True)
+    return buffer.getvalue(), _MIME_TYPES[output_format]
+
+
+def normalize_data_url(data_url, max_edge=IMAGE_MAX_EDGE):
+    """
+    Decode a base64 data URL (or bare base64) and normalize it.
+
+    Returns:
+        tuple: (bytes, mime_type)
+
+    Raises:
+        ValueError: Undecodable or invalid image
+    """
+    data, _ = decode_data_url(data_url)
+    if not data:
+        raise ValueError("Invalid base64 image data")
+    return normalize_image(data, max_edge=max_edge)
+
+
+async def normalize_data_url_async(data_url, max_edge=IMAGE_MAX_EDGE):
+    """normalize_data_url on the image worker pool, for async views."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_image_pool, normalize_data_url, data_url, max_edge)
@@ -1,88 +1,88 @@
-
 import os
 import base64
 from dotenv import load_dotenv
-from openai import OpenAI
+from .ai_clients import get_openai_client, track_call
 
 load_dotenv()
 
-def generate_tryon_image(item_name, gender, original_photo_data=None):
+ANALYSIS_MODEL = "gpt-4o"
+ANALYSIS_PROMPT = "Describe this person's physical appearance (body type, skin tone, hair, age), pose, and the lighting in detail. This is for generating a new fashion photo of them."
+
+def get_api_key():
+    """OPENAI_API_KEY, or an OpenAI key ('sk-...') placed in GEMINI_API_KEY"""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        # Some deployments put the OpenAI key in this var
+        gemini_var = os.getenv("GEMINI_API_KEY")
+        if gemini_var and gemini_var.startswith("sk-"):
+            api_key = gemini_var
+    return api_key
+
+def _get_client():
+    api_key = get_api_key()
+    if not api_key:
+        print("AI API Key not found")
+        return None
+    return get_openai_client(api_key)
+
+def analyze_photo(image_bytes, mime_type):
     """
-    Generates a fashion preview image using OpenAI (GPT-4o + DALL-E 3).
+    Step 1 of try-on: describe the person in the user's photo with GPT-4o.
     Args:
-        item_name (str): The name of the clothing item.
-        gender (str): 'men' or 'women'.
-        original_photo_data (str, optional): Base64 data string of user's photo.
+        image_bytes (bytes): Normalized photo (see utils_images.normalize_data_url).
+        mime_type (str): MIME type of image_bytes.
     Returns:
-        str: Base64 data URL of generated image, or None if failed.
+        str: Photo description.
     """
-    try:
-        api_key = os.getenv("GEMINI_API_KEY") # User put OpenAI key in this var
-        # Check if it starts with 'sk-' just to be safe, though we know user did so.
-        if not api_key:
-             # Fallback to OPENAI_API_KEY if they change it later
-             api_key = os.getenv("OPENAI_API_KEY")
+    client = _get_client()
+    if client is None:
+        raise RuntimeError("OpenAI client unavailable")
 
-        if not api_key:
-            print("AI API Key not found")
-            return None
-        
-        client = OpenAI(api_key=api_key)
-        
-        print(f"[OpenAI Try-On] Processing: {item_name} for {gender}")
-        
-        photo_description = f"A {gender} model posing for a fashion catalog"
-        
-        if original_photo_data:
-            # Step 1: Analyze original photo using GPT-4o
-            print("[OpenAI Try-On] Step 1: Analyzing original photo...")
-            
-            # Ensure proper data URI format for valid checking, though OpenAI wants URL or base64.
-            # If original_photo_data comes as "data:image/png;base64,..." we pass it directly.
-            # If just base64, we need to add prefix? user sent "data:image..." usually.
-            # Actually, GPT-4o Vision accepts base64 url.
-            
-            image_url = original_photo_data
-            if not image_url.startswith("data:"):
-                # Assume png if raw base64
-                image_url = f"data:image/png;base64,{original_photo_data}"
-                
-            try:
-                analysis_response = client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
+    print("[OpenAI Try-On] Step 1: Analyzing original photo...")
+    image_url = f"data:{mime_type};base64,{base64.b64encode(image_bytes).decode('utf-8')}"
+    with track_call("openai", ANALYSIS_MODEL):
+        analysis_response = client.chat.completions.create(
+            model=ANALYSIS_MODEL,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": ANALYSIS_PROMPT},
                         {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": "Describe this person's physical appearance (body type, skin tone, hair, age), pose, and the lighting in detail. This is for generating a new fashion photo of them."},
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": image_url
-                                    }
-                                }
-                            ]
+                            "type": "image_url",
+                            "image_url": {
+                                "url": image_url
+                            }
                         }
-                    ],
-                    max_tokens=300
-                )
-                photo_description = analysis_response.choices[0].message.content
-                print(f"[OpenAI Try-On] Analysis: {photo_description[:100]}...")
-            except Exception as e:
-                print(f"[OpenAI Try-On] Analysis failed: {e}")
-                # Fallback
-        
-        # Step 2: Generate with DALL-E 3
-        print("[OpenAI Try-On] Step 2: Generating image...")
-        
-        prompt = (
-            f"A professional hyper-realistic fashion photo of {photo_description}. "
-            f"The person is wearing {item_name}. "
-            f"Ensure the clothing ({item_name}) is fully visible and looks high-quality. "
-            f"Fashion catalog style, clean background, 8k resolution."
+                    ]
+                }
+            ],
+            max_tokens=300
         )
-        
-        try:
+    return analysis_response.choices[0].message.content
+
+def render_tryon_image(item_name, gender, photo_description=None):
+    """
+    Step 2 of try-on: generate the preview image with DALL-E 3.
+    Returns:
+        str: Base64 data URL of generated image, or None if failed.
+    """
+    client = _get_client()
+    if client is None:
+        return None
+
+    print("[OpenAI Try-On] Step 2: Generating image...")
+
+    photo_description = photo_description or f"A {gender} model posing for a fashion catalog"
+    prompt = (
+        f"A professional hyper-realistic fashion photo of {photo_description}. "
+        f"The person is wearing {item_name}. "
+        f"Ensure the clothing ({item_name}) is fully visible and looks high-quality. "
+        f"Fashion catalog style, clean background, 8k resolution."
+    )
+
+    try:
+        with track_call("openai", "dall-e-3"):
             response = client.images.generate(
                 model="dall-e-3",
                 prompt=prompt,
@@ -91,14 +91,10 @@ def generate_tryon_image(item_name, gender, original_photo_data=None):
                 n=1,
                 response_format="b64_json"
             )
-            
-            image_b64 = response.data[0].b64_json
-            return f"data:image/png;base64,{image_b64}"
-            
-        except Exception as img_err:
-             print(f"[OpenAI Try-On] Generation failed: {img_err}")
-             return None
 
-    except Exception as e:
-        print(f"[OpenAI Try-On] Critical Error: {e}")
+        image_b64 = response.data[0].b64_json
+        return f"data:image/png;base64,{image_b64}"
+
+    except Exception as img_err:
+        print(f"[OpenAI Try-On] Generation failed: {img_err}")
         return None
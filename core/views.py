@@ -1,11 +1,17 @@
+import asyncio
 import json
 import os
-import base64
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from .mongodb import get_db
-from google import genai
+from . import blob_store, chat_history, context_builder
+from asgiref.sync import sync_to_async
 from google.genai import types
 from dotenv import load_dotenv
 from django.contrib.auth.hashers import make_password, check_password
@@ -15,28 +21,155 @@ from pathlib import Path
 ENV_PATH = Path(__file__).resolve().parent.parent / '.env'
 load_dotenv(dotenv_path=ENV_PATH, override=True)
 
-from .utils_gemini import generate_tryon_image
+from .ai_clients import get_gemini_async_client, track_call
+from .mcp_context import gather_mcp_context
+from .photo_analysis_cache import photo_analysis_cache
+from .prompt_cache import prompt_cache
+from .response_cache import RESPONSE_CACHE_ENABLED, is_personalized, response_cache
+from .tryon_backends import tryon_backends
+from .tryon_cache import photo_hash, render_key, tryon_cache
+from .tryon_jobs import TRYON_BATCH_MAX_ITEMS, TryOnQueueFull, get_job as get_tryon_job, tryon_queue
+from .utils_images import normalize_data_url_async
+
+def _tryon_queue_full_response(error):
+    """429 for a rejected try-on submission; clients retry after Retry-After seconds"""
+    response = JsonResponse({'success': False, 'error': str(error), 'reason': error.reason}, status=429)
+    response['Retry-After'] = '5'
+    return response
 
 @csrf_exempt
 def api_tryon(request):
+    """
+    Submit a Magic Try-On job.
+
+    Returns the job id immediately; the pipeline runs on the try-on worker
+    pool and the client polls api_tryon_job for the result. Cached renders
+    are returned directly with status 'done'.
+    """
     if request.method == 'POST':
+        user_email = request.session.get('user_email')
+        if not user_email:
+            return JsonResponse({'success': False, 'error': 'Please log in to use Magic Try-On'}, status=401)
         try:
             data = json.loads(request.body)
             item_name = data.get('item', 'fashion item')
             gender = data.get('gender', 'person')
             user_photo = data.get('user_photo', None)
 
-            # Generate image using Gemini
-            image_data = generate_tryon_image(item_name, gender, user_photo)
-            
-            if image_data:
-                return JsonResponse({'success': True, 'image': image_data})
-            else:
-                return JsonResponse({'success': False, 'error': 'Generation failed'})
+            # Repeat try-ons are answered from the render cache without queueing
+            image_id = tryon_cache.get(render_key(item_name, gender, photo_hash(user_photo)), user_email)
+            if image_id:
+                return JsonResponse({'success': True, 'status': 'done', 'image': blob_store.image_url(image_id)})
+
+            job_id = tryon_queue.submit(user_email, item_name, gender, user_photo)
+            return JsonResponse({
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'poll_url': reverse('api_tryon_job', args=[job_id]),
+            }, status=202)
+        except TryOnQueueFull as e:
+            return _tryon_queue_full_response(e)
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
     return JsonResponse({'success': False, 'error': 'Invalid method'})
 
+@csrf_exempt
+def api_tryon_batch(request):
+    """
+    Submit one try-on job for several items on the same photo.
+
+    The photo is analyzed once and the renders run concurrently; results
+    stream from api_tryon_job_events (or can be polled via api_tryon_job).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid method'})
+    user_email = request.session.get('user_email')
+    if not user_email:
+        return JsonResponse({'success': False, 'error': 'Please log in to use Magic Try-On'}, status=401)
+    try:
+        data = json.loads(request.body)
+        items = [str(item).strip() for item in data.get('items', []) if str(item).strip()]
+        # Same item twice would render the same image twice
+        items = list(dict.fromkeys(items))
+        if not items:
+            return JsonResponse({'success': False, 'error': 'No items to try on'})
+        if len(items) > TRYON_BATCH_MAX_ITEMS:
+            return JsonResponse({'success': False, 'error': f'At most {TRYON_BATCH_MAX_ITEMS} items per batch'})
+
+        job_id = tryon_queue.submit_batch(user_email, items, data.get('gender', 'person'), data.get('user_photo'))
+        return JsonResponse({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'items': items,
+            'poll_url': reverse('api_tryon_job', args=[job_id]),
+            'events_url': reverse('api_tryon_job_events', args=[job_id]),
+        }, status=202)
+    except TryOnQueueFull as e:
+        return _tryon_queue_full_response(e)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+def _public_tryon_job(job):
+    """Replace blob store ids with image URLs"""
+    image_id = job.pop('image_id', None)
+    if image_id:
+        job['image'] = blob_store.image_url(image_id)
+    for entry in job.get('items', []):
+        item_image_id = entry.pop('image_id', None)
+        if item_image_id:
+            entry['image'] = blob_store.image_url(item_image_id)
+    return job
+
+def api_tryon_job(request, job_id):
+    """Poll a Magic Try-On job; 'image' is set once status is 'done'"""
+    user_email = request.session.get('user_email')
+    if not user_email:
+        return JsonResponse({'success': False, 'error': 'Not logged in'}, status=401)
+
+    job = get_tryon_job(job_id, user_email)
+    if job is None:
+        return JsonResponse({'success': False, 'error': 'Job not found'}, status=404)
+    return JsonResponse({'success': True, **_public_tryon_job(job)})
+
+TRYON_EVENTS_POLL_INTERVAL = 1.0
+
+async def api_tryon_job_events(request, job_id):
+    """
+    Server-sent events for a try-on job.
+
+    Emits an 'item' event for each batch item as it finishes, then a 'done'
+    event with the final job state. Job state is read from MongoDB, so the
+    stream works from any worker process.
+    """
+    user_email = await request.session.aget('user_email')
+    if not user_email:
+        return JsonResponse({'success': False, 'error': 'Not logged in'}, status=401)
+    load_job = sync_to_async(get_tryon_job, thread_sensitive=False)
+
+    async def event_stream():
+        sent = set()
+        while True:
+            job = await load_job(job_id, user_email)
+            if job is None:
+                yield _sse_event('error', {'error': 'Job not found'})
+                return
+            job = _public_tryon_job(job)
+            for entry in job.get('items', []):
+                if entry['status'] in ('done', 'failed') and entry['index'] not in sent:
+                    sent.add(entry['index'])
+                    yield _sse_event('item', entry)
+            if job['status'] in ('done', 'failed'):
+                yield _sse_event('done', {'success': True, **job})
+                return
+            await asyncio.sleep(TRYON_EVENTS_POLL_INTERVAL)
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
+
 def index(request):
     # If already logged in, go to dashboard
     if request.session.get('user_email'):
@@ -150,13 +283,285 @@ def api_logout(request):
             return JsonResponse({'success': False, 'error': str(e)})
     return JsonResponse({'success': False, 'error': 'Invalid method'})
 
+# Using latest Gemini 2.5, will upgrade to Gemini 3 when available
+CHAT_MODEL = 'gemini-2.5-flash'
+
+# Strict fashion-focused system prompt optimized for latest Gemini
+CHAT_SYSTEM_PROMPT = (
+    "You are the Opuluxe AI Fashion Consultant powered by advanced Gemini AI. "
+    "CRITICAL RULE: You ONLY answer questions related to fashion, style, clothing, accessories, and grooming. "
+    "If the user asks about anything else (e.g., math, coding, politics, general knowledge), "
+    "politely explain that you are specialized in fashion and can only assist with style-related queries. "
+    "Keep your tone elegant, premium, and helpful. "
+    "PERSONALIZATION RULE: If the user is asking for specific recommendations (like 'what should I wear?' or 'does this fit?'), "
+    "and you don't have their measurements yet, encourage them to select a profile by including the tag [NEED_PROFILE_SELECTION] at the very end of your response. "
+    "CONSULTATION FLOW: Once measurements ARE provided, you MUST ask for their shopping preferences (Budget, Platform, Brands) by including the tag [NEED_SHOPPING_DETAILS] at the very end of your response. "
+    "Do not give final clothing links until these preferences are clarified. "
+    "AI CAPABILITIES: Leverage your enhanced reasoning to provide deeply personalized fashion advice, "
+    "analyze images with superior accuracy, and understand complex style preferences with nuanced context. "
+    "\\n\\n"
+    "SHOPPING CONSTRAINT HANDLING (IMPORTANT):\\n"
+    "If the user provides specific budget, brand, or platform constraints (e.g., 'Van Heusen under 2000 on Amazon'), you MUST try your absolute best to find items that fit.\\n"
+    "If an exact match for a complete outfit is difficult within the budget, DO NOT refuse or just say it is a challenge. Instead:\\n"
+    "1. Suggest specific individual items that DO fit the budget (e.g., just the shirt or just the trousers).\\n"
+    "2. Suggest the closest available alternatives from the requested brand that might be slightly over budget, but mention this politely.\\n"
+    "3. Suggest similar high-quality brands that fit the budget and style better.\\n"
+    "ALWAYS provide a list of specific product names, even if they are 'best effort' matches. NEVER end the conversation without giving concrete options when shopping details are provided."
+    "\\n\\n"
+    "PRODUCT RECOMMENDATION FORMAT (CRITICAL): When recommending specific clothing items or products, ALWAYS format them as follows:\\n"
+    "1. Use numbered lists (1., 2., 3., etc.)\\n"
+    "2. Make the product name/brand BOLD using **double asterisks**\\n"
+    "3. Include a brief description after the product name\\n"
+    "4. Optionally mention price range or key features\\n"
+    "\\n"
+    "EXAMPLE FORMAT:\\n"
+    "1. **Nike Air Max 270** - Comfortable running shoes with excellent cushioning\\n"
+    "   - Price: ₹12,000 - ₹15,000\\n"
+    "   - Available in multiple colors\\n"
+    "\\n"
+    "2. **Levi's 511 Slim Fit Jeans** - Classic denim with modern slim cut\\n"
+    "   - Price: ₹3,500 - ₹5,000\\n"
+    "   - Perfect for casual and semi-formal occasions\\n"
+    "\\n"
+    "This formatting is ESSENTIAL as it enables the 'Magic Try-On' and 'Shop Now' features for users."
+)
+
+# Chat transcripts are written to MongoDB off the request path
+_chat_writer = ThreadPoolExecutor(max_workers=4, thread_name_prefix="opuluxe-chat-writer")
+# (user_email, session_id) -> writes waiting behind the one in progress for that session
+_session_writes = {}
+_session_writes_lock = threading.Lock()
+
+def _submit_session_write(user_email, session_id, fn, *args):
+    """Run fn(*args) on the writer pool after every earlier write for the same session"""
+    key = (user_email, session_id)
+    with _session_writes_lock:
+        pending = _session_writes.get(key)
+        if pending is not None:
+            pending.append((fn, args))
+            return
+        _session_writes[key] = deque([(fn, args)])
+    _chat_writer.submit(_drain_session_writes, key)
+
+def _drain_session_writes(key):
+    # One drain per session at a time, so its writes land in submission order
+    while True:
+        with _session_writes_lock:
+            pending = _session_writes[key]
+            if not pending:
+                del _session_writes[key]
+                return
+            fn, args = pending.popleft()
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"Database Error: {e}")
+
+def _save_chat_turn(user_email, session_id, user_text, image, response_text):
+    """Append one user/assistant exchange to the user's chat session in MongoDB, creating it if needed"""
+    try:
+        db = get_db()
+        if db is None:
+            return
+        sessions_col = db['chat_sessions']
+        user_message = {'role': 'user', 'text': user_text}
+        if image:
+            # Images live in the blob store; the message only keeps a reference
+            image_id = blob_store.save_image(image[0], image[1], user_email, db=db)
+            if image_id:
+                user_message['image_id'] = image_id
+        turn = [
+            user_message,
+            {'role': 'assistant', 'text': response_text}
+        ]
+
+        # Upsert, so the first turn creates the session even if it is not the
+        # only write in flight
+        sessions_col.update_one(
+            {'user_email': user_email, 'session_id': session_id},
+            {
+                '$setOnInsert': {'title': user_text[:30] + '...' if user_text else 'Visual Search'},
+                '$push': {'messages': {'$each': turn}}
+            },
+            upsert=True
+        )
+    except Exception as db_err:
+        print(f"Database Error: {db_err}")
+
+async def _get_mcp_context(user_text):
+    """🔥 MCP INTEGRATION: Enhance user query with real-time fashion trend data"""
+    try:
+        return await gather_mcp_context(user_text)
+    except Exception as mcp_error:
+        print(f"[MCP] Warning: Could not fetch MCP data: {mcp_error}")
+        # Continue without MCP data - graceful degradation
+        return ""
+
+async def _lookup_cached_reply(client, user_text, mcp_context, window, image):
+    """
+    Check the response cache for a non-personalized question.
+
+    Returns:
+        tuple: (reply or None, probe to store the fresh reply under, or None if the cache does not apply)
+    """
+    if not RESPONSE_CACHE_ENABLED or not user_text:
+        return None, None
+    if is_personalized(user_text, has_image=image is not None, history_messages=window.total):
+        response_cache.bypass()
+        return None, None
+    return await response_cache.get(client, user_text, mcp_context)
+
+async def _build_chat_contents(user_text, window, image, mcp_context="", user_email=None, session_id=None):
+    """Build the Gemini conversation contents for one chat turn within the context token budget"""
+    # Build conversation contents for Gemini
+    contents = []
+
+    # Add images if any
+    image_part = None
+    if image:
+        # Already normalized by _normalize_chat_image: downsized, EXIF-free, real MIME type
+        image_part = types.Part.from_bytes(data=image[0], mime_type=image[1])
+
+    # Fit summary, history and MCP data into the prompt-token budget
+    built = context_builder.build_context(
+        CHAT_SYSTEM_PROMPT, window.messages, window.total, user_text,
+        mcp_context=mcp_context, summary=window.summary, has_image=image_part is not None
+    )
+    mcp_context = built.mcp_context
+    print(f"[Context] ~{built.tokens} tokens, {len(built.history)}/{window.total} messages"
+          f"{' + summary' if built.summary else ''}")
+
+    # Older turns that no longer fit are summarized in the background for later requests
+    if user_email and session_id and context_builder.needs_summary(built, window.summary):
+        _chat_writer.submit(context_builder.refresh_summary, user_email, session_id,
+                            context_builder.summary_target(built))
+
+    if built.summary:
+        contents.append(types.Content(role="user", parts=[
+            types.Part.from_text(text=f"[SUMMARY OF EARLIER CONVERSATION]: {built.summary}")
+        ]))
+        contents.append(types.Content(role="model", parts=[
+            types.Part.from_text(text="Understood, I'll keep that in mind.")
+        ]))
+
+    # Add History
+    for h in built.history:
+        role = "user" if h['role'] == 'user' else "model"
+        contents.append(types.Content(role=role, parts=[types.Part.from_text(text=h['text'])]))
+
+    # Add current message (with MCP context if available)
+    current_parts = []
+    if image_part:
+        current_parts.append(image_part)
+    if user_text:
+        # Append MCP context to user text for enhanced AI responses
+        enhanced_user_text = user_text + mcp_context
+        current_parts.append(types.Part.from_text(text=enhanced_user_text))
+
+    contents.append(types.Content(role="user", parts=current_parts))
+    return contents
+
+def _chat_generation_config(cached_prompt=None):
+    if cached_prompt:
+        # The system prompt is already part of the cached content
+        return types.GenerateContentConfig(cached_content=cached_prompt, temperature=0.7, max_output_tokens=2048)
+    return types.GenerateContentConfig(
+        system_instruction=CHAT_SYSTEM_PROMPT,
+        temperature=0.7,
+        max_output_tokens=2048
+    )
+
+async def _prepend_chunk(first, stream):
+    if first is not None:
+        yield first
+    async for chunk in stream:
+        yield chunk
+
+async def _open_chat_stream(client, contents, config):
+    """
+    Start a streamed generation and wait for its first chunk.
+
+    The request is only sent once the stream is iterated, so a rejected
+    cached prompt surfaces here rather than in the caller's loop.
+
+    Returns:
+        async iterator: Every chunk of the reply, starting with the first
+    """
+    stream = await client.models.generate_content_stream(model=CHAT_MODEL, contents=contents, config=config)
+    try:
+        first = await anext(stream)
+    except StopAsyncIteration:
+        first = None
+    return _prepend_chunk(first, stream)
+
+async def _generate_chat(client, contents, stream=False):
+    """Call Gemini with the cached system prompt, falling back to sending it inline"""
+    cached_prompt = await prompt_cache.get(client, CHAT_MODEL, CHAT_SYSTEM_PROMPT)
+
+    async def generate(config):
+        if stream:
+            return await _open_chat_stream(client, contents, config)
+        return await client.models.generate_content(model=CHAT_MODEL, contents=contents, config=config)
+
+    try:
+        return await generate(_chat_generation_config(cached_prompt))
+    except Exception as e:
+        if not cached_prompt:
+            raise
+        print(f"[Prompt Cache] Cached prompt rejected, retrying inline: {e}")
+        prompt_cache.invalidate(cached_prompt)
+        return await generate(_chat_generation_config())
+
+def _chat_error_message(error):
+    error_msg = str(error)
+    if "PERMISSION_DENIED" in error_msg or "leaked" in error_msg.lower() or "403" in error_msg:
+        return "System security alert: The AI credential has been invalidated. Please contact the administrator to update the API Key."
+    return error_msg
+
+def _queue_chat_save(user_email, session_id, user_text, image, response_text):
+    """Schedule the transcript write off the request path and return the session id"""
+    is_new_session = not session_id
+    if is_new_session:
+        session_id = str(os.urandom(8).hex())
+    # Make the turn visible to this worker's next request before the write lands
+    chat_history.record_turn(user_email, session_id, [
+        {'role': 'user', 'text': user_text},
+        {'role': 'assistant', 'text': response_text}
+    ], is_new_session=is_new_session)
+    _submit_session_write(user_email, session_id, _save_chat_turn, user_email, session_id, user_text, image, response_text)
+    return session_id
+
+async def _normalize_chat_image(image_data):
+    """
+    Downsize and re-encode an uploaded chat image on the image worker pool.
+
+    Returns:
+        tuple: (bytes, mime_type), or None if no image was sent
+
+    Raises:
+        ValueError: The upload is not a usable image
+    """
+    if not image_data:
+        return None
+    image = await normalize_data_url_async(image_data)
+    print(f"[Images] Normalized chat upload: {len(image_data) // 1024} KB base64 -> {len(image[0]) // 1024} KB {image[1]}")
+    return image
+
+async def _load_chat_history(user_email, data):
+    """Conversation context for this turn, assembled from the stored session"""
+    session_id = data.get('session_id')
+    if user_email and session_id:
+        return await sync_to_async(chat_history.get_recent_messages, thread_sensitive=False)(user_email, session_id)
+    # Anonymous chats are not stored; fall back to a client-sent transcript if any
+    history = data.get('history', [])
+    return chat_history.HistoryWindow(history[-chat_history.HISTORY_MESSAGES:], len(history), None)
+
 @csrf_exempt
-def api_chat(request):
+async def api_chat(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
             user_text = data.get('message', '')
-            history = data.get('history', [])
             image_data = data.get('image') # Base64 image if uploaded
 
             if not user_text and not image_data:
@@ -165,191 +570,150 @@ def api_chat(request):
             api_key = os.getenv("GEMINI_API_KEY")
             if not api_key:
                 return JsonResponse({'success': False, 'error': 'Gemini API key not configured'})
-                
-            client = genai.Client(api_key=api_key)
-            
-            # 🔥 MCP INTEGRATION: Enhance user query with real-time fashion trend data
-            mcp_context = ""
-            user_text_lower = user_text.lower()
-            
+
             try:
-                from .mcp_integration import get_fashion_trends_sync, get_style_tips_sync
-                
-                # Check if user is asking about trends
-                if any(keyword in user_text_lower for keyword in ['trend', 'trending', 'popular', 'latest', 'current', 'hot']):
-                    print("[MCP] Fetching real-time fashion trends...")
-                    
-                    # Determine category from user query
-                    category = "all"
-                    if "men" in user_text_lower or "male" in user_text_lower:
-                        category = "men"
-                    elif "women" in user_text_lower or "female" in user_text_lower or "ladies" in user_text_lower:
-                        category = "women"
-                    elif "accessories" in user_text_lower or "accessory" in user_text_lower:
-                        category = "accessories"
-                    
-                    trends_data = get_fashion_trends_sync(category)
-                    if "error" not in trends_data:
-                        mcp_context = f"\\n\\n[REAL-TIME TREND DATA via MCP]: {json.dumps(trends_data, indent=2)}\\n"
-                        print(f"[MCP] ✓ Trends data fetched for category: {category}")
+                image = await _normalize_chat_image(image_data)
+            except ValueError as e:
+                return JsonResponse({'success': False, 'error': str(e)})
                 
-                # Check if user is asking for style tips
-                elif any(keyword in user_text_lower for keyword in ['occasion', 'event', 'party', 'wedding', 'office', 'casual', 'formal']):
-                    print("[MCP] Fetching style tips...")
-                    
-                    # Determine occasion
-                    occasion = "casual"
-                    if "office" in user_text_lower or "work" in user_text_lower:
-                        occasion = "office"
-                    elif "formal" in user_text_lower or "business" in user_text_lower:
-                        occasion = "formal"
-                    elif "party" in user_text_lower:
-                        occasion = "party"
-                    elif "wedding" in user_text_lower:
-                        occasion = "wedding"
-                    
-                    style_tip = get_style_tips_sync(occasion)
-                    mcp_context = f"\\n\\n[STYLE TIP via MCP]: {style_tip}\\n"
-                    print(f"[MCP] ✓ Style tip fetched for occasion: {occasion}")
-                    
-            except Exception as mcp_error:
-                print(f"[MCP] Warning: Could not fetch MCP data: {mcp_error}")
-                # Continue without MCP data - graceful degradation
-            
-            # Prepare strict fashion-focused system prompt optimized for latest Gemini
-            system_prompt = (
-                "You are the Opuluxe AI Fashion Consultant powered by advanced Gemini AI. "
-                "CRITICAL RULE: You ONLY answer questions related to fashion, style, clothing, accessories, and grooming. "
-                "If the user asks about anything else (e.g., math, coding, politics, general knowledge), "
-                "politely explain that you are specialized in fashion and can only assist with style-related queries. "
-                "Keep your tone elegant, premium, and helpful. "
-                "PERSONALIZATION RULE: If the user is asking for specific recommendations (like 'what should I wear?' or 'does this fit?'), "
-                "and you don't have their measurements yet, encourage them to select a profile by including the tag [NEED_PROFILE_SELECTION] at the very end of your response. "
-                "CONSULTATION FLOW: Once measurements ARE provided, you MUST ask for their shopping preferences (Budget, Platform, Brands) by including the tag [NEED_SHOPPING_DETAILS] at the very end of your response. "
-                "Do not give final clothing links until these preferences are clarified. "
-                "AI CAPABILITIES: Leverage your enhanced reasoning to provide deeply personalized fashion advice, "
-                "analyze images with superior accuracy, and understand complex style preferences with nuanced context. "
-                "\\n\\n"
-                "SHOPPING CONSTRAINT HANDLING (IMPORTANT):\\n"
-                "If the user provides specific budget, brand, or platform constraints (e.g., 'Van Heusen under 2000 on Amazon'), you MUST try your absolute best to find items that fit.\\n"
-                "If an exact match for a complete outfit is difficult within the budget, DO NOT refuse or just say it is a challenge. Instead:\\n"
-                "1. Suggest specific individual items that DO fit the budget (e.g., just the shirt or just the trousers).\\n"
-                "2. Suggest the closest available alternatives from the requested brand that might be slightly over budget, but mention this politely.\\n"
-                "3. Suggest similar high-quality brands that fit the budget and style better.\\n"
-                "ALWAYS provide a list of specific product names, even if they are 'best effort' matches. NEVER end the conversation without giving concrete options when shopping details are provided."
-                "\\n\\n"
-                "PRODUCT RECOMMENDATION FORMAT (CRITICAL): When recommending specific clothing items or products, ALWAYS format them as follows:\\n"
-                "1. Use numbered lists (1., 2., 3., etc.)\\n"
-                "2. Make the product name/brand BOLD using **double asterisks**\\n"
-                "3. Include a brief description after the product name\\n"
-                "4. Optionally mention price range or key features\\n"
-                "\\n"
-                "EXAMPLE FORMAT:\\n"
-                "1. **Nike Air Max 270** - Comfortable running shoes with excellent cushioning\\n"
-                "   - Price: ₹12,000 - ₹15,000\\n"
-                "   - Available in multiple colors\\n"
-                "\\n"
-                "2. **Levi's 511 Slim Fit Jeans** - Classic denim with modern slim cut\\n"
-                "   - Price: ₹3,500 - ₹5,000\\n"
-                "   - Perfect for casual and semi-formal occasions\\n"
-                "\\n"
-                "This formatting is ESSENTIAL as it enables the 'Magic Try-On' and 'Shop Now' features for users."
-            )
-            
-            # Build conversation contents for Gemini
-            contents = []
-            
-            # Add images if any
-            image_part = None
-            if image_data:
-                try:
-                    if ',' in image_data:
-                        base64_data = image_data.split(',')[1]
-                    else:
-                        base64_data = image_data
-                    image_bytes = base64.b64decode(base64_data)
-                    image_part = types.Part.from_bytes(data=image_bytes, mime_type='image/png')
-                except Exception as img_err:
-                    print(f"Error processing image for Gemini: {img_err}")
-
-            # Add History
-            for h in history[-10:]: # Gemini has larger context, we can afford more
-                role = "user" if h['role'] == 'user' else "model"
-                contents.append(types.Content(role=role, parts=[types.Part.from_text(text=h['text'])]))
-            
-            # Add current message (with MCP context if available)
-            current_parts = []
-            if image_part:
-                current_parts.append(image_part)
-            if user_text:
-                # Append MCP context to user text for enhanced AI responses
-                enhanced_user_text = user_text + mcp_context
-                current_parts.append(types.Part.from_text(text=enhanced_user_text))
-            
-            contents.append(types.Content(role="user", parts=current_parts))
+            user_email = await request.session.aget('user_email')
+            window = await _load_chat_history(user_email, data)
 
-            # Call Gemini 2.5 Flash (latest available, ready for Gemini 3 upgrade)
-            response = client.models.generate_content(
-                model='gemini-2.5-flash',  # Using latest Gemini 2.5, will upgrade to Gemini 3 when available
-                contents=contents,
-                config=types.GenerateContentConfig(
-                    system_instruction=system_prompt,
-                    temperature=0.7,
-                    max_output_tokens=2048
-                )
-            )
+            client = get_gemini_async_client(api_key)
+            mcp_context = await _get_mcp_context(user_text)
 
-            response_text = response.text
+            response_text, cache_probe = await _lookup_cached_reply(client, user_text, mcp_context, window, image)
+            if response_text is None:
+                contents = await _build_chat_contents(user_text, window, image, mcp_context,
+                                                      user_email, data.get('session_id'))
+
+                # Call Gemini 2.5 Flash through the async client so the worker is free while generating
+                with track_call("gemini", CHAT_MODEL):
+                    response = await _generate_chat(client, contents)
+
+                response_text = response.text
+                if cache_probe:
+                    response_cache.put(cache_probe, response_text)
 
             # Save to Database if user is logged in
-            user_email = request.session.get('user_email')
             if user_email:
-                try:
-                    db = get_db()
-                    if db is not None:
-                        sessions_col = db['chat_sessions']
-                        session_id = data.get('session_id')
-                        
-                        if not session_id:
-                            # Create new session
-                            session_id = str(os.urandom(8).hex())
-                            sessions_col.insert_one({
-                                'user_email': user_email,
-                                'session_id': session_id,
-                                'title': user_text[:30] + '...' if user_text else 'Visual Search',
-                                'messages': [
-                                    {'role': 'user', 'text': user_text, 'image': image_data},
-                                    {'role': 'assistant', 'text': response_text}
-                                ]
-                            })
-                        else:
-                            # Update existing session
-                            sessions_col.update_one(
-                                {'user_email': user_email, 'session_id': session_id},
-                                {
-                                    '$push': {
-                                        'messages': {
-                                            '$each': [
-                                                {'role': 'user', 'text': user_text, 'image': image_data},
-                                                {'role': 'assistant', 'text': response_text}
-                                            ]
-                                        }
-                                    }
-                                }
-                            )
-                        return JsonResponse({'success': True, 'reply': response_text, 'session_id': session_id})
-                except Exception as db_err:
-                    print(f"Database Error: {db_err}")
+                session_id = _queue_chat_save(user_email, data.get('session_id'), user_text, image, response_text)
+                return JsonResponse({'success': True, 'reply': response_text, 'session_id': session_id})
 
             return JsonResponse({'success': True, 'reply': response_text})
 
         except Exception as e:
-            error_msg = str(e)
-            if "PERMISSION_DENIED" in error_msg or "leaked" in error_msg.lower() or "403" in error_msg:
-                 return JsonResponse({'success': False, 'error': "System security alert: The AI credential has been invalidated. Please contact the administrator to update the API Key."})
-            return JsonResponse({'success': False, 'error': error_msg})
+            return JsonResponse({'success': False, 'error': _chat_error_message(e)})
     return JsonResponse({'success': False, 'error': 'Invalid method'})
 
+def _sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@csrf_exempt
+async def api_chat_stream(request):
+    """
+    Server-sent events variant of api_chat.
+
+    Emits a 'delta' event per Gemini chunk as it is generated, then a single
+    'done' event (with the session id) once the full reply has been assembled
+    and queued for saving, or an 'error' event if generation fails.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid method'})
+
+    try:
+        data = json.loads(request.body)
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+    user_text = data.get('message', '')
+    image_data = data.get('image') # Base64 image if uploaded
+
+    if not user_text and not image_data:
+        return JsonResponse({'success': False, 'error': 'Empty message'})
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return JsonResponse({'success': False, 'error': 'Gemini API key not configured'})
+
+    try:
+        image = await _normalize_chat_image(image_data)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+    user_email = await request.session.aget('user_email')
+
+    async def event_stream():
+        chunks = []
+        try:
+            window = await _load_chat_history(user_email, data)
+            client = get_gemini_async_client(api_key)
+            mcp_context = await _get_mcp_context(user_text)
+
+            cached_reply, cache_probe = await _lookup_cached_reply(client, user_text, mcp_context, window, image)
+            if cached_reply is not None:
+                chunks.append(cached_reply)
+                yield _sse_event('delta', {'text': cached_reply})
+            else:
+                contents = await _build_chat_contents(user_text, window, image, mcp_context,
+                                                      user_email, data.get('session_id'))
+                with track_call("gemini", CHAT_MODEL + ":stream"):
+                    stream = await _generate_chat(client, contents, stream=True)
+                    async for chunk in stream:
+                        if chunk.text:
+                            chunks.append(chunk.text)
+                            yield _sse_event('delta', {'text': chunk.text})
+        except Exception as e:
+            yield _sse_event('error', {'error': _chat_error_message(e)})
+            return
+
+        response_text = ''.join(chunks)
+        if cache_probe and cached_reply is None:
+            response_cache.put(cache_probe, response_text)
+        done = {'success': True}
+        # Persist only the completed reply, never a partial one
+        if user_email and response_text:
+            done['session_id'] = _queue_chat_save(user_email, data.get('session_id'), user_text, image, response_text)
+        yield _sse_event('done', done)
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
+
+def api_metrics(request):
+    """
+    Per-worker cache and model-call counters for tuning.
+
+    Requires 'Authorization: Bearer <METRICS_TOKEN>' when METRICS_TOKEN is set,
+    and is only available with DEBUG=True otherwise.
+    """
+    from django.conf import settings
+    from .ai_clients import get_client_stats
+    from .mcp_context import get_stats as get_mcp_context_stats
+    from .mcp_integration import mcp_client
+
+    token = os.getenv("METRICS_TOKEN")
+    if token:
+        if request.headers.get('Authorization') != f"Bearer {token}":
+            return JsonResponse({'success': False, 'error': 'Unauthorized'}, status=401)
+    elif not settings.DEBUG:
+        raise Http404()
+
+    return JsonResponse({
+        'success': True,
+        'pid': os.getpid(),
+        'ai_clients': get_client_stats(),
+        'prompt_cache': dict(prompt_cache.stats),
+        'response_cache': response_cache.get_stats(),
+        'tryon_jobs': tryon_queue.get_stats(),
+        'photo_analysis_cache': photo_analysis_cache.get_stats(),
+        'tryon_backends': tryon_backends.get_stats(),
+        'tryon_cache': tryon_cache.get_stats(),
+        'mcp': mcp_client.get_stats(),
+        'mcp_context': get_mcp_context_stats(),
+    })
+
 @csrf_exempt
 def api_get_chat_history(request):
     user_email = request.session.get('user_email')
@@ -368,18 +732,136 @@ def api_get_chat_history(request):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+SESSION_PAGE_SIZE = 20
+SESSION_PAGE_MAX = 100
+
+def _load_message_page(db, user_email, session_id, before, limit):
+    """
+    Fetch one page of a session's messages, newest page first.
+
+    Only the array length and the requested $slice of the messages array
+    leave the database. Returns (messages, start, total), where messages are
+    the ones at indexes [start, end) in chronological order, or None if the
+    session does not exist.
+    """
+    match = {'user_email': user_email, 'session_id': session_id}
+    counts = next(db['chat_sessions'].aggregate([
+        {'$match': match},
+        {'$project': {'_id': 0, 'total': {'$size': {'$ifNull': ['$messages', []]}}}},
+    ]), None)
+    if counts is None:
+        return None
+
+    total = counts['total']
+    end = total if before is None else min(before, total)
+    start = max(end - limit, 0)
+    if end == start:
+        return [], start, total
+
+    page = db['chat_sessions'].find_one(match, {'_id': 0, 'messages': {'$slice': [start, end - start]}})
+    return (page or {}).get('messages', []), start, total
+
 @csrf_exempt
 def api_get_session_detail(request):
     user_email = request.session.get('user_email')
     session_id = request.GET.get('id')
     if not user_email or not session_id:
         return JsonResponse({'success': False})
-        
+
+    try:
+        before = request.GET.get('before')
+        before = max(int(before), 0) if before else None
+        limit = min(max(int(request.GET.get('limit', SESSION_PAGE_SIZE)), 1), SESSION_PAGE_MAX)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid cursor'})
+
     db = get_db()
-    session = db['chat_sessions'].find_one({'user_email': user_email, 'session_id': session_id}, {'_id': 0})
-    if session:
-        return JsonResponse({'success': True, 'messages': session.get('messages', [])})
-    return JsonResponse({'success': False})
+    page = _load_message_page(db, user_email, session_id, before, limit)
+    if page is None:
+        return JsonResponse({'success': False})
+
+    messages, start, total = page
+    if any('image' in m for m in messages):
+        _migrate_inline_images(db, user_email, session_id, messages, offset=start)
+    for m in messages:
+        if m.get('image_id'):
+            m['image_url'] = blob_store.image_url(m['image_id'])
+    return JsonResponse({
+        'success': True,
+        'messages': messages,
+        'total': total,
+        # Pass back as ?before= to load the next older page
+        'cursor': start if start > 0 else None,
+        'has_more': start > 0,
+    })
+
+def _migrate_inline_images(db, user_email, session_id, messages, offset=0):
+    """Move legacy base64 'image' fields of a page of messages into the blob store"""
+    to_set, to_unset = {}, {}
+    for i, m in enumerate(messages, start=offset):
+        if 'image' not in m:
+            continue
+        image_data = m.pop('image')
+        to_unset[f'messages.{i}.image'] = ''
+        image_id = blob_store.save_image_data_url(image_data, user_email, db=db) if image_data else None
+        if image_id:
+            m['image_id'] = image_id
+            to_set[f'messages.{i}.image_id'] = image_id
+    if to_unset:
+        change = {'$unset': to_unset}
+        if to_set:
+            change['$set'] = to_set
+        db['chat_sessions'].update_one({'user_email': user_email, 'session_id': session_id}, change)
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def api_chat_image(request, image_id):
+    """Serve a stored chat image with ETag revalidation and byte-range support"""
+    user_email = request.session.get('user_email')
+    if not user_email:
+        return HttpResponse(status=403)
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponse(status=405)
+
+    etag = f'"{image_id}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    image = blob_store.open_image(image_id, user_email)
+    if image is None:
+        raise Http404('Image not found')
+
+    size = image.length
+    status = 200
+    start, end = 0, size - 1
+    range_header = request.headers.get('Range')
+    if range_header and request.headers.get('If-Range', etag) == etag:
+        match = _RANGE_RE.match(range_header.strip())
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(size - int(match.group(2)), 0)
+            if start > end or start >= size:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+            status = 206
+
+    image.seek(start)
+    body = image.read(end - start + 1) if request.method == 'GET' else b''
+    response = HttpResponse(body, status=status, content_type=image.content_type or 'image/png')
+    response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    # Content-addressed, so the bytes behind a URL never change
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
 
 @csrf_exempt
 def api_delete_chat(request):
@@ -391,6 +873,7 @@ def api_delete_chat(request):
         
     db = get_db()
     db['chat_sessions'].delete_one({'user_email': user_email, 'session_id': session_id})
+    chat_history.forget_session(user_email, session_id)
     return JsonResponse({'success': True})
 
 @csrf_exempt
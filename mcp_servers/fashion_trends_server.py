@@ -4,73 +4,52 @@ Provides real-time fashion trend data using Model Context Protocol
 """
 
 import asyncio
+import os
+import sys
 from mcp.server import Server
-from mcp.types import Tool, TextContent
-import json
-from datetime import datetime
+from mcp.types import CallToolResult, Tool, TextContent
+
+try:
+    from .trend_store import TrendStore
+except ImportError:
+    # Run as a script (stdio subprocess)
+    from trend_store import TrendStore
 
 # Initialize MCP Server
 app = Server("opuluxe-fashion-trends")
 
-# Fashion trends database (simulated - in production, fetch from APIs/web scraping)
-FASHION_TRENDS = {
-    "men": {
-        "current": [
-            "Oversized blazers with structured shoulders",
-            "Wide-leg trousers in neutral tones",
-            "Chunky sneakers with retro designs",
-            "Minimalist leather accessories",
-            "Earth-tone color palette (beige, brown, olive)"
-        ],
-        "seasonal": "Spring 2026: Lightweight linen shirts, pastel colors, loafers",
-        "celebrity": "Inspired by: Ryan Gosling's tailored casual look"
-    },
-    "women": {
-        "current": [
-            "Maxi skirts with bold prints",
-            "Cropped blazers paired with high-waisted pants",
-            "Platform sandals and chunky heels",
-            "Statement jewelry (layered necklaces, oversized earrings)",
-            "Monochrome outfits in vibrant colors"
-        ],
-        "seasonal": "Spring 2026: Floral dresses, pastel blazers, strappy sandals",
-        "celebrity": "Inspired by: Zendaya's elegant street style"
-    },
-    "accessories": {
-        "current": [
-            "Mini shoulder bags with chain straps",
-            "Oversized sunglasses with geometric frames",
-            "Leather belts with statement buckles",
-            "Smartwatches with interchangeable bands",
-            "Crossbody bags in bold colors"
-        ],
-        "seasonal": "Spring 2026: Straw bags, colorful scarves, minimalist watches"
-    }
-}
+# Trend data lives in data/fashion_trends.json (or TREND_DATA_PATH) and is
+# reloaded when the file changes; responses are pre-serialized per version
+trend_store = TrendStore()
 
-STYLE_TIPS = {
-    "office": "Smart casual is trending - pair tailored blazers with dark jeans and loafers",
-    "casual": "Athleisure meets streetwear - joggers with oversized hoodies and chunky sneakers",
-    "formal": "Modern formal - slim-fit suits in navy or charcoal with minimal accessories",
-    "party": "Statement pieces - sequined tops, leather pants, or bold printed dresses",
-    "wedding": "Traditional with a twist - classic silhouettes in contemporary colors"
+IF_NONE_MATCH_SCHEMA = {
+    "type": "string",
+    "description": "ETag from a previous call; an unchanged payload is answered with not_modified"
 }
 
 @app.list_tools()
 async def list_tools() -> list[Tool]:
     """List available MCP tools"""
+    snapshot = trend_store.snapshot()
+    categories = list(snapshot.categories)
     return [
         Tool(
             name="get_fashion_trends",
-            description="Get current fashion trends for a specific category (men/women/accessories)",
+            description="Get current fashion trends for a specific category, optionally for a region",
             inputSchema={
                 "type": "object",
                 "properties": {
                     "category": {
                         "type": "string",
                         "description": "Fashion category",
-                        "enum": ["men", "women", "accessories", "all"]
-                    }
+                        "enum": categories + ["all"]
+                    },
+                    "region": {
+                        "type": "string",
+                        "description": "Region with local trends (global trends when omitted)",
+                        "enum": snapshot.regions
+                    },
+                    "if_none_match": IF_NONE_MATCH_SCHEMA
                 },
                 "required": ["category"]
             }
@@ -84,8 +63,9 @@ async def list_tools() -> list[Tool]:
                     "occasion": {
                         "type": "string",
                         "description": "Occasion type",
-                        "enum": ["office", "casual", "formal", "party", "wedding"]
-                    }
+                        "enum": list(snapshot.style_tips)
+                    },
+                    "if_none_match": IF_NONE_MATCH_SCHEMA
                 },
                 "required": ["occasion"]
             }
@@ -99,66 +79,63 @@ async def list_tools() -> list[Tool]:
                     "category": {
                         "type": "string",
                         "description": "Fashion category",
-                        "enum": ["men", "women", "accessories"]
-                    }
+                        "enum": categories
+                    },
+                    "season": {
+                        "type": "string",
+                        "description": "Season (the dataset's default season when omitted)",
+                        "enum": snapshot.seasons
+                    },
+                    "if_none_match": IF_NONE_MATCH_SCHEMA
                 },
                 "required": ["category"]
             }
         )
     ]
 
-@app.call_tool()
-async def call_tool(name: str, arguments: dict) -> list[TextContent]:
-    """Handle MCP tool calls"""
-    
-    if name == "get_fashion_trends":
-        category = arguments.get("category", "all")
-        
-        if category == "all":
-            trends_data = {
-                "men": FASHION_TRENDS["men"]["current"],
-                "women": FASHION_TRENDS["women"]["current"],
-                "accessories": FASHION_TRENDS["accessories"]["current"],
-                "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-        else:
-            trends_data = {
-                "category": category,
-                "trends": FASHION_TRENDS.get(category, {}).get("current", []),
-                "celebrity_inspiration": FASHION_TRENDS.get(category, {}).get("celebrity", ""),
-                "updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-        
-        return [TextContent(
-            type="text",
-            text=json.dumps(trends_data, indent=2)
-        )]
-    
-    elif name == "get_style_tips":
-        occasion = arguments.get("occasion")
-        tip = STYLE_TIPS.get(occasion, "No specific tips available for this occasion")
-        
-        return [TextContent(
-            type="text",
-            text=f"Style tip for {occasion}: {tip}"
-        )]
-    
-    elif name == "get_seasonal_recommendations":
-        category = arguments.get("category")
-        seasonal = FASHION_TRENDS.get(category, {}).get("seasonal", "No seasonal data available")
-        
-        return [TextContent(
-            type="text",
-            text=f"Seasonal recommendations for {category}: {seasonal}"
-        )]
-    
-    return [TextContent(
-        type="text",
-        text="Unknown tool"
-    )]
+# Enums change with the data file, and the SDK validates against the tool
+# list it cached at the last list_tools; unknown values get a "no data" reply
+@app.call_tool(validate_input=False)
+async def call_tool(name: str, arguments: dict) -> CallToolResult | list[TextContent]:
+    """Handle MCP tool calls with pre-serialized, ETag-versioned responses"""
+    found = trend_store.lookup(name, arguments)
+    if found is None:
+        return [TextContent(type="text", text="Unknown tool")]
+
+    text, etag, version = found
+    meta = {"etag": etag, "version": version}
+    if arguments and arguments.get("if_none_match") == etag:
+        trend_store.stats["not_modified"] += 1
+        return CallToolResult(content=[], _meta=dict(meta, not_modified=True))
+    return CallToolResult(content=[TextContent(type="text", text=text)], _meta=meta)
+
+def create_http_app():
+    """
+    ASGI app serving the MCP server over streamable HTTP at /mcp.
+
+    Stateless with plain JSON responses: every request is self-contained, so
+    one server (or several uvicorn workers behind one port) can serve all
+    Django workers, and each worker keeps its connections alive.
+    """
+    from contextlib import asynccontextmanager
+    from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+    from starlette.applications import Starlette
+    from starlette.routing import Mount
+
+    session_manager = StreamableHTTPSessionManager(app=app, stateless=True, json_response=True)
+
+    async def handle_mcp(scope, receive, send):
+        await session_manager.handle_request(scope, receive, send)
+
+    @asynccontextmanager
+    async def lifespan(starlette_app):
+        async with session_manager.run():
+            yield
+
+    return Starlette(routes=[Mount("/mcp", app=handle_mcp)], lifespan=lifespan)
 
 async def main():
-    """Run the MCP server"""
+    """Run the MCP server over stdio"""
     from mcp.server.stdio import stdio_server
     
     async with stdio_server() as (read_stream, write_stream):
@@ -168,9 +145,30 @@ async def main():
             app.create_initialization_options()
         )
 
+def run_http(host, port, workers):
+    """Run the MCP server over streamable HTTP with uvicorn"""
+    import uvicorn
+
+    print(f"🌐 Serving streamable HTTP on http://{host}:{port}/mcp/ ({workers} worker(s))", file=sys.stderr)
+    # Workers import the app factory by name, so this directory must be importable
+    uvicorn.run("fashion_trends_server:create_http_app", factory=True, host=host, port=port,
+                workers=workers, app_dir=os.path.dirname(os.path.abspath(__file__)), log_level="warning",
+                http="http_protocol:NoDelayHTTPProtocol")
+
 if __name__ == "__main__":
-    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Opuluxe Fashion Trends MCP Server")
+    parser.add_argument("--transport", choices=["stdio", "http"], default="stdio")
+    parser.add_argument("--host", default=os.getenv("MCP_HTTP_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MCP_HTTP_PORT", "8765")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("MCP_HTTP_WORKERS", "1")))
+    args = parser.parse_args()
+
     # Write logs to stderr so they don't interfere with MCP communication on stdout
     print("🎨 Opuluxe Fashion Trends MCP Server starting...", file=sys.stderr)
     print("📊 Providing real-time fashion intelligence via Model Context Protocol", file=sys.stderr)
-    asyncio.run(main())
+    if args.transport == "http":
+        run_http(args.host, args.port, args.workers)
+    else:
+        asyncio.run(main())
@@ -0,0 +1,27 @@
+"""
+HTTP protocol for the Fashion Trends MCP Server's uvicorn workers
+"""
+
+import socket
+
+from uvicorn.protocols.http.auto import AutoHTTPProtocol
+
+
+class NoDelayHTTPProtocol(AutoHTTPProtocol):
+    """
+    uvicorn's HTTP protocol with TCP_NODELAY on every connection.
+
+    With --workers > 1, uvicorn binds the listening socket itself, and
+    asyncio then skips its usual TCP_NODELAY on accepted connections. Small
+    JSON-RPC responses would wait on the client's delayed ACK (~40 ms per
+    call on keep-alive connections).
+    """
+
+    def connection_made(self, transport):
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except OSError:
+                pass  # Not a TCP socket (e.g. --uds)
+        super().connection_made(transport)
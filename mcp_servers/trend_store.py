@@ -0,0 +1,206 @@
+"""
+Trend store for the Fashion Trends MCP Server
+Loads trend data from a JSON file, pre-serializes every tool response and
+reloads when the file changes, without restarting the server
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+DEFAULT_TREND_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'fashion_trends.json')
+# JSON file with categories, seasons, regions and style tips
+TREND_DATA_PATH = os.getenv("TREND_DATA_PATH", DEFAULT_TREND_DATA)
+# Minimum seconds between checks of the data file for changes
+TREND_RELOAD_INTERVAL = float(os.getenv("TREND_RELOAD_INTERVAL", "2"))
+
+
+def _log(message):
+    # stdout carries the MCP stdio protocol
+    print(f"[Trend Store] {message}", file=sys.stderr)
+
+
+def response_key(tool, arguments):
+    """Canonical lookup key for a tool call; empty and control arguments are ignored."""
+    args = {k: v for k, v in (arguments or {}).items() if v not in (None, "") and k != "if_none_match"}
+    return tool + json.dumps(args, sort_keys=True, separators=(',', ':'))
+
+
+def _etag(text):
+    # Content-derived, so a payload keeps its ETag across reloads and server processes
+    return '"' + hashlib.sha256(text.encode('utf-8')).hexdigest()[:20] + '"'
+
+
+class TrendSnapshot:
+    """
+    One loaded version of the trend data with every tool response
+    pre-serialized. Immutable once built; reloads swap in a new snapshot.
+    """
+
+    def __init__(self, data, version):
+        self.version = version
+        self.updated = data.get("updated", "")
+        self.categories = data.get("categories", {})
+        self.style_tips = data.get("style_tips", {})
+        self.default_season = data.get("default_season")
+        self.seasons = sorted({s for c in self.categories.values() for s in c.get("seasons", {})})
+        self.regions = sorted({r for c in self.categories.values() for r in c.get("regions", {})})
+        self.responses = {}
+        self._build()
+
+    def _add(self, tool, arguments, text):
+        self.responses[response_key(tool, arguments)] = (text, _etag(text))
+
+    def _build(self):
+        for region in [None] + self.regions:
+            self._add("get_fashion_trends", {"category": "all", "region": region},
+                      self._serialize(self.all_trends(region)))
+            for category in self.categories:
+                self._add("get_fashion_trends", {"category": category, "region": region},
+                          self._serialize(self.category_trends(category, region)))
+
+        for occasion in self.style_tips:
+            self._add("get_style_tips", {"occasion": occasion}, self.style_tip(occasion))
+
+        for category in self.categories:
+            for season in [None] + self.seasons:
+                self._add("get_seasonal_recommendations", {"category": category, "season": season},
+                          self.seasonal(category, season))
+
+    @staticmethod
+    def _serialize(payload):
+        return json.dumps(payload, separators=(',', ':'))
+
+    def _current(self, category, region):
+        entry = self.categories.get(category, {})
+        regional = entry.get("regions", {}).get(region, {}) if region else {}
+        # Regions only override what they define; the rest is global
+        return regional.get("current") or entry.get("current", [])
+
+    def all_trends(self, region=None):
+        payload = {category: self._current(category, region) for category in self.categories}
+        if region:
+            payload["region"] = region
+        payload["updated"] = self.updated
+        return payload
+
+    def category_trends(self, category, region=None):
+        payload = {
+            "category": category,
+            "trends": self._current(category, region),
+            "celebrity_inspiration": self.categories.get(category, {}).get("celebrity", ""),
+            "updated": self.updated,
+        }
+        if region:
+            payload["region"] = region
+        return payload
+
+    def style_tip(self, occasion):
+        tip = self.style_tips.get(occasion, "No specific tips available for this occasion")
+        return f"Style tip for {occasion}: {tip}"
+
+    def seasonal(self, category, season=None):
+        seasons = self.categories.get(category, {}).get("seasons", {})
+        text = seasons.get(season or self.default_season, "No seasonal data available")
+        return f"Seasonal recommendations for {category}: {text}"
+
+    def render(self, tool, arguments):
+        """Build a response that was not precomputed (unknown category, occasion, ...)."""
+        arguments = arguments or {}
+        if tool == "get_fashion_trends":
+            category = arguments.get("category", "all")
+            if category == "all":
+                return self._serialize(self.all_trends(arguments.get("region")))
+            return self._serialize(self.category_trends(category, arguments.get("region")))
+        if tool == "get_style_tips":
+            return self.style_tip(arguments.get("occasion"))
+        if tool == "get_seasonal_recommendations":
+            return self.seasonal(arguments.get("category"), arguments.get("season"))
+        return None
+
+
+class TrendStore:
+    """
+    Hot-reloadable trend data.
+
+    The data file is checked at most every reload_interval seconds when the
+    store is read; a changed file is parsed and pre-serialized into a new
+    snapshot. A file that fails to load leaves the previous snapshot in
+    place.
+    """
+
+    def __init__(self, path=TREND_DATA_PATH, reload_interval=TREND_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._snapshot = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"reloads": 0, "reload_errors": 0, "hits": 0, "misses": 0, "not_modified": 0}
+        self.snapshot()
+
+    def snapshot(self):
+        """Current snapshot, reloading first if the data file changed."""
+        if time.monotonic() - self._checked_at >= self.reload_interval or self._snapshot is None:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.reload_interval or self._snapshot is None:
+                    self._checked_at = time.monotonic()
+                    self._maybe_reload()
+        return self._snapshot
+
+    def _maybe_reload(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            if self._snapshot is None:
+                _log(f"Cannot read {self.path}: {e}")
+                self._snapshot = TrendSnapshot({}, "empty")
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                raw = f.read()
+            snapshot = TrendSnapshot(json.loads(raw), hashlib.sha256(raw).hexdigest()[:12])
+        except (OSError, ValueError, AttributeError) as e:
+            self.stats["reload_errors"] += 1
+            # Retried once the file changes again
+            self._signature = signature
+            _log(f"Failed to load {self.path}, keeping version "
+                 f"{self._snapshot.version if self._snapshot else 'none'}: {e}")
+            if self._snapshot is None:
+                self._snapshot = TrendSnapshot({}, "empty")
+            return
+        self._signature = signature
+        if self._snapshot is not None:
+            self.stats["reloads"] += 1
+            _log(f"Reloaded trend data: version {self._snapshot.version} -> {snapshot.version}")
+        self._snapshot = snapshot
+
+    def lookup(self, tool, arguments):
+        """
+        Get the serialized response for a tool call.
+
+        Returns:
+            tuple: (text, etag, version), or None for an unknown tool
+        """
+        snapshot = self.snapshot()
+        cached = snapshot.responses.get(response_key(tool, arguments))
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached[0], cached[1], snapshot.version
+        text = snapshot.render(tool, arguments)
+        if text is None:
+            return None
+        self.stats["misses"] += 1
+        return text, _etag(text), snapshot.version
+
+    def get_stats(self):
+        snapshot = self.snapshot()
+        return dict(self.stats, version=snapshot.version, responses=len(snapshot.responses),
+                    categories=len(snapshot.categories), regions=len(snapshot.regions),
+                    seasons=len(snapshot.seasons))